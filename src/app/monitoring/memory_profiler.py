@@ -0,0 +1,275 @@
+"""
+Memory footprint profiling of the filterer, to size the lambda and the
+cache budgets from measurements.
+
+When `MEMORY_PROFILE=1` it records:
+    - the RSS growth of every import and init step (LLM and Pinecone
+      clients, graphs...), through the startup profiler checkpoints,
+    - the RSS and allocation growth of the components measured with
+      `memory_profiler.measure(...)` (e.g. the langid model),
+    - the peak allocation of every request stage (span): candidate lists,
+      S3 payloads, rerank prompts...,
+    - the size of every registered cache (`register_cache`).
+
+The report is logged after the startup and written to `MEMORY_PROFILE_OUTPUT`
+(JSON) after every request. With `MEMORY_PROFILE_SNAPSHOT=1` it also holds
+the top allocation sites grown since the startup (tracemalloc snapshot diff).
+
+Stage peaks come from the global tracemalloc peak, so they are exact when
+the requests run one at a time (the profiling setup) and overlap otherwise.
+
+Env vars:
+    MEMORY_PROFILE: `1` to enable.
+    MEMORY_PROFILE_OUTPUT: Report file.
+    MEMORY_PROFILE_FRAMES: Frames kept per allocation (default 1).
+    MEMORY_PROFILE_SNAPSHOT: `1` to add the snapshot diff to the report.
+"""
+import os
+import sys
+import json
+import time
+import types
+import logging
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Callable
+
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def rss_bytes() -> int:
+    """Current resident set size (the peak one where /proc is not available)."""
+    try:
+        with open("/proc/self/statm", "r") as file:
+            return int(file.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def peak_rss_bytes() -> int:
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+_SKIPPED_TYPES = (types.ModuleType, types.FunctionType, types.MethodType, types.BuiltinFunctionType, type,
+                  threading.Thread)
+
+
+def deep_sizeof(obj: Any, max_objects: int = 1_000_000) -> int:
+    """
+    Approximate size of an object and everything it holds (containers and
+    instance attributes; modules, functions, classes and threads excluded).
+    Memory-mapped files are not counted, they are in the page cache.
+    """
+    seen = set()
+    total = 0
+    pending = [obj]
+    while pending and len(seen) < max_objects:
+        current = pending.pop()
+        if id(current) in seen or isinstance(current, _SKIPPED_TYPES):
+            continue
+        seen.add(id(current))
+        total += sys.getsizeof(current, 0)
+        if isinstance(current, dict):
+            pending.extend(current.keys())
+            pending.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset)):
+            pending.extend(current)
+        elif hasattr(current, "__dict__"):
+            pending.append(vars(current))
+        elif hasattr(current, "__slots__"):
+            pending.extend(getattr(current, slot) for slot in current.__slots__ if hasattr(current, slot))
+    return total
+
+
+class MemoryProfiler:
+    """Collects the memory checkpoints, see module docstring."""
+
+    def __init__(self, enabled: bool = False, frames: int = 1, snapshot: bool = False,
+                 output_path: Optional[str] = None) -> None:
+        self.enabled = enabled
+        self.frames = frames
+        self.snapshot = snapshot
+        self.output_path = output_path
+        self.checkpoints: List[Dict[str, Any]] = []
+        self.components: List[Dict[str, Any]] = []
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self.caches: Dict[str, Callable[[], Any]] = {}
+        self._open_checkpoints: Dict[str, List[int]] = {}
+        self._open_spans: Dict[str, Dict[str, int]] = {}
+        self._baseline = None
+        self._lock = threading.Lock()
+        self._startup_report = None
+
+    @classmethod
+    def from_env(cls) -> "MemoryProfiler":
+        return cls(
+            enabled=os.getenv("MEMORY_PROFILE") == "1",
+            frames=int(os.getenv("MEMORY_PROFILE_FRAMES", "1")),
+            snapshot=os.getenv("MEMORY_PROFILE_SNAPSHOT") == "1",
+            output_path=os.getenv("MEMORY_PROFILE_OUTPUT"),
+        )
+
+    def install(self, startup_profiler) -> None:
+        """
+        Start tracing allocations and hook into the startup checkpoints and
+        the request spans. Must run before the imports to profile.
+        """
+        if not self.enabled or self._baseline is not None:
+            return
+        from src.app.monitoring.tracing import span_hooks, trace_exporter
+
+        tracemalloc.start(self.frames)
+        self._baseline = tracemalloc.take_snapshot() if self.snapshot else True
+        # The checkpoints are only emitted by an enabled startup profiler
+        startup_profiler.enabled = True
+        startup_profiler.checkpoint_hooks.append(self._on_checkpoint)
+        span_hooks.append(self._on_span)
+        trace_exporter.listeners.append(lambda trace: self.write_report())
+
+    # -------------------------------------------------------------------------
+    # Startup: imports, init steps and components
+    # -------------------------------------------------------------------------
+    def _on_checkpoint(self, name: str, record: Optional[Dict[str, Any]]) -> None:
+        if record is None:
+            self._open_checkpoints.setdefault(name, []).append(rss_bytes())
+            return
+        starts = self._open_checkpoints.get(name)
+        if not starts:
+            return
+        growth = rss_bytes() - starts.pop()
+        # Nested imports are part of their parent, only the top level ones are kept
+        if name.startswith("init:") or record.get("depth", 0) == 0:
+            self.checkpoints.append({"name": name, "rss_growth_mb": round(growth / MB, 3)})
+
+    @contextmanager
+    def measure(self, name: str):
+        """Record the RSS and allocation growth of building a component."""
+        if not self.enabled:
+            yield
+            return
+        rss_before = rss_bytes()
+        allocated_before = tracemalloc.get_traced_memory()[0]
+        try:
+            yield
+        finally:
+            self.components.append({
+                "name": name,
+                "rss_growth_mb": round((rss_bytes() - rss_before) / MB, 3),
+                "allocated_mb": round((tracemalloc.get_traced_memory()[0] - allocated_before) / MB, 3),
+            })
+
+    def register_cache(self, name: str, size: Callable[[], Any]) -> None:
+        """
+        Report the size of a cache. `size` returns its size in bytes, or the
+        cache object itself (measured with `deep_sizeof`).
+        """
+        self.caches[name] = size
+
+    # -------------------------------------------------------------------------
+    # Requests: peak allocation per stage
+    # -------------------------------------------------------------------------
+    def _on_span(self, span, finished: bool) -> None:
+        with self._lock:
+            current, peak = tracemalloc.get_traced_memory()
+            # The peak is global: fold it into every open stage before resetting it
+            for state in self._open_spans.values():
+                state["peak"] = max(state["peak"], peak)
+            if not finished:
+                tracemalloc.reset_peak()
+                self._open_spans[span.span_id] = {"start": current, "peak": current}
+                return
+            state = self._open_spans.pop(span.span_id, None)
+        if state is None:
+            return
+        peak_growth = state["peak"] - state["start"]
+        span.set(peak_alloc_kb=round(peak_growth / 1024, 1))
+        with self._lock:
+            stage = self.stages.setdefault(span.name, {"count": 0, "max_peak_mb": 0.0, "mean_peak_mb": 0.0})
+            stage["count"] += 1
+            stage["max_peak_mb"] = max(stage["max_peak_mb"], round(peak_growth / MB, 3))
+            stage["mean_peak_mb"] = round(stage["mean_peak_mb"] + (peak_growth / MB - stage["mean_peak_mb"]) / stage["count"], 3)
+
+    # -------------------------------------------------------------------------
+    # Report
+    # -------------------------------------------------------------------------
+    def cache_sizes(self) -> Dict[str, float]:
+        sizes = {}
+        for name, size in self.caches.items():
+            try:
+                value = size()
+                sizes[name] = round((value if isinstance(value, int) else deep_sizeof(value)) / MB, 3)
+            except Exception as e:
+                logger.warning(f"Could not measure the cache {name}: {e}")
+        return sizes
+
+    def snapshot_diff(self, top_n: int = 25) -> List[Dict[str, Any]]:
+        """Allocation sites grown the most since `install`."""
+        if not isinstance(self._baseline, tracemalloc.Snapshot):
+            return []
+        diff = tracemalloc.take_snapshot().compare_to(self._baseline, "lineno")
+        return [
+            {"site": str(stat.traceback), "size_diff_kb": round(stat.size_diff / 1024, 1), "count_diff": stat.count_diff}
+            for stat in diff[:top_n]
+        ]
+
+    def report(self, top_n: int = 25) -> Dict[str, Any]:
+        current, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+        report = {
+            "created_at": round(time.time(), 3),
+            "rss_mb": round(rss_bytes() / MB, 1),
+            "peak_rss_mb": round(peak_rss_bytes() / MB, 1),
+            "traced_mb": round(current / MB, 1),
+            "largest_imports": sorted((c for c in self.checkpoints if c["name"].startswith("import:")),
+                                      key=lambda c: c["rss_growth_mb"], reverse=True)[:top_n],
+            "init_steps": [c for c in self.checkpoints if c["name"].startswith("init:")],
+            "components": self.components,
+            "stages": dict(sorted(self.stages.items(), key=lambda item: -item[1]["max_peak_mb"])),
+            "caches_mb": self.cache_sizes(),
+        }
+        if self.snapshot:
+            report["snapshot_diff"] = self.snapshot_diff(top_n)
+        return report
+
+    def finish_startup(self, logger=None) -> Optional[Dict[str, Any]]:
+        """Log the startup footprint, once."""
+        if not self.enabled or self._startup_report is not None:
+            return self._startup_report
+        report = self._startup_report = self.report()
+        if logger:
+            logger.info(f"Memory profile after startup: RSS {report['rss_mb']} MB (peak {report['peak_rss_mb']} MB)")
+            for record in report["largest_imports"][:10]:
+                logger.info(f"  {record['name']}: +{record['rss_growth_mb']} MB")
+            for record in report["init_steps"]:
+                logger.info(f"  {record['name']}: +{record['rss_growth_mb']} MB")
+        self.write_report(report)
+        return report
+
+    def write_report(self, report: Optional[Dict[str, Any]] = None) -> None:
+        if not self.output_path:
+            return
+        report = report or self.report()
+        with self._lock, open(self.output_path, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+
+
+def recommend_lambda_mb(report: Dict[str, Any], headroom: float = 0.3, cache_budgets_mb: float = 0.0) -> int:
+    """
+    Lambda memory size for a measured report: the peak RSS plus the cache
+    budgets not yet filled, with some headroom, rounded up to 64 MB.
+    """
+    needed = (report["peak_rss_mb"] + max(0.0, cache_budgets_mb - sum(report["caches_mb"].values()))) * (1 + headroom)
+    return max(128, int(-(-needed // 64) * 64))
+
+
+memory_profiler = MemoryProfiler.from_env()
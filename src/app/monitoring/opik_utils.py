@@ -1,10 +1,6 @@
 import logging
 import os
 
-import opik
-from opik import Opik
-from opik.configurator.configure import OpikConfigurator
-
 from src.settings import Settings
 
 settings = Settings()
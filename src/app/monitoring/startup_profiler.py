@@ -0,0 +1,143 @@
+"""
+Startup profiler for the cold start of the lambda.
+
+When `STARTUP_PROFILE=1`, every import executed after `install()` and every
+initialization step wrapped in `startup_profiler.step(...)` is timed, so the
+cold start can be broken down per module and per resource. The report is
+logged and, if `STARTUP_PROFILE_OUTPUT` is set, written there as JSON.
+"""
+import os
+import sys
+import json
+import time
+import builtins
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional
+
+
+class StartupProfiler:
+    """
+    Collects import and init timings. Import times are measured by wrapping
+    `builtins.__import__`, the same way `python -X importtime` reports them:
+    `cumulative_ms` includes nested imports and `self_ms` excludes them.
+    """
+
+    def __init__(self, enabled: bool = False) -> None:
+        self.enabled = enabled
+        self.started_at = time.perf_counter()
+        self.imports: List[Dict[str, Any]] = []
+        self.steps: List[Dict[str, Any]] = []
+        # Called with (name, None) when an import / step starts and (name, record) when it ends
+        self.checkpoint_hooks = []
+        self._original_import = None
+        self._stack = threading.local()
+        self._report = None
+
+    # -------------------------------------------------------------------------
+    # Imports
+    # -------------------------------------------------------------------------
+    def install(self) -> None:
+        """Start timing imports. No-op when the profiler is disabled."""
+        if not self.enabled or self._original_import is not None:
+            return
+        self._original_import = builtins.__import__
+        builtins.__import__ = self._timed_import
+
+    def uninstall(self) -> None:
+        if self._original_import is not None:
+            builtins.__import__ = self._original_import
+            self._original_import = None
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        # Relative or already loaded modules are not worth timing
+        if level or name in sys.modules:
+            return self._original_import(name, globals, locals, fromlist, level)
+
+        stack = getattr(self._stack, "frames", None)
+        if stack is None:
+            stack = self._stack.frames = []
+
+        frame = {"module": name, "children_ms": 0.0}
+        stack.append(frame)
+        for hook in self.checkpoint_hooks:
+            hook(f"import:{name}", None)
+        start = time.perf_counter()
+        try:
+            return self._original_import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            stack.pop()
+            if stack:
+                stack[-1]["children_ms"] += elapsed_ms
+            record = {
+                "module": name,
+                "cumulative_ms": round(elapsed_ms, 3),
+                "self_ms": round(elapsed_ms - frame["children_ms"], 3),
+                "depth": len(stack),
+            }
+            for hook in self.checkpoint_hooks:
+                hook(f"import:{name}", record)
+            self.imports.append(record)
+
+    # -------------------------------------------------------------------------
+    # Init steps
+    # -------------------------------------------------------------------------
+    @contextmanager
+    def step(self, name: str):
+        """Time an initialization step (e.g. building a client)."""
+        if not self.enabled:
+            yield
+            return
+        for hook in self.checkpoint_hooks:
+            hook(f"init:{name}", None)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            record = {"step": name, "duration_ms": round((time.perf_counter() - start) * 1000, 3)}
+            for hook in self.checkpoint_hooks:
+                hook(f"init:{name}", record)
+            self.steps.append(record)
+
+    # -------------------------------------------------------------------------
+    # Report
+    # -------------------------------------------------------------------------
+    def report(self, top_n: int = 25) -> Dict[str, Any]:
+        """
+        Build the startup report.
+
+        Returns:
+            dict: Total elapsed time, the `top_n` slowest top-level imports and
+            every init step in execution order.
+        """
+        top_level = [record for record in self.imports if record["depth"] == 0]
+        return {
+            "total_ms": round((time.perf_counter() - self.started_at) * 1000, 3),
+            "imports_ms": round(sum(record["cumulative_ms"] for record in top_level), 3),
+            "slowest_imports": sorted(top_level, key=lambda r: r["cumulative_ms"], reverse=True)[:top_n],
+            "slowest_modules_self": sorted(self.imports, key=lambda r: r["self_ms"], reverse=True)[:top_n],
+            "init_steps": self.steps,
+        }
+
+    def finish(self, logger=None) -> Optional[Dict[str, Any]]:
+        """Stop timing imports, log the report and dump it if requested."""
+        if not self.enabled or self._report is not None:
+            return self._report
+        self.uninstall()
+        report = self._report = self.report()
+        if logger:
+            logger.info(f"Startup profile: total {report['total_ms']} ms, imports {report['imports_ms']} ms")
+            for record in report["slowest_imports"]:
+                logger.info(f"  import {record['module']}: {record['cumulative_ms']} ms")
+            for record in report["init_steps"]:
+                logger.info(f"  init {record['step']}: {record['duration_ms']} ms")
+
+        output_path = os.getenv("STARTUP_PROFILE_OUTPUT")
+        if output_path:
+            with open(output_path, "w", encoding="utf-8") as file:
+                json.dump(report, file, indent=2)
+        return report
+
+
+startup_profiler = StartupProfiler(enabled=os.getenv("STARTUP_PROFILE") == "1")
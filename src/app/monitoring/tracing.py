@@ -0,0 +1,430 @@
+"""
+Structured per-request tracing for the filterer pipeline.
+
+A `RequestTrace` is opened once per request (`start_trace`) and every stage
+of the pipeline opens a `span` inside it. Spans are linked to their parent
+through a context variable, so nested stages (a retrieval inside the filter
+extraction graph, a rerank chunk inside the rerank, ...) build a tree even
+across threads and asyncio tasks. Each span carries attributes such as
+candidate counts or payload bytes.
+
+When the trace is finished:
+    - the duration of every stage is recorded in in-process latency
+      histograms (p50/p95/p99),
+    - the trace and its critical path are exported as a JSON line or as
+      CloudWatch Embedded Metric Format (`TRACE_EXPORT=jsonl|emf|off`).
+"""
+import os
+import json
+import math
+import time
+import uuid
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import wraps
+from typing import Dict, Any, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+# =============================================================================
+# Spans and traces
+# =============================================================================
+@dataclass
+class Span:
+    """A single timed stage of a request."""
+    name: str
+    span_id: str
+    parent_id: Optional[str]
+    start: float
+    end: Optional[float] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end if self.end is not None else time.perf_counter()
+        return (end - self.start) * 1000
+
+    def set(self, **attributes) -> None:
+        """Attach attributes (sizes, counts, flags...) to the span."""
+        self.attributes.update(attributes)
+
+    def to_dict(self, origin: float) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ms": round((self.start - origin) * 1000, 3),
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class _NoopSpan:
+    """Returned when there is no active trace, so callers never need to check."""
+    name = None
+    span_id = None
+    attributes: Dict[str, Any] = {}
+
+    def set(self, **attributes) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class RequestTrace:
+    """All the spans of one request, plus the analysis over them."""
+
+    def __init__(self, name: str, **attributes) -> None:
+        self.trace_id = uuid.uuid4().hex
+        self._lock = threading.Lock()
+        self.spans: List[Span] = []
+        self.root = self._new_span(name, parent_id=None, attributes=attributes)
+
+    def _new_span(self, name: str, parent_id: Optional[str], attributes: Dict[str, Any]) -> Span:
+        new_span = Span(
+            name=name,
+            span_id=uuid.uuid4().hex[:16],
+            parent_id=parent_id,
+            start=time.perf_counter(),
+            attributes=dict(attributes),
+        )
+        with self._lock:
+            self.spans.append(new_span)
+        return new_span
+
+    def children(self) -> Dict[str, List[Span]]:
+        children: Dict[str, List[Span]] = {}
+        for child in self.spans:
+            if child.parent_id is not None:
+                children.setdefault(child.parent_id, []).append(child)
+        return children
+
+    def critical_path(self) -> List[Dict[str, Any]]:
+        """
+        Compute the critical path of the request: walking back from the end
+        of each span, the chain of children that finished last and therefore
+        determined when their parent could finish. Each entry reports the
+        exclusive time the stage contributed to the total latency.
+
+        Returns:
+            list: `[{"name", "duration_ms", "exclusive_ms"}]` from root to leaves.
+        """
+        children = self.children()
+        path = []
+
+        def _walk(current: Span):
+            cursor = current.end if current.end is not None else time.perf_counter()
+            critical_children = []
+            for child in sorted(children.get(current.span_id, []), key=lambda s: s.end or cursor, reverse=True):
+                child_end = child.end if child.end is not None else cursor
+                if child_end <= cursor + 1e-6:
+                    critical_children.append(child)
+                    cursor = child.start
+            exclusive_ms = current.duration_ms - sum(c.duration_ms for c in critical_children)
+            path.append({
+                "name": current.name,
+                "duration_ms": round(current.duration_ms, 3),
+                "exclusive_ms": round(max(exclusive_ms, 0.0), 3),
+            })
+            for child in reversed(critical_children):
+                _walk(child)
+
+        _walk(self.root)
+        return path
+
+    def dominant_stage(self) -> Optional[Dict[str, Any]]:
+        """Stage of the critical path that contributed the most exclusive time."""
+        path = self.critical_path()
+        return max(path, key=lambda entry: entry["exclusive_ms"]) if path else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        origin = self.root.start
+        return {
+            "trace_id": self.trace_id,
+            "name": self.root.name,
+            "duration_ms": round(self.root.duration_ms, 3),
+            "dominant_stage": self.dominant_stage(),
+            "critical_path": self.critical_path(),
+            "spans": [s.to_dict(origin) for s in self.spans],
+        }
+
+
+_current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("current_trace", default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+
+def current_span():
+    """Active span, or a no-op span when tracing is not active."""
+    return _current_span.get() or NOOP_SPAN
+
+
+def annotate_request(**attributes) -> None:
+    """Attach attributes to the root span of the current request, if any."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.root.set(**attributes)
+
+
+# Called with (span, False) when a span starts and (span, True) when it ends (e.g. the memory profiler)
+span_hooks = []
+
+
+@contextmanager
+def start_trace(name: str = "request", **attributes):
+    """
+    Open a new trace for a request. On exit the trace is finished, recorded
+    in the histograms and exported.
+    """
+    trace = RequestTrace(name, **attributes)
+    trace_token = _current_trace.set(trace)
+    span_token = _current_span.set(trace.root)
+    try:
+        yield trace
+    except BaseException as e:
+        trace.root.error = repr(e)
+        raise
+    finally:
+        trace.root.end = time.perf_counter()
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+        trace_exporter.export(trace)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Time a stage of the current request as a child of the active span.
+    Outside of a trace it does nothing and yields a no-op span.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield NOOP_SPAN
+        return
+
+    parent = _current_span.get()
+    new_span = trace._new_span(name, parent_id=parent.span_id if parent else trace.root.span_id, attributes=attributes)
+    token = _current_span.set(new_span)
+    for hook in span_hooks:
+        hook(new_span, False)
+    try:
+        yield new_span
+    except BaseException as e:
+        new_span.error = repr(e)
+        raise
+    finally:
+        new_span.end = time.perf_counter()
+        for hook in span_hooks:
+            hook(new_span, True)
+        _current_span.reset(token)
+
+
+def traced(name: Optional[str] = None, **attributes):
+    """
+    Decorator version of `span`, for both sync and async functions.
+
+    Example:
+    >>> @traced("call_pinecone")
+    ... def call_pinecone(ids, query): ...
+    """
+    def decorator(func):
+        span_name = name or func.__name__
+
+        if asyncio.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name, **attributes):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name, **attributes):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# =============================================================================
+# Latency histograms
+# =============================================================================
+class LatencyHistogram:
+    """
+    Log-bucketed latency histogram with bounded memory. Each bucket covers a
+    `growth` relative range (5% by default), which is also the worst-case
+    error of the reported percentiles.
+    """
+
+    def __init__(self, growth: float = 1.05, min_ms: float = 0.01) -> None:
+        self.growth = growth
+        self.min_ms = min_ms
+        self._log_growth = math.log(growth)
+        self.buckets: Dict[int, int] = {}
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, value_ms: float) -> None:
+        index = int(math.log(max(value_ms, self.min_ms) / self.min_ms) / self._log_growth)
+        with self._lock:
+            self.buckets[index] = self.buckets.get(index, 0) + 1
+            self.count += 1
+            self.total_ms += value_ms
+            self.max_ms = max(self.max_ms, value_ms)
+
+    def percentile(self, p: float) -> float:
+        """Upper bound of the bucket that contains the p-th percentile."""
+        with self._lock:
+            if not self.count:
+                return 0.0
+            rank = math.ceil(self.count * p / 100)
+            seen = 0
+            for index in sorted(self.buckets):
+                seen += self.buckets[index]
+                if seen >= rank:
+                    return min(self.min_ms * self.growth ** (index + 1), self.max_ms)
+            return self.max_ms
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "p50_ms": round(self.percentile(50), 3),
+            "p95_ms": round(self.percentile(95), 3),
+            "p99_ms": round(self.percentile(99), 3),
+            "max_ms": round(self.max_ms, 3),
+        }
+
+
+class HistogramRegistry:
+    """One latency histogram per stage name."""
+
+    def __init__(self) -> None:
+        self._histograms: Dict[str, LatencyHistogram] = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, value_ms: float) -> None:
+        with self._lock:
+            histogram = self._histograms.setdefault(stage, LatencyHistogram())
+        histogram.record(value_ms)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            items = list(self._histograms.items())
+        return {stage: histogram.summary() for stage, histogram in sorted(items)}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+
+    def to_json_lines(self) -> List[str]:
+        return [json.dumps({"stage": stage, **stats}) for stage, stats in self.summary().items()]
+
+    def to_emf(self, namespace: str = "GMA/Filterer", service: str = "filterer") -> List[str]:
+        """
+        One CloudWatch Embedded Metric Format document per stage, with the
+        percentiles as metrics and the stage name as dimension.
+        """
+        documents = []
+        timestamp = int(time.time() * 1000)
+        for stage, stats in self.summary().items():
+            documents.append(json.dumps({
+                "_aws": {
+                    "Timestamp": timestamp,
+                    "CloudWatchMetrics": [{
+                        "Namespace": namespace,
+                        "Dimensions": [["Service", "Stage"]],
+                        "Metrics": [
+                            {"Name": "LatencyP50", "Unit": "Milliseconds"},
+                            {"Name": "LatencyP95", "Unit": "Milliseconds"},
+                            {"Name": "LatencyP99", "Unit": "Milliseconds"},
+                            {"Name": "Count", "Unit": "Count"},
+                        ],
+                    }],
+                },
+                "Service": service,
+                "Stage": stage,
+                "LatencyP50": stats["p50_ms"],
+                "LatencyP95": stats["p95_ms"],
+                "LatencyP99": stats["p99_ms"],
+                "Count": stats["count"],
+            }))
+        return documents
+
+
+histograms = HistogramRegistry()
+
+
+# =============================================================================
+# Export
+# =============================================================================
+class TraceExporter:
+    """
+    Records finished traces in the histograms and exports them.
+
+    Env vars:
+        TRACE_EXPORT: `jsonl` (default), `emf` or `off`.
+        TRACE_EXPORT_PATH: File to append JSON lines to (the logger otherwise).
+        TRACE_HISTOGRAM_FLUSH_EVERY: Export the histograms every N requests.
+    """
+
+    def __init__(self) -> None:
+        self.mode = os.getenv("TRACE_EXPORT", "jsonl").lower()
+        self.path = os.getenv("TRACE_EXPORT_PATH")
+        self.flush_every = int(os.getenv("TRACE_HISTOGRAM_FLUSH_EVERY", "50"))
+        self._requests = 0
+        self._lock = threading.Lock()
+        self.listeners = []
+
+    def _emit(self, lines: List[str]) -> None:
+        if self.path:
+            with self._lock, open(self.path, "a", encoding="utf-8") as file:
+                file.writelines(line + "\n" for line in lines)
+        else:
+            for line in lines:
+                if self.mode == "emf":
+                    # EMF documents must be printed as-is to be picked up by CloudWatch
+                    print(line)
+                else:
+                    logger.info(line)
+
+    def export(self, trace: RequestTrace) -> None:
+        for finished in trace.spans:
+            histograms.record(finished.name, finished.duration_ms)
+        for listener in self.listeners:
+            listener(trace)
+
+        if self.mode == "off":
+            return
+        if self.mode == "jsonl":
+            self._emit([json.dumps(trace.to_dict(), default=str)])
+        else:
+            logger.info(f"Trace {trace.trace_id}: {round(trace.root.duration_ms, 1)} ms, "
+                        f"dominated by {trace.dominant_stage()}")
+
+        with self._lock:
+            self._requests += 1
+            should_flush = self._requests % self.flush_every == 0
+        if should_flush:
+            self.flush_histograms()
+
+    def flush_histograms(self) -> None:
+        if self.mode == "off":
+            return
+        self._emit(histograms.to_emf() if self.mode == "emf" else histograms.to_json_lines())
+
+
+trace_exporter = TraceExporter()
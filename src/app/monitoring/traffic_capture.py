@@ -0,0 +1,143 @@
+"""
+Capture of production traffic for replay.
+
+Each handled `FilterEvent` is scrubbed (no unknown keys, rounded location,
+no emails / phone numbers in the query) and written as one JSON line, with
+its arrival time, its event class and the observed latency. The lines can
+go to a local file or to the logs (prefixed with `TRAFFIC_CAPTURE`), from
+where they are exported into a replay file for `src.benchmarks.replay`.
+
+Env vars:
+    TRAFFIC_CAPTURE: `off` (default), `log` or `file`.
+    TRAFFIC_CAPTURE_PATH: File used by the `file` mode.
+    TRAFFIC_CAPTURE_SAMPLE_RATE: Fraction of requests captured (default 1.0).
+"""
+import os
+import re
+import json
+import time
+import random
+import logging
+import threading
+from typing import Dict, Any, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+CAPTURE_MARKER = "TRAFFIC_CAPTURE"
+
+_EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+_PHONE_RE = re.compile(r"\+?\d[\d\s().-]{7,}\d")
+
+
+def scrub_query(query: Optional[str]) -> Optional[str]:
+    """Redact emails and phone-like digit sequences from a natural query."""
+    if not query:
+        return query
+    query = _EMAIL_RE.sub("<email>", query)
+    return _PHONE_RE.sub("<phone>", query)
+
+
+def scrub_event(event_data, location_decimals: int = 3) -> Dict[str, Any]:
+    """
+    Build the replayable payload of a parsed `FilterEvent`.
+
+    Args:
+        event_data (FilterEvent): Validated request, unknown keys are already dropped.
+        location_decimals (int): Decimals kept in lat/lng (3 decimals is ~100m).
+
+    Returns:
+        dict: The scrubbed event, valid input for `data_filterer_handler`.
+    """
+    event = event_data.model_dump()
+    filter_data = event["filter_data"]
+    filter_data["natural_query"] = scrub_query(filter_data.get("natural_query"))
+    if filter_data.get("location"):
+        filter_data["location"] = {
+            key: round(value, location_decimals) for key, value in filter_data["location"].items()
+        }
+    return event
+
+
+def classify_event(event: Dict[str, Any], attributes: Optional[Dict[str, Any]] = None) -> Dict[str, str]:
+    """
+    Event class used to break down replay results: city vs. around search,
+    English vs. translated query. Uses what the pipeline observed (trace root
+    attributes) when available, the raw event otherwise.
+    """
+    attributes = attributes or {}
+    search = attributes.get("search_type") or event.get("filter_type") or "around"
+    translated = attributes.get("translated")
+    language = "unknown" if translated is None else ("translated" if translated else "english")
+    return {"search": str(search).lower(), "language": language}
+
+
+def read_capture(path: str) -> List[Dict[str, Any]]:
+    """
+    Read captured records, from the JSON lines of the `file` mode or from
+    log lines exported from the `log` mode (anything before the capture
+    marker is ignored).
+    """
+    records = []
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            if CAPTURE_MARKER in line:
+                line = line.split(CAPTURE_MARKER, 1)[1]
+            line = line.strip()
+            if line:
+                records.append(json.loads(line))
+    return records
+
+
+class TrafficRecorder:
+    """Writes scrubbed events as JSON lines, see module docstring."""
+
+    def __init__(self, mode: str = "off", path: Optional[str] = None, sample_rate: float = 1.0) -> None:
+        self.mode = mode.lower()
+        self.path = path
+        self.sample_rate = sample_rate
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "TrafficRecorder":
+        return cls(
+            mode=os.getenv("TRAFFIC_CAPTURE", "off"),
+            path=os.getenv("TRAFFIC_CAPTURE_PATH"),
+            sample_rate=float(os.getenv("TRAFFIC_CAPTURE_SAMPLE_RATE", "1.0")),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    def record(self, event_data, trace=None, status: str = "ok") -> None:
+        """
+        Capture one request. Never raises, capture must not break the request.
+
+        Args:
+            event_data (FilterEvent): The parsed request.
+            trace (RequestTrace): Trace of the request, for class and latency.
+            status (str): `ok` or the error name.
+        """
+        if not self.enabled or random.random() >= self.sample_rate:
+            return
+        try:
+            event = scrub_event(event_data)
+            attributes = trace.root.attributes if trace else {}
+            line = json.dumps({
+                "ts": round(time.time(), 3),
+                "event": event,
+                "event_class": classify_event(event, attributes),
+                "latency_ms": round(trace.root.duration_ms, 1) if trace else None,
+                "status": status,
+            })
+            if self.mode == "file" and self.path:
+                with self._lock, open(self.path, "a", encoding="utf-8") as file:
+                    file.write(line + "\n")
+            else:
+                logger.info(f"{CAPTURE_MARKER} {line}")
+        except Exception as e:
+            logger.warning(f"Could not capture traffic: {e}")
+
+
+traffic_recorder = TrafficRecorder.from_env()
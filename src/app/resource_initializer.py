@@ -1,27 +1,22 @@
-
-import os
-import yaml
-
 import os
 import logging
 import logging.config
 
-from langchain_groq import ChatGroq
-from langchain_openai import AzureChatOpenAI
-from langchain.prompts import ChatPromptTemplate
-
 from src.app.utils.common.config_loader import ConfigLoader
-from src.app.utils.aws.secrets_manager_client import SecretsManagerClient
-from src.app.services.gma_filterer_chain import Assistant_Rag
-from src.app.services.reranker_chain import RerankingChain
-from src.app.services.llm_components import StructuredOutputChainComponent
-from src.app.services.filterer import Filterer
+from src.app.utils.common.secrets_provider import get_secrets_provider, collect_secret_names
+from src.app.utils.common.lazy_import import lazy_import
+from src.app.utils.common.hedging import configure_hedging
+from src.app.utils.common.resilience import configure_resilience
+from src.app.utils.common.json_codec import configure_codec
+from src.app.monitoring.startup_profiler import startup_profiler
 
 ## Import the schema
-from src.app.schemas import filters_schema, translation_schema, reranker_schema
+from src.app.schemas import filters_schema, translation_schema, reranker_schema, reranker_score_schema, reason_schema
 from src.app.monitoring.opik_utils import configure_opik
-from src.app.utils.aws.s3_cli import S3Service
-from opik.integrations.langchain import OpikTracer
+
+## Heavy SDKs are only imported when the resource that needs them is built
+langchain_prompts = lazy_import("langchain.prompts")
+opik_langchain = lazy_import("opik.integrations.langchain")
 
 
 
@@ -29,10 +24,19 @@ class ResourceInitializer:
     def __init__(self) -> None:
         self.environment = os.getenv("env")
         self.platform = os.getenv("platform")
-        self.config = ConfigLoader(env=self.environment).config
+        with startup_profiler.step("config"):
+            self.config = ConfigLoader(env=self.environment).config
         self.aws_region = self.config.get("AWS_REGION")
-        self.secrets_manager_client = SecretsManagerClient(region_name=self.aws_region)
         self.logger = self._set_up_logger()
+        configure_hedging(self.config.get("HEDGING"))
+        configure_resilience(self.config.get("RESILIENCE"))
+        configure_codec(self.config.get("JSON_CODEC", "auto"))
+        ## Cached provider, every component below shares the same secrets
+        with startup_profiler.step("secrets_prefetch"):
+            self.secrets_manager_client = get_secrets_provider(self.config)
+            self.secrets_manager_client.prefetch(collect_secret_names(self.config))
+        if (self.config.get("SECRETS") or {}).get("BACKGROUND_REFRESH", True):
+            self.secrets_manager_client.start_background_refresh()
         configure_opik(api_key = self.secrets_manager_client.get_secret(
                 self.config.get("OPIK_SECRET"))["api_key"],
                 project="GMA"
@@ -45,6 +49,7 @@ class ResourceInitializer:
 
     def get_s3_client(self):
         self.logger.info("Getting S3")
+        from src.app.utils.aws.s3_cli import S3Service
 
         return S3Service()
 
@@ -63,6 +68,11 @@ class ResourceInitializer:
     #     return llm
 
     def _get_llm(self):
+        """Builds a LLM client (see `_build_llm`), profiled as a startup step."""
+        with startup_profiler.step(f"llm_client:{self.platform}"):
+            return self._build_llm()
+
+    def _build_llm(self):
         """
         Initializes the LLM with the provided API key and configuration.
 
@@ -81,6 +91,7 @@ class ResourceInitializer:
 
         if self.platform == "azure":
             self.logger.info("Using Azure OpenAI model...")
+            from langchain_openai import AzureChatOpenAI
             if not self.config.get("AZURE", {}).get("OPENAI_ENDPOINT", ""):
                 raise ValueError("Azure base URL must be provided for Azure OpenAI model.")
             llm = AzureChatOpenAI(
@@ -93,6 +104,7 @@ class ResourceInitializer:
             return llm
         elif self.platform == "groq":
             self.logger.info("Using Groq model...")
+            from langchain_groq import ChatGroq
             if not self.groq_model_name:
                 raise ValueError("Groq model name must be provided for Groq model.")
             llm = ChatGroq(
@@ -115,9 +127,13 @@ class ResourceInitializer:
             'server_url': self.config.get("EC2").get("PRIVATE_IP"),
             'aws_region':self.config.get("AWS_REGION"),
             "port": self.config.get("EC2").get("PORT"),
+            "micro_batch": self.config.get("EC2").get("MICRO_BATCH"),
+            "embeddings": self.config.get("EMBEDDINGS"),
             'logger':self.logger
             }
-        return Filterer(config = vector_db_config)
+        from src.app.services.filterer import Filterer
+        with startup_profiler.step(f"pinecone:{vector_db_config['index_name']}"):
+            return Filterer(config = vector_db_config)
     
     def __get_business_type_filterer(self):
         vector_db_config = {
@@ -129,9 +145,13 @@ class ResourceInitializer:
             'server_url': self.config.get("EC2").get("PRIVATE_IP"),
             'aws_region':self.config.get("AWS_REGION"),
             "port": self.config.get("EC2").get("PORT"),
+            "micro_batch": self.config.get("EC2").get("MICRO_BATCH"),
+            "embeddings": self.config.get("EMBEDDINGS"),
             'logger':self.logger
             }
-        return Filterer(config = vector_db_config)
+        from src.app.services.filterer import Filterer
+        with startup_profiler.step(f"pinecone:{vector_db_config['index_name']}"):
+            return Filterer(config = vector_db_config)
 
 
     def get_filterer_agent(self, system_config):
@@ -139,15 +159,17 @@ class ResourceInitializer:
 
 
         llm = self._get_llm()
-        opik_tracer = OpikTracer(tags=["EntityExtraction"])
+        from src.app.services.gma_filterer_chain import Assistant_Rag
+        from src.app.services.llm_components import StructuredOutputChainComponent
+        opik_tracer = opik_langchain.OpikTracer(tags=["EntityExtraction"])
         cuisine_retriever = self.__get_cuisine_type_filterer()
         business_type_retriever = self.__get_business_type_filterer()
         ## Define the Subcomponents of the final chain:
         filter_template = system_config.get('filter_pipeline').get("prompt")
         translate_prompt = system_config.get('filter_pipeline').get("translate_prompt")
 
-        filter_prompt = ChatPromptTemplate.from_template(filter_template)
-        translate_prompt =ChatPromptTemplate.from_template(translate_prompt)
+        filter_prompt = langchain_prompts.ChatPromptTemplate.from_template(filter_template)
+        translate_prompt =langchain_prompts.ChatPromptTemplate.from_template(translate_prompt)
 
         filter_extraction_chain = StructuredOutputChainComponent(filter_prompt, llm, filters_schema).build_chain()
         translation_chain = StructuredOutputChainComponent(translate_prompt, llm, translation_schema).build_chain()
@@ -163,19 +185,51 @@ class ResourceInitializer:
 
     def get_reranker(self, system_config):
         logging.info(f"Going to load reranker with model---> {system_config.get('filter_pipeline').get('model_name')}")
-        reranker_template = system_config.get('filter_pipeline').get("reranking_prompt")
+        ## RERANK.MODE: "full" (score and reason of every business) or "score_only" (reasons on demand)
+        rerank_config = self.config.get("RERANK") or {}
+        score_only = str(rerank_config.get("MODE", "full")).lower() == "score_only"
+        if score_only:
+            reranker_template = system_config.get('filter_pipeline').get("reranking_score_prompt")
+        else:
+            reranker_template = system_config.get('filter_pipeline').get("reranking_prompt")
 
         llm = self._get_llm()
-        opik_tracer = OpikTracer(tags=["Reranker"])
-        reranker_prompt = ChatPromptTemplate.from_template(reranker_template)
+        from src.app.services.reranker_chain import RerankingGraph
+        opik_tracer = opik_langchain.OpikTracer(tags=["Reranker"])
+        reranker_prompt = langchain_prompts.ChatPromptTemplate.from_template(reranker_template)
 
         llm = llm.with_structured_output(
-            reranker_schema,
+            reranker_score_schema if score_only else reranker_schema,
             method = "json_mode"
             )
 
-        return RerankingChain(
+        ## Chunks sized by tokens, fan-out bounded to the provider rate limits
+        return RerankingGraph(
             scoring_prompt = reranker_prompt,
             llm = llm,
-            opik_tracer=opik_tracer
+            opik_tracer=opik_tracer,
+            score_only=score_only,
+            chunk_tokens=int(rerank_config.get("CHUNK_TOKENS", 1500)),
+            max_chunk_size=int(rerank_config.get("MAX_CHUNK_SIZE", 8)),
+            max_concurrency=int(rerank_config.get("MAX_CONCURRENCY", 4)),
+            max_attempts=int(rerank_config.get("MAX_ATTEMPTS", 2)),
+            encoding=(self.config.get("RERANK_COMPACTION") or {}).get("ENCODING", "cl100k_base")
+        )
+
+    def get_reason_generator(self, system_config):
+        reason_template = system_config.get('filter_pipeline').get("reason_prompt")
+        reasons_config = self.config.get("REASONS") or {}
+
+        llm = self._get_llm()
+        from src.app.services.reason_generator import ReasonGenerator
+        from src.app.services.llm_components import StructuredOutputChainComponent
+        opik_tracer = opik_langchain.OpikTracer(tags=["Reasons"])
+        reason_prompt = langchain_prompts.ChatPromptTemplate.from_template(reason_template)
+
+        return ReasonGenerator(
+            reason_chain=StructuredOutputChainComponent(reason_prompt, llm, reason_schema).build_chain(),
+            opik_tracer=opik_tracer,
+            max_workers=int(reasons_config.get("MAX_WORKERS", 6)),
+            cache_size=int(reasons_config.get("CACHE_SIZE", 4096)),
+            ttl_s=float(reasons_config.get("TTL_S", 3600)),
         )
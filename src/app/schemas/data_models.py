@@ -43,6 +43,22 @@ class FilterEvent(BaseModel):
     filter_data: FilterData
     filter_type: Optional[str] = None
     city_code: Optional[str] = None
+    country_code: Optional[str] = "es"
+    deadline_ms: Optional[int] = None  # Time budget of the request, the configured one otherwise
+
+
+## Input for the reasons entry point
+class ReasonPlace(BaseModel):
+    id: str
+    processed_daterange_001: Optional[str] = None
+    metadata: Optional[Dict] = None  # The summary of the filter response, fetched again otherwise
+
+
+class ReasonEvent(BaseModel):
+    natural_query: str
+    places: List[ReasonPlace]  # The visible results only
+    city_code: Optional[str] = None
+    country_code: Optional[str] = "es"
 
 
 # ## Lambda response
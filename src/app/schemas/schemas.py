@@ -121,3 +121,31 @@ reranker_schema = {
   },
   "required": ["business_scores"]
 }
+
+
+## Score-only reranking: no reasons, so the output stays a few tokens per business
+reranker_score_schema = {
+  "title": "BusinessScoresCompact",
+  "type": "object",
+  "properties": {
+    "scores": {
+      "type": "object",
+      "description": "Relevance score (0 to 100) of each business, keyed by business ID.",
+      "additionalProperties": {"type": "integer", "minimum": 0, "maximum": 100}
+    }
+  },
+  "required": ["scores"]
+}
+
+
+reason_schema = {
+  "title": "BusinessReason",
+  "type": "object",
+  "properties": {
+    "reason": {
+      "type": "string",
+      "description": "A concise explanation for the user of why the business matches their query."
+    }
+  },
+  "required": ["reason"]
+}
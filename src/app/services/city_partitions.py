@@ -0,0 +1,84 @@
+"""
+Cities as partitions of the pipeline.
+
+Every request belongs to a city, `{country}/{city}` (e.g. `es/vlc`), resolved
+once from its `country_code` / `city_code` (the configured default city when
+missing). The city selects the summaries (S3 layout and shard), the
+embedding snapshot, the Pinecone namespace and the response cache partition.
+The caches are partitioned on it, so a new city fills its own partition
+instead of evicting the entries of the others (see the `CITY_MAX_MB` quotas
+of `ResponseCache` and the `MAX_CITIES` of the snapshot stores).
+
+The city is also the routing key of the fleet: sending every request of a
+city to the same few workers keeps their snapshots and caches warm.
+`route` ranks the workers of a key with rendezvous (highest random weight)
+hashing, so adding or removing a worker only moves the cities it owned.
+
+Config (`CITIES` key):
+    DEFAULT (default "es/vlc"): City of the requests without a city code.
+    PRELOAD (default [DEFAULT]): Cities whose snapshots are loaded at startup.
+    ROUTING_REPLICAS (default 2): Workers a city is routed to.
+"""
+import hashlib
+from typing import Dict, Any, List, Optional, Tuple
+
+
+# (country, city), lowercase
+CityKey = Tuple[str, str]
+
+
+def city_name(city: CityKey) -> str:
+    """`{country}/{city}`, the name of a partition and its routing key."""
+    return f"{city[0]}/{city[1]}"
+
+
+def parse_city(name: str) -> CityKey:
+    """Inverse of `city_name`."""
+    country, _, city = name.strip().lower().partition("/")
+    if not country or not city:
+        raise ValueError(f"Invalid city: {name}. Expected '<country>/<city>', e.g. 'es/vlc'.")
+    return country, city
+
+
+def _weight(key: str, worker: str) -> int:
+    return int.from_bytes(hashlib.blake2b(f"{key}|{worker}".encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def route(key: str, workers: List[str], replicas: int = 1) -> List[str]:
+    """
+    Rendezvous hashing: the `replicas` workers with the highest weight for
+    `key`, best first. Stable for a given set of workers, whatever their order.
+    """
+    return sorted(workers, key=lambda worker: _weight(key, worker), reverse=True)[:max(1, replicas)]
+
+
+class CityPartitions:
+    """Resolves the city of the requests, see module docstring."""
+
+    def __init__(self, default: str = "es/vlc", preload: Optional[List[str]] = None,
+                 routing_replicas: int = 2) -> None:
+        self.default = parse_city(default)
+        self.preload = [parse_city(name) for name in (preload if preload is not None else [default])]
+        self.routing_replicas = routing_replicas
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]]) -> "CityPartitions":
+        config = config or {}
+        return cls(
+            default=config.get("DEFAULT", "es/vlc"),
+            preload=config.get("PRELOAD"),
+            routing_replicas=int(config.get("ROUTING_REPLICAS", 2)),
+        )
+
+    def resolve(self, country_code: Optional[str], city_code: Optional[str]) -> CityKey:
+        """City of a request. A request without a city code gets the default city."""
+        if not city_code:
+            return self.default
+        return (country_code or self.default[0]).strip().lower(), city_code.strip().lower()
+
+    def routing_key(self, country_code: Optional[str], city_code: Optional[str]) -> str:
+        return city_name(self.resolve(country_code, city_code))
+
+    def route(self, country_code: Optional[str], city_code: Optional[str], workers: List[str]) -> List[str]:
+        """Workers the requests of a city should go to, best first."""
+        return route(self.routing_key(country_code, city_code), workers, self.routing_replicas)
@@ -0,0 +1,263 @@
+"""
+Local business embedding store, for scoring filter service candidates
+without calling the Pinecone lambda.
+
+A snapshot holds the embeddings of every business of a city:
+
+    manifest.json    {"version", "dtype": "float32" | "int8", "dimension", "count"}
+    embeddings.npy   (count, dimension) float32 or int8 matrix, rows L2-normalized
+    scales.npy       (count,) float32 per-row scales, int8 snapshots only
+    ids.json         business id of each row
+
+Snapshots are published to S3 under `{PREFIX}/{city}/{version}/` with a
+`{PREFIX}/{city}/latest.json` pointer ({"version": ...}). Each version is
+downloaded once to `LOCAL_DIR` and memory-mapped, so the matrix is shared by
+every request of the container and only the rows of the candidates are read.
+The downloaded copy of a version is deleted once it is replaced or unloaded
+(the requests still scoring with it keep the mapped files until they are done).
+
+Config (`EMBEDDING_STORE` key):
+    ENABLED, BUCKET, PREFIX, LOCAL_DIR (default /tmp/embedding_store),
+    POINTER_TTL_S: How often the latest version is checked (default 300).
+    MAX_CITIES: Snapshots kept loaded, the least recently used city is
+        unloaded beyond (default 0, no limit).
+"""
+import os
+import json
+import time
+import shutil
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+
+from src.app.utils.common.lazy_import import lazy_import
+
+np = lazy_import("numpy")
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = "manifest.json"
+EMBEDDINGS = "embeddings.npy"
+SCALES = "scales.npy"
+IDS = "ids.json"
+
+
+class EmbeddingStore:
+    """Memory-mapped embeddings of one snapshot, scored by business id."""
+
+    def __init__(self, directory: str) -> None:
+        with open(os.path.join(directory, MANIFEST), "r", encoding="utf-8") as file:
+            self.manifest = json.load(file)
+        with open(os.path.join(directory, IDS), "r", encoding="utf-8") as file:
+            self.ids: List[str] = json.load(file)
+        self.directory = directory
+        self.version = self.manifest["version"]
+        self.dtype = self.manifest.get("dtype", "float32")
+        self.embeddings = np.load(os.path.join(directory, EMBEDDINGS), mmap_mode="r")
+        self.scales = np.load(os.path.join(directory, SCALES), mmap_mode="r") if self.dtype == "int8" else None
+        self.row_of = {business_id: row for row, business_id in enumerate(self.ids)}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def score(self, query_vector: List[float], business_ids: List[str]) -> List[Dict[str, Any]]:
+        """
+        Cosine similarity of the query with each known business, in one
+        matrix-vector product. Unknown ids are left out, as Pinecone does.
+
+        Returns:
+            list: [{"id": ..., "score": ...}] sorted by score, the `matches` shape.
+        """
+        known = [business_id for business_id in business_ids if business_id in self.row_of]
+        if not known:
+            return []
+        rows = np.fromiter((self.row_of[business_id] for business_id in known), dtype=np.int64, count=len(known))
+        order = np.argsort(rows)  # sorted rows read the memory map sequentially
+        rows = rows[order]
+
+        query = np.asarray(query_vector, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        scores = np.asarray(self.embeddings[rows], dtype=np.float32) @ query
+        if self.scales is not None:
+            scores *= self.scales[rows]
+
+        known = [known[i] for i in order]
+        ranking = np.argsort(-scores)
+        return [{"id": known[i], "score": float(scores[i])} for i in ranking]
+
+
+def build_snapshot(output_dir: str, business_ids: List[str], vectors, version: str, dtype: str = "float32") -> str:
+    """
+    Write a snapshot (see module docstring) of the given embeddings.
+
+    Args:
+        output_dir (str): Directory of the snapshot.
+        business_ids (list): Business id of each vector.
+        vectors: (count, dimension) array-like of embeddings.
+        version (str): Snapshot version, e.g. the export date.
+        dtype (str): "float32", or "int8" for a 4x smaller symmetric per-row quantization.
+
+    Returns:
+        str: The snapshot directory.
+    """
+    if dtype not in ("float32", "int8"):
+        raise ValueError(f"Unsupported dtype: {dtype}. Supported dtypes are 'float32' and 'int8'.")
+    os.makedirs(output_dir, exist_ok=True)
+    matrix = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix = matrix / np.where(norms == 0, 1.0, norms)
+
+    if dtype == "int8":
+        scales = np.abs(matrix).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        np.save(os.path.join(output_dir, SCALES), scales.astype(np.float32))
+        matrix = np.round(matrix / scales[:, None]).astype(np.int8)
+    np.save(os.path.join(output_dir, EMBEDDINGS), matrix)
+
+    with open(os.path.join(output_dir, IDS), "w", encoding="utf-8") as file:
+        json.dump(list(business_ids), file)
+    with open(os.path.join(output_dir, MANIFEST), "w", encoding="utf-8") as file:
+        json.dump({"version": version, "dtype": dtype, "dimension": int(matrix.shape[1]), "count": len(business_ids)}, file)
+    return output_dir
+
+
+class EmbeddingStoreManager:
+    """Downloads and keeps the latest snapshot of each city."""
+
+    def __init__(self, bucket: Optional[str], prefix: str = "embeddings", local_dir: str = "/tmp/embedding_store",
+                 pointer_ttl_s: float = 300.0, max_cities: int = 0) -> None:
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.local_dir = local_dir
+        self.pointer_ttl_s = pointer_ttl_s
+        self.max_cities = max_cities
+        self._stores: "OrderedDict[str, EmbeddingStore]" = OrderedDict()
+        self._checked_at: Dict[str, float] = {}
+        # Guards the dicts only; the downloads of a city run under its own lock
+        self._lock = threading.Lock()
+        self._city_locks: Dict[str, threading.Lock] = {}
+        self._s3 = None
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]]) -> Optional["EmbeddingStoreManager"]:
+        """The manager, or None when the local scoring mode is disabled."""
+        config = config or {}
+        if not config.get("ENABLED", False):
+            return None
+        return cls(
+            bucket=config.get("BUCKET"),
+            prefix=config.get("PREFIX", "embeddings"),
+            local_dir=config.get("LOCAL_DIR", "/tmp/embedding_store"),
+            pointer_ttl_s=float(config.get("POINTER_TTL_S", 300)),
+            max_cities=int(config.get("MAX_CITIES", 0)),
+        )
+
+    def cities(self) -> List[str]:
+        """Cities with a loaded snapshot, least recently used first."""
+        with self._lock:
+            return list(self._stores)
+
+    def loaded_version(self, city: str) -> Optional[str]:
+        """Version of the loaded snapshot of `city`, None when none is loaded. Never loads one."""
+        with self._lock:
+            store = self._stores.get(city)
+            return store.version if store is not None else None
+
+    def _client(self):
+        if self._s3 is None:
+            import boto3
+            self._s3 = boto3.client("s3")
+        return self._s3
+
+    def _latest_version(self, city: str) -> Optional[str]:
+        if not self.bucket:
+            # Local only: the newest version already on disk
+            city_dir = os.path.join(self.local_dir, city)
+            versions = sorted(v for v in os.listdir(city_dir) if ".partial-" not in v) if os.path.isdir(city_dir) else []
+            return versions[-1] if versions else None
+        response = self._client().get_object(Bucket=self.bucket, Key=f"{self.prefix}/{city}/latest.json")
+        return json.loads(response["Body"].read())["version"]
+
+    def _download(self, city: str, version: str) -> str:
+        directory = os.path.join(self.local_dir, city, version)
+        if os.path.exists(os.path.join(directory, MANIFEST)):
+            return directory
+        # Download to a temporary directory, so a crash never leaves a partial snapshot
+        partial = f"{directory}.partial-{os.getpid()}-{threading.get_ident()}"
+        try:
+            os.makedirs(partial, exist_ok=True)
+            for name in (MANIFEST, EMBEDDINGS, IDS, SCALES):
+                try:
+                    self._client().download_file(self.bucket, f"{self.prefix}/{city}/{version}/{name}", os.path.join(partial, name))
+                except Exception:
+                    if name != SCALES:
+                        raise
+            try:
+                os.replace(partial, directory)
+            except OSError:
+                # Installed meanwhile by another process: keep that one
+                if not os.path.exists(os.path.join(directory, MANIFEST)):
+                    raise
+        finally:
+            shutil.rmtree(partial, ignore_errors=True)
+        logger.info(f"Downloaded embedding snapshot {version} of {city}")
+        return directory
+
+    def _cached(self, city: str):
+        """(loaded store, whether its pointer was checked within the TTL)."""
+        with self._lock:
+            store = self._stores.get(city)
+            if store is not None:
+                self._stores.move_to_end(city)
+            return store, store is not None and time.monotonic() - self._checked_at.get(city, 0) < self.pointer_ttl_s
+
+    def _delete(self, store: EmbeddingStore) -> None:
+        """Delete the downloaded copy of a snapshot no longer loaded. Never the snapshots of the local only mode."""
+        if self.bucket:
+            shutil.rmtree(store.directory, ignore_errors=True)
+
+    def get(self, city: str) -> Optional[EmbeddingStore]:
+        """The store of `city`, None when it has no snapshot."""
+        store, fresh = self._cached(city)
+        if fresh:
+            return store
+        with self._lock:
+            city_lock = self._city_locks.setdefault(city, threading.Lock())
+        # One refresh per city at a time, the other cities are not blocked by it.
+        # While a loaded snapshot is refreshed, the other requests keep using it.
+        if not city_lock.acquire(blocking=store is None):
+            return store
+        try:
+            store, fresh = self._cached(city)
+            if fresh:
+                return store
+            try:
+                version = self._latest_version(city)
+                if version is not None and (store is None or store.version != version):
+                    replaced, store = store, EmbeddingStore(self._download(city, version))
+                    with self._lock:
+                        self._stores[city] = store
+                    if replaced is not None:
+                        self._delete(replaced)
+            except Exception as e:
+                logger.error(f"Could not load the embedding snapshot of {city}: {e}")
+            unloaded = []
+            with self._lock:
+                self._checked_at[city] = time.monotonic()
+                while self.max_cities and len(self._stores) > self.max_cities:
+                    unloaded.append(self._stores.popitem(last=False))
+                    self._checked_at.pop(unloaded[-1][0], None)
+            for other, other_store in unloaded:
+                logger.info(f"Unloaded the embedding snapshot of {other}")
+                # Kept when that city is being loaded again meanwhile, its download may be this very copy
+                with self._lock:
+                    other_lock = self._city_locks[other]
+                if other_lock.acquire(blocking=False):
+                    try:
+                        self._delete(other_store)
+                    finally:
+                        other_lock.release()
+            return store
+        finally:
+            city_lock.release()
@@ -1,12 +1,39 @@
-from src.app.services.vector_db_client import VectorDBClient
-
-
-from typing import Any, Dict, List
+import heapq
+import contextvars
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
 from datetime import datetime
 
+from src.app.services.vector_db_client import VectorDBClient
+from src.app.monitoring.tracing import span
+from src.app.utils.common.resilience import resilient_call, PINECONE
+
+
+def _match_as_dict(match, metadata_fields: Optional[List[str]], include_metadata: Optional[bool] = None) -> dict:
+    """
+    Plain dict of a Pinecone match, keeping only the requested metadata fields
+    (all of them when `include_metadata` and no `metadata_fields` are given).
+    """
+    get = match.get if isinstance(match, dict) else lambda key: getattr(match, key, None)
+    result = {"id": get("id"), "score": get("score")}
+    if include_metadata is None:
+        include_metadata = bool(metadata_fields)
+    if include_metadata:
+        metadata = get("metadata") or {}
+        if metadata_fields is None:
+            result["metadata"] = dict(metadata)
+        else:
+            result["metadata"] = {field: metadata[field] for field in metadata_fields if field in metadata}
+    return result
 
 
 class Filterer(VectorDBClient):
+    # Ids per `$in` filter of an id constrained query, and chunks queried at once
+    id_chunk_size = 500
+    max_parallel_queries = 8
+    _executor = ThreadPoolExecutor(max_workers=max_parallel_queries, thread_name_prefix="pinecone")
+
     def __init__(
         self,
         config: dict
@@ -26,25 +53,34 @@ class Filterer(VectorDBClient):
 
         return business
 
-    def query_index(self, query_str:str, metadata: dict = {})-> list:
+    def query_index(self, query_str:str, metadata: dict = {}, metadata_fields: Optional[List[str]] = None)-> dict:
         """Function to query an index by both metadata and Text based 
 
         Args:
             query_str (str): Query to be used to filter the index
             metadata(dict): All kind of filters wanted to be performed
+            metadata_fields(List[str]): Metadata fields to return, all of them by default
 
         Returns:
-            list: Results with all information from the Index
+            dict: {"matches": [{"id", "score", "metadata"?}, ...], "namespace": ...}, the
+            shape of `query_by_ids`, which serves the `business_id` filters above `id_chunk_size` ids
         """
-        doc_embedding = self.embedding_model.embed_query(query_str)
+        with span("embed_query"):
+            doc_embedding = self.embedding_model.embed_query(query_str)
         business_ids = metadata.get("business_id", {}).get("$in", [])
+        include_metadata = True if metadata_fields is None else bool(metadata_fields)
+
+        if len(business_ids) > self.id_chunk_size:
+            other_filters = {key: value for key, value in metadata.items() if key != "business_id"}
+            return self.query_by_ids(doc_embedding, business_ids, metadata_fields=metadata_fields,
+                                     metadata_filter=other_filters or None, include_metadata=include_metadata)
 
         k = len(business_ids) if business_ids else 20
         self.logger.info(f"Filtering index with data--->{doc_embedding[:5]} and filters--->{metadata}")
 
         query_params = {
             "vector": doc_embedding,
-            "include_metadata": True,
+            "include_metadata": include_metadata,
             "top_k": k,
             "namespace":self.namespace
         }
@@ -54,5 +90,68 @@ class Filterer(VectorDBClient):
             query_params["filter"] = metadata
 
         # Call the query with unpacked parameters
-        response = self.index.query(**query_params)
-        return response
+        with span("pinecone_query", index=self.index_name, top_k=k) as query_span:
+            response = resilient_call(PINECONE, self.index.query, **query_params)
+            query_span.set(matches=len(response.get("matches", [])))
+        return {"matches": [_match_as_dict(match, metadata_fields, include_metadata) for match in response.get("matches", [])],
+                "namespace": self.namespace}
+
+    def query_by_ids(
+            self,
+            vector: List[float],
+            business_ids: List[str],
+            top_k: Optional[int] = None,
+            metadata_fields: Optional[List[str]] = None,
+            metadata_filter: Optional[dict] = None,
+            include_metadata: Optional[bool] = None
+        ) -> dict:
+        """Vector search restricted to a set of business ids.
+
+        The ids are split in chunks of `id_chunk_size`, each chunk is queried
+        with its own `$in` filter in parallel, and the per-chunk results
+        (sorted by score) are k-way merged into the global top k.
+
+        Pinecone can not return a subset of the metadata: it is requested only
+        when `metadata_fields` (or `include_metadata`) is given, and reduced to
+        those fields here.
+
+        Args:
+            vector (List[float]): Query embedding.
+            business_ids (List[str]): Ids the search is restricted to.
+            top_k (int): Matches to return, all the ids by default.
+            metadata_fields (List[str]): Metadata fields to return, none by default.
+            include_metadata (bool): Return the metadata, all of it without `metadata_fields`.
+                Defaults to whether `metadata_fields` is given.
+            metadata_filter (dict): Extra metadata filter applied to every chunk.
+
+        Returns:
+            dict: {"matches": [{"id", "score", "metadata"?}, ...], "namespace": ...}
+        """
+        business_ids = list(dict.fromkeys(business_ids))
+        if include_metadata is None:
+            include_metadata = bool(metadata_fields)
+        top_k = min(top_k or len(business_ids), len(business_ids))
+        chunks = [business_ids[i:i + self.id_chunk_size] for i in range(0, len(business_ids), self.id_chunk_size)]
+
+        def _query_chunk(chunk):
+            id_filter = {"business_id": {"$in": chunk}}
+            query_params = {
+                "vector": vector,
+                "include_metadata": include_metadata,
+                "top_k": min(top_k, len(chunk)),
+                "namespace": self.namespace,
+                "filter": {"$and": [id_filter, metadata_filter]} if metadata_filter else id_filter,
+            }
+            with span("pinecone_query", index=self.index_name, top_k=query_params["top_k"], ids=len(chunk)) as query_span:
+                response = resilient_call(PINECONE, self.index.query, **query_params)
+                matches = [_match_as_dict(match, metadata_fields, include_metadata) for match in response.get("matches", [])]
+                query_span.set(matches=len(matches))
+            matches.sort(key=lambda match: match["score"], reverse=True)
+            return matches
+
+        self.logger.info(f"Querying {len(business_ids)} ids of index {self.index_name} in {len(chunks)} chunks")
+        futures = [self._executor.submit(contextvars.copy_context().run, _query_chunk, chunk) for chunk in chunks]
+        per_chunk = [future.result() for future in futures]
+
+        merged = heapq.merge(*per_chunk, key=lambda match: match["score"], reverse=True)
+        return {"matches": list(islice(merged, top_k)), "namespace": self.namespace}
@@ -4,15 +4,29 @@ In this file we define a client that uses the LCEL (LangChain Expression Languag
 methodology to define a conversation pipeline. In this way, the method is more customizable,
 allowing to evaluate and trace each component separately.
 """
+from functools import lru_cache
 from typing import TypedDict, List, Optional
-from langid.langid import LanguageIdentifier, model
-from langchain_core.runnables import RunnableLambda, RunnableBranch, RunnablePassthrough
 from typing_extensions import TypedDict
 
-from langgraph.graph import StateGraph, START, END
+from src.app.utils.common.lazy_import import lazy_import
+from src.app.monitoring.tracing import span
+from src.app.monitoring.memory_profiler import memory_profiler
+from src.app.utils.common.deadline import current_deadline, mark_degraded
+from src.app.services.lexicon_extractor import extract_filters_from_lexicon
+from src.app.utils.common.resilience import resilient_call, LLM
 
-## Initialize it here, so it does not take time in every execution
-identifier = LanguageIdentifier.from_modelstring(model, norm_probs=True)
+langgraph_graph = lazy_import("langgraph.graph")
+
+
+@lru_cache(maxsize=1)
+def get_language_identifier():
+    """
+    Load the langid model once per container, on the first language check
+    instead of at import time.
+    """
+    with memory_profiler.measure("langid_model"):
+        from langid.langid import LanguageIdentifier, model
+        return LanguageIdentifier.from_modelstring(model, norm_probs=True)
 
 
 
@@ -50,7 +64,7 @@ class Assistant_Rag:
         self.cuisine_type_retriever = cuisine_type_retriever
         self.business_type_retriever = business_type_retriever
         self.opik_tracer = opik_tracer
-        process = StateGraph(State)
+        process = langgraph_graph.StateGraph(State)
         # --- Define Nodes ---
         process.add_node("translate", self.translate)
         process.add_node("retrieve_cuisine", self.query_cuisine_index)
@@ -59,23 +73,15 @@ class Assistant_Rag:
 
 
         # Conditional transition from validate_language
-        process.set_conditional_entry_point(
-            self.validate_language,
-            {
-                True: "translate",
-                False: "retrieve_cuisine"
+        process.set_conditional_entry_point(self.route_entry)
 
-                
-            }
-        )
-
-        ## Define the edges
+        ## Define the edges, both retrievals run in parallel (so their query embeddings can be batched)
         process.add_edge("translate", "retrieve_cuisine")
-        process.add_edge("retrieve_cuisine", "retrieve_business_types")
-        process.add_edge("retrieve_business_types", "extract_filter")
+        process.add_edge("translate", "retrieve_business_types")
+        process.add_edge(["retrieve_cuisine", "retrieve_business_types"], "extract_filter")
 
         # End after filter extraction
-        process.add_edge("extract_filter", END)
+        process.add_edge("extract_filter", langgraph_graph.END)
 
         graph = process.compile()
 
@@ -90,10 +96,26 @@ class Assistant_Rag:
         Args:
             state (_type_): _description_
         """
-        translation = self.translation_chain.invoke(state['question'])
-
+        with span("translate"):
+            try:
+                translation = resilient_call(LLM, self.translation_chain.invoke, state['question'])
+            except Exception as e:
+                # Search with the original query rather than failing the request
+                print(f"Translation failed, using the original query: {e}")
+                mark_degraded("translation_failed")
+                return {'translated_query': None}
+
+        ## The chain returns the translation schema ({'translation': ...}), keep only the text
+        if isinstance(translation, dict):
+            translation = translation.get("translation") or state['question']
         return {'translated_query': translation}
 
+    def route_entry(self, state):
+        """Translate first if needed, otherwise go straight to both retrievals"""
+        if self.validate_language(state):
+            return "translate"
+        return ["retrieve_cuisine", "retrieve_business_types"]
+
     def validate_language(self, state):
         """Validates the original language of the query
 
@@ -104,10 +126,16 @@ class Assistant_Rag:
             _type_: _description_
         """
         print("GOing to validate the language of", state['question'])
-        language, confidence = identifier.classify(state['question'])
+        with span("language_detection") as detection_span:
+            language, confidence = get_language_identifier().classify(state['question'])
+            detection_span.set(language=language, confidence=round(confidence, 3))
         print("Language", language)
         print("Confidence --->", confidence)
-        return language != "en" and confidence >= 0.7
+        needs_translation = language != "en" and confidence >= 0.7
+        if needs_translation and current_deadline().should_degrade("translate"):
+            mark_degraded("translation_skipped")
+            return False
+        return needs_translation
 
 
     
@@ -123,7 +151,8 @@ class Assistant_Rag:
         """
         question = state.get("translated_query") or state["question"]
         print("Retrieving cuisines for --->", question)
-        return {'cuisine_types_retrieved': self.cuisine_type_retriever.query_index(query_str = question)}
+        with span("retrieve_cuisine"):
+            return {'cuisine_types_retrieved': self._query_catalog(self.cuisine_type_retriever, question)}
     
     def query_business_types_index(self, state):
         """Query business types index to get relevant business type suggestions
@@ -136,7 +165,17 @@ class Assistant_Rag:
         """
         question = state.get("translated_query") or state["question"]
         print("Retrieving business types for --->", question)
-        return {'business_types_retrieved': self.business_type_retriever.query_index(query_str = question)}
+        with span("retrieve_business_types"):
+            return {'business_types_retrieved': self._query_catalog(self.business_type_retriever, question)}
+
+    def _query_catalog(self, retriever, question):
+        """Query a catalog index; without the embedding server or Pinecone the extraction runs without context."""
+        try:
+            return retriever.query_index(query_str = question)
+        except Exception as e:
+            print(f"Catalog retrieval failed, extracting without context: {e}")
+            mark_degraded("catalog_retrieval_failed")
+            return []
     
     def extract_filters(self, state):
         """Extract filters using the question and retrieved context
@@ -155,7 +194,18 @@ class Assistant_Rag:
             'available_business_types': business_types
         }
         
-        retrieved_filters = self.filter_extraction_chain.invoke(context)
+        if current_deadline().should_degrade("extract_filters"):
+            mark_degraded("lexicon_extraction")
+            with span("extract_filters", mode="lexicon"):
+                return {'filters': extract_filters_from_lexicon(question, cuisine_types, business_types)}
+
+        with span("extract_filters"):
+            try:
+                retrieved_filters = resilient_call(LLM, self.filter_extraction_chain.invoke, context)
+            except Exception as e:
+                print(f"Filter extraction failed, using the lexicon: {e}")
+                mark_degraded("lexicon_extraction")
+                return {'filters': extract_filters_from_lexicon(question, cuisine_types, business_types)}
 
         return {'filters': retrieved_filters}
 
@@ -0,0 +1,102 @@
+"""
+Lexicon-only filter extraction.
+
+Cheap fallback of the LLM filter extraction, used when the request is
+running out of budget (or the LLM is unavailable). It matches the query
+against the cuisine / business types retrieved from the indexes and a small
+lexicon of price and quality words, and returns the same structure as the
+LLM extraction (`filters_schema`).
+"""
+import re
+from typing import Dict, Any, Iterable, List
+
+
+PRICE_WORDS = {
+    "cheap": {"max_price": 15},
+    "budget": {"max_price": 15},
+    "affordable": {"max_price": 20},
+    "barato": {"max_price": 15},
+    "economico": {"max_price": 15},
+    "expensive": {"min_price": 40},
+    "high-end": {"min_price": 40},
+    "fancy": {"min_price": 40},
+    "caro": {"min_price": 40},
+}
+
+SCORE_WORDS = {
+    "food_score": ["food", "dishes", "comida", "delicious", "tasty"],
+    "service_score": ["service", "staff", "servicio", "friendly"],
+    "atmosphere_score": ["atmosphere", "terrace", "views", "ambiente", "cozy", "romantic"],
+    "overall_score": ["best", "top", "highly rated", "mejor"],
+}
+
+DEFAULT_CUISINES = [
+    "italian", "spanish", "japanese", "sushi", "chinese", "mexican", "indian", "thai",
+    "vegan", "vegetarian", "mediterranean", "french", "greek", "tapas", "paella", "seafood",
+]
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text.lower()).strip()
+
+
+def names_from_matches(retrieved) -> List[str]:
+    """
+    Extract the names of the retrieved catalog entries (cuisines or business
+    types) from a Pinecone query response or a list of matches.
+    """
+    if retrieved is None:
+        return []
+    matches = retrieved.get("matches", []) if hasattr(retrieved, "get") else retrieved
+    names = []
+    for match in matches or []:
+        metadata = match.get("metadata") if hasattr(match, "get") else getattr(match, "metadata", None)
+        for value in (metadata or {}).values():
+            if isinstance(value, str) and len(value) < 40:
+                names.append(value)
+    return names
+
+
+def _mentioned(question: str, candidates: Iterable[str]) -> List[str]:
+    found = []
+    for candidate in candidates:
+        name = _normalize(candidate)
+        if name and re.search(rf"\b{re.escape(name)}\b", question) and candidate not in found:
+            found.append(candidate)
+    return found
+
+
+def extract_filters_from_lexicon(question: str, cuisine_types=None, business_types=None) -> Dict[str, Any]:
+    """
+    Args:
+        question (str): The (translated if available) user query.
+        cuisine_types: Cuisine types retrieved for the query (Pinecone response).
+        business_types: Business types retrieved for the query (Pinecone response).
+
+    Returns:
+        dict: Filters with the fields of `filters_schema`.
+    """
+    normalized = _normalize(question or "")
+    cuisine_names = names_from_matches(cuisine_types) or DEFAULT_CUISINES
+    business_names = names_from_matches(business_types)
+
+    filters: Dict[str, Any] = {
+        "search_type": "Around",
+        "place": "",
+        "business_type": _mentioned(normalized, business_names) or ["Restaurant"],
+        "keywords": [],
+        "min_price": None,
+        "max_price": None,
+        "cuisine_type": _mentioned(normalized, cuisine_names),
+    }
+
+    for word, price in PRICE_WORDS.items():
+        if re.search(rf"\b{re.escape(word)}\b", normalized):
+            filters.update(price)
+
+    # Same convention as the extraction prompt: a mentioned aspect gets 3.5
+    for score_field, words in SCORE_WORDS.items():
+        if any(re.search(rf"\b{re.escape(word)}\b", normalized) for word in words):
+            filters[score_field] = 3.5
+
+    return filters
@@ -1,13 +1,14 @@
+from __future__ import annotations
+
 import logging
 from abc import ABC, abstractmethod
-from typing import Any, Dict, List
+from typing import Any, Dict, List, TYPE_CHECKING
 
-from langchain.callbacks.base import BaseCallbackHandler
-from langchain.callbacks.manager import CallbackManager
-from langchain.prompts import ChatPromptTemplate
-from langchain.schema.agent import AgentFinish
-from langchain.schema.runnable import Runnable
-from langchain_groq import ChatGroq
+## Only needed for type hints, the provider SDKs are imported by the ResourceInitializer
+if TYPE_CHECKING:
+    from langchain_core.prompts import ChatPromptTemplate
+    from langchain_core.runnables import Runnable
+    from langchain_groq import ChatGroq
 
 
 
@@ -0,0 +1,135 @@
+"""
+In-process CPU embedding backend.
+
+Runs the fine-tuned sentence-transformer inside the lambda / server process
+instead of calling the EC2 embedding server, with the same `Embeddings`
+interface as `SentenceTransformerAPIEmbeddings`. The model is exported once
+(`export_model`) to ONNX, optionally int8 dynamically quantized, and loaded
+once per process at cold start.
+
+Config (`EMBEDDINGS` key):
+    BACKEND: "remote" (EC2 server, default) or "local".
+    MODEL_PATH: Exported model directory, or `s3://bucket/key.tar.gz` downloaded once to LOCAL_DIR.
+    RUNTIME: "onnx" (default) or "torch".
+    ONNX_FILE: ONNX file of the model directory, e.g. "onnx/model_qint8_avx2.onnx" for the quantized one.
+    NORMALIZE: L2-normalize the embeddings (default true).
+    LOCAL_DIR: Where S3 models are extracted (default /tmp/embedding_model).
+"""
+import os
+import logging
+import threading
+from functools import lru_cache
+from typing import List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from src.app.utils.common.utils import extract_tar_gz_file
+
+
+logger = logging.getLogger(__name__)
+
+_download_lock = threading.Lock()
+
+
+def resolve_model_path(model_path: str, local_dir: str = "/tmp/embedding_model") -> str:
+    """Local directory of the model, downloading and extracting it once if it is in S3."""
+    if not model_path.startswith("s3://"):
+        return model_path
+    bucket, key = model_path[len("s3://"):].split("/", 1)
+    target = os.path.join(local_dir, os.path.basename(key).split(".")[0])
+    with _download_lock:
+        if os.path.isdir(target) and os.listdir(target):
+            return target
+        import boto3
+
+        os.makedirs(local_dir, exist_ok=True)
+        archive = os.path.join(local_dir, os.path.basename(key))
+        boto3.client("s3").download_file(bucket, key, archive)
+        if extract_tar_gz_file(archive, target, logger) is None:
+            raise RuntimeError(f"Could not extract the embedding model {model_path}")
+    return target
+
+
+@lru_cache(maxsize=4)
+def load_model(model_path: str, runtime: str = "onnx", onnx_file: Optional[str] = None):
+    """Load the sentence-transformer once per process."""
+    from sentence_transformers import SentenceTransformer
+
+    model_kwargs = {"file_name": onnx_file} if runtime == "onnx" and onnx_file else None
+    logger.info(f"Loading embedding model {model_path} with the {runtime} runtime")
+    return SentenceTransformer(model_path, device="cpu", backend=runtime, model_kwargs=model_kwargs)
+
+
+def export_model(model_path: str, output_dir: str, quantize: Optional[str] = None) -> str:
+    """
+    Export a sentence-transformer to ONNX (offline, before deploying).
+
+    Args:
+        model_path (str): Fine-tuned model directory or hub id.
+        output_dir (str): Exported model directory, the MODEL_PATH of the local backend.
+        quantize (str): Also write an int8 dynamically quantized model for this CPU
+            ("avx2", "avx512", "avx512_vnni" or "arm64"), e.g. `onnx/model_qint8_avx2.onnx`.
+
+    Returns:
+        str: The exported model directory.
+    """
+    from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+    model = SentenceTransformer(model_path, device="cpu", backend="onnx")
+    model.save_pretrained(output_dir)
+    if quantize:
+        export_dynamic_quantized_onnx_model(model, quantize, output_dir)
+    return output_dir
+
+
+class LocalSentenceTransformerEmbeddings(Embeddings):
+    def __init__(self, model_path: str, runtime: str = "onnx", onnx_file: Optional[str] = None,
+                 normalize: bool = True, local_dir: str = "/tmp/embedding_model", logger=None):
+        """
+        :param model_path: exported model directory, or s3://bucket/key.tar.gz
+        :param runtime: "onnx" or "torch"
+        :param onnx_file: ONNX file inside the model directory (e.g. the quantized one)
+        :param normalize: L2-normalize the embeddings
+        :param logger: optional logger object
+        """
+        self.logger = logger if logger else logging.getLogger(__name__)
+        self.normalize = normalize
+        self.model = load_model(resolve_model_path(model_path, local_dir), runtime, onnx_file)
+        self.logger.info(f"Initializing LocalSentenceTransformerEmbeddings with model: {model_path}")
+
+    def embed_documents(self, documents: List[str]) -> List[List[float]]:
+        """Embeds multiple documents in-process."""
+        vectors = self.model.encode(documents, normalize_embeddings=self.normalize, convert_to_numpy=True)
+        return vectors.tolist()
+
+    def embed_query(self, query: str) -> List[float]:
+        """Embeds a single query in-process."""
+        return self.embed_documents([query])[0]
+
+    def prime_query_embeddings(self, queries: List[str]) -> int:
+        """Same interface as the remote backend; there is no request to save in-process."""
+        return 0
+
+
+def build_embeddings(embeddings_config: Optional[dict], server_url: str, port: str, logger=None,
+                     micro_batch: Optional[dict] = None) -> Embeddings:
+    """
+    Embedding backend chosen by `EMBEDDINGS.BACKEND`: the EC2 server
+    (`SentenceTransformerAPIEmbeddings`, default) or the in-process model.
+    """
+    embeddings_config = embeddings_config or {}
+    backend = str(embeddings_config.get("BACKEND", "remote")).lower()
+    if backend == "local":
+        return LocalSentenceTransformerEmbeddings(
+            model_path=embeddings_config["MODEL_PATH"],
+            runtime=embeddings_config.get("RUNTIME", "onnx"),
+            onnx_file=embeddings_config.get("ONNX_FILE"),
+            normalize=embeddings_config.get("NORMALIZE", True),
+            local_dir=embeddings_config.get("LOCAL_DIR", "/tmp/embedding_model"),
+            logger=logger,
+        )
+    if backend == "remote":
+        from src.app.services.sentence_transformers_embeddings import SentenceTransformerAPIEmbeddings
+
+        return SentenceTransformerAPIEmbeddings(server_url=server_url, port=port, logger=logger, micro_batch=micro_batch)
+    raise ValueError(f"Unsupported embeddings backend: {backend}. Supported backends are 'remote' and 'local'.")
@@ -0,0 +1,394 @@
+"""
+Precomputed results of the most popular searches of each city.
+
+A small set of head queries per city ("best paella valencia", "cheap
+sushi") makes most of the traffic. The precompute job takes the top N
+requests of the captured traffic (see `src.app.monitoring.traffic_capture`),
+grouped by their canonical `request_key`, runs them through the full
+pipeline offline and publishes the responses as one versioned set per city:
+
+    {PREFIX}/{country}/{city}/{version}/results.json.gz
+        {"version", "country", "city", "location_decimals", "inputs",
+         "entries": {request_key: {"query", "event", "count", "computed_at", "inputs", "response"}}}
+    {PREFIX}/{country}/{city}/latest.json   {"version": ...}
+
+`inputs` are the versions of what the results were computed from (summary
+shard, embedding snapshot and the configured INDEX_VERSION). A re-run only
+recomputes the entries whose inputs changed, that are older than
+`--max-age-h`, or that are new in the top N; the others are carried over.
+The handler checks the set of the city first, and skips it when its inputs
+no longer match the current ones. The current versions are only read from
+the snapshots already loaded (never loaded for a lookup); a city whose
+snapshots are not loaded yet gets no precomputed match. The sets themselves
+are loaded and refreshed in the background, one city at a time, so lookups
+never wait on S3.
+
+Config (`PRECOMPUTED_RESULTS` key):
+    ENABLED, BUCKET, PREFIX (default prc/precomputed), POINTER_TTL_S (default 300),
+    LOCATION_DECIMALS (default 3), INDEX_VERSION (bumped when the Pinecone index is rebuilt).
+
+Usage of the precompute job:
+    python -m src.app.services.precomputed_results capture.jsonl --country es --city vlc --top 200
+"""
+import copy
+import gzip
+import json
+import time
+import logging
+import argparse
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Callable, Tuple
+
+from src.app.schemas.data_models import FilterEvent
+from src.app.services.request_key import request_key, normalize_query
+from src.app.services.city_partitions import CityPartitions
+from src.app.utils.common.deadline import Deadline, use_deadline
+
+
+logger = logging.getLogger(__name__)
+
+RESULTS = "results.json.gz"
+
+
+def _s3_client():
+    import boto3
+    return boto3.client("s3")
+
+
+def event_city(event: Dict[str, Any], partitions: Optional[CityPartitions] = None):
+    """(country, city) of a raw event, the default city of `partitions` when it has none."""
+    return (partitions or CityPartitions()).resolve(event.get("country_code"), event.get("city_code"))
+
+
+class PrecomputedResults:
+    """One published set of precomputed responses."""
+
+    def __init__(self, data: Dict[str, Any]) -> None:
+        self.data = data
+        self.version = data["version"]
+        self.inputs: Dict[str, Any] = data.get("inputs") or {}
+        self.location_decimals = int(data.get("location_decimals", 3))
+        self.entries: Dict[str, Dict[str, Any]] = data.get("entries") or {}
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def lookup(self, event_data: FilterEvent) -> Optional[Dict[str, Any]]:
+        """A copy of the precomputed response of the request, None if it is not precomputed."""
+        entry = self.entries.get(request_key(event_data, self.location_decimals))
+        return copy.deepcopy(entry["response"]) if entry else None
+
+
+# =============================================================================
+# Precompute job
+# =============================================================================
+def top_requests(records: List[Dict[str, Any]], country: str, city: str, top_n: int,
+                 location_decimals: int = 3, partitions: Optional[CityPartitions] = None) -> List[Dict[str, Any]]:
+    """
+    Most frequent distinct requests of a city in the captured traffic.
+
+    Returns:
+        list: [{"key", "event", "count"}], most frequent first.
+    """
+    counts: Counter = Counter()
+    events: Dict[str, Dict[str, Any]] = {}
+    for record in records:
+        event = record["event"]
+        if event_city(event, partitions) != (country, city) or not (event.get("filter_data") or {}).get("natural_query"):
+            continue
+        key = request_key(FilterEvent.model_validate(event), location_decimals)
+        counts[key] += 1
+        events.setdefault(key, event)
+    return [{"key": key, "event": events[key], "count": count} for key, count in counts.most_common(top_n)]
+
+
+def coverage(records: List[Dict[str, Any]], results: PrecomputedResults, country: str, city: str,
+             partitions: Optional[CityPartitions] = None) -> Dict[str, Any]:
+    """Share of the captured requests of a city that the set answers."""
+    requests = covered = 0
+    for record in records:
+        event = record["event"]
+        if event_city(event, partitions) != (country, city):
+            continue
+        requests += 1
+        if request_key(FilterEvent.model_validate(event), results.location_decimals) in results.entries:
+            covered += 1
+    return {
+        "requests": requests,
+        "covered": covered,
+        "coverage": round(covered / requests, 4) if requests else 0.0,
+        "entries": len(results),
+    }
+
+
+def precompute_city(records: List[Dict[str, Any]], country: str, city: str, top_n: int,
+                    run_pipeline: Callable[[FilterEvent], Dict[str, Any]], inputs: Dict[str, Any],
+                    previous: Optional[PrecomputedResults] = None, location_decimals: int = 3,
+                    max_age_h: Optional[float] = None, partitions: Optional[CityPartitions] = None,
+                    deadline_config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Build the new set of a city, reusing the still valid entries of `previous`.
+
+    Args:
+        records (list): Captured traffic records ({"event", ...}).
+        run_pipeline (callable): Full pipeline, `run_filter_pipeline(event_data)`.
+        inputs (dict): Current versions of the inputs (summaries, embeddings, index).
+        previous (PrecomputedResults): The currently published set, if any.
+        max_age_h (float): Recompute the entries older than this.
+        partitions (CityPartitions): City of the captured requests without a city code.
+        deadline_config (dict): `DEADLINE` config; each request runs under its own
+            deadline, so its fallbacks are flagged in `degraded` as online.
+
+    Returns:
+        dict: {"data": the set to publish, "report": counts and coverage}.
+    """
+    now = time.time()
+    reusable = previous.entries if previous and previous.location_decimals == location_decimals else {}
+    entries: Dict[str, Dict[str, Any]] = {}
+    report = {"reused": 0, "computed": 0, "skipped": 0, "failed": 0}
+
+    for request in top_requests(records, country, city, top_n, location_decimals, partitions):
+        key, event = request["key"], request["event"]
+        old = reusable.get(key)
+        fresh = max_age_h is None or (old and now - old["computed_at"] < max_age_h * 3600)
+        if old and old.get("inputs") == inputs and fresh:
+            entries[key] = {**old, "count": request["count"]}
+            report["reused"] += 1
+            continue
+        try:
+            with use_deadline(Deadline.for_request(deadline_config)):
+                response = run_pipeline(FilterEvent.model_validate(event))
+        except Exception as e:
+            logger.error(f"Could not precompute '{event['filter_data'].get('natural_query')}': {e}")
+            report["failed"] += 1
+            continue
+        if response.get("degraded"):
+            # Never publish a degraded response, it would be served until the next run
+            report["skipped"] += 1
+            continue
+        entries[key] = {
+            "query": normalize_query(event["filter_data"].get("natural_query")),
+            "event": event,
+            "count": request["count"],
+            "computed_at": round(now, 3),
+            "inputs": inputs,
+            "response": response,
+        }
+        report["computed"] += 1
+
+    data = {
+        "version": datetime.utcnow().strftime("%Y%m%dT%H%M%S"),
+        "country": country,
+        "city": city,
+        "location_decimals": location_decimals,
+        "inputs": inputs,
+        "entries": entries,
+    }
+    report.update(coverage(records, PrecomputedResults(data), country, city, partitions))
+    return {"data": data, "report": report}
+
+
+def publish(data: Dict[str, Any], bucket: str, prefix: str = "prc/precomputed") -> str:
+    """Upload a set, then point `latest.json` to it. Returns the version."""
+    s3 = _s3_client()
+    base = f"{prefix.strip('/')}/{data['country']}/{data['city']}"
+    body = gzip.compress(json.dumps(data, default=str, separators=(",", ":")).encode("utf-8"))
+    s3.put_object(Bucket=bucket, Key=f"{base}/{data['version']}/{RESULTS}", Body=body)
+    # The pointer goes last, readers never see a partially uploaded version
+    s3.put_object(Bucket=bucket, Key=f"{base}/latest.json", Body=json.dumps({"version": data["version"]}).encode("utf-8"))
+    return data["version"]
+
+
+# =============================================================================
+# Reader
+# =============================================================================
+class PrecomputedResultsStore:
+    """Latest precomputed set of each city, see module docstring."""
+
+    def __init__(self, bucket: str, prefix: str = "prc/precomputed", pointer_ttl_s: float = 300.0,
+                 location_decimals: int = 3, index_version: Optional[str] = None) -> None:
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.pointer_ttl_s = pointer_ttl_s
+        self.location_decimals = location_decimals
+        self.index_version = index_version
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self._sets: Dict[tuple, PrecomputedResults] = {}
+        self._checked_at: Dict[tuple, float] = {}
+        self._city_locks: Dict[tuple, threading.Lock] = {}
+        self._refreshing: set = set()
+        self._lock = threading.Lock()
+        self._s3 = None
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]], default_bucket: Optional[str] = None) -> Optional["PrecomputedResultsStore"]:
+        """The store, or None when the precomputed results are disabled."""
+        config = config or {}
+        if not config.get("ENABLED", False):
+            return None
+        return cls(
+            bucket=config.get("BUCKET") or default_bucket,
+            prefix=config.get("PREFIX", "prc/precomputed"),
+            pointer_ttl_s=float(config.get("POINTER_TTL_S", 300)),
+            location_decimals=int(config.get("LOCATION_DECIMALS", 3)),
+            index_version=config.get("INDEX_VERSION"),
+        )
+
+    def _client(self):
+        if self._s3 is None:
+            self._s3 = _s3_client()
+        return self._s3
+
+    def _download(self, country: str, city: str, version: str) -> PrecomputedResults:
+        key = f"{self.prefix}/{country}/{city}/{version}/{RESULTS}"
+        body = self._client().get_object(Bucket=self.bucket, Key=key)["Body"].read()
+        results = PrecomputedResults(json.loads(gzip.decompress(body)))
+        logger.info(f"Loaded {len(results)} precomputed results {version} of {country}/{city}")
+        return results
+
+    def _cached(self, key: tuple):
+        """(loaded set, whether the pointer of the city was checked within the TTL)."""
+        with self._lock:
+            checked_at = self._checked_at.get(key)
+            return self._sets.get(key), checked_at is not None and time.monotonic() - checked_at < self.pointer_ttl_s
+
+    def _city_lock(self, key: tuple) -> threading.Lock:
+        with self._lock:
+            return self._city_locks.setdefault(key, threading.Lock())
+
+    def _load(self, key: tuple) -> Optional[PrecomputedResults]:
+        """Check the pointer of a city and download its set when it changed. Runs under the lock of the city."""
+        results, fresh = self._cached(key)
+        if fresh:
+            return results
+        country, city = key
+        try:
+            pointer = self._client().get_object(Bucket=self.bucket, Key=f"{self.prefix}/{country}/{city}/latest.json")
+            version = json.loads(pointer["Body"].read())["version"]
+            if results is None or results.version != version:
+                results = self._download(country, city, version)
+                with self._lock:
+                    self._sets[key] = results
+        except Exception as e:
+            logger.error(f"Could not load the precomputed results of {country}/{city}: {e}")
+        with self._lock:
+            self._checked_at[key] = time.monotonic()
+        return results
+
+    def _refresh(self, key: tuple) -> None:
+        try:
+            with self._city_lock(key):
+                self._load(key)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def get(self, country: str, city: str, wait: bool = True) -> Optional[PrecomputedResults]:
+        """
+        The set of the city, None when it has none.
+
+        Args:
+            wait (bool): Check the pointer (and download a new set) in this thread.
+                Without waiting (the request path), the check runs in the background
+                and the loaded set, if any, is returned meanwhile.
+        """
+        key = (country, city)
+        results, fresh = self._cached(key)
+        if fresh:
+            return results
+        if wait:
+            with self._city_lock(key):
+                return self._load(key)
+        with self._lock:
+            if key in self._refreshing:
+                return results
+            self._refreshing.add(key)
+        threading.Thread(target=self._refresh, args=(key,), name=f"precomputed-{country}-{city}", daemon=True).start()
+        return results
+
+    def lookup(self, event_data: FilterEvent, city: Tuple[str, str],
+               inputs: Callable[[], Optional[Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+        """
+        The precomputed response of the request of `city` ((country, city)),
+        None when it is not precomputed or was computed from other inputs.
+
+        Args:
+            inputs (callable): Current versions of the inputs, only called on a
+                hit. Returns None when they are not known yet (not loaded).
+        """
+        # Never waits on S3: a city whose set is not loaded yet has no match meanwhile
+        results = self.get(*city, wait=False)
+        response = results.lookup(event_data) if results else None
+        current = inputs() if response is not None else None
+        with self._lock:
+            if response is not None and results.inputs != current:
+                self.stale += 1
+                response = None
+            if response is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return response
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "cities": len(self._sets),
+                "entries": sum(len(results) for results in self._sets.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Precompute the results of the most popular searches of a city")
+    parser.add_argument("capture", help="Captured traffic (JSON lines of the file mode or exported log lines)")
+    parser.add_argument("--country", default="es")
+    parser.add_argument("--city", required=True)
+    parser.add_argument("--top", type=int, default=200, help="Number of distinct requests to precompute")
+    parser.add_argument("--max-age-h", type=float, default=None, help="Recompute the entries older than this")
+    parser.add_argument("--force", action="store_true", help="Recompute every entry")
+    parser.add_argument("--no-upload", action="store_true")
+    parser.add_argument("--output", default=None, help="Write the report as JSON")
+    args = parser.parse_args(argv)
+
+    from src.app.monitoring.traffic_capture import read_capture
+
+    ## The real pipeline, with the deployment config
+    import src.aws.filterer_flow_handler as handler
+
+    store = handler.precomputed_results or PrecomputedResultsStore.from_config(
+        {**(handler.config.get("PRECOMPUTED_RESULTS") or {}), "ENABLED": True}, default_bucket=handler.SUMMARY_BUCKET)
+    records = read_capture(args.capture)
+    previous = None if args.force else store.get(args.country, args.city)
+    result = precompute_city(
+        records, args.country, args.city, args.top,
+        run_pipeline=handler.run_filter_pipeline,
+        inputs=handler.precompute_inputs(args.country, args.city, load=True),
+        previous=previous,
+        location_decimals=store.location_decimals,
+        max_age_h=args.max_age_h,
+        partitions=handler.city_partitions,
+        deadline_config=handler.DEADLINE_CONFIG,
+    )
+    report = result["report"]
+    if not args.no_upload and (report["computed"] or previous is None):
+        report["version"] = publish(result["data"], store.bucket, store.prefix)
+
+    print(f"{args.country}/{args.city}: {report['entries']} entries ({report['computed']} computed, "
+          f"{report['reused']} reused, {report['skipped']} degraded, {report['failed']} failed), "
+          f"coverage {report['coverage']:.1%} of {report['requests']} captured requests")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+Token-budgeted compaction of the business blocks of the reranking prompt.
+
+`format_business_metadata` includes the whole `business_summary` and every
+listed dish, so the reranking prompt (and the LLM latency) grows with each
+business. The compactor fits each block into a per-business token budget:
+the identity, cuisine and price lines are always kept, then the summary
+sentences and dishes are added by lexical overlap with the query (most
+relevant first), then the remaining summary sentences in their original
+order, until the budget is spent. Kept sentences stay in their original
+order, so the summary still reads naturally.
+
+Tokens are counted with `tiktoken` when it is installed, with a ~4
+characters per token estimate otherwise.
+
+Config (`RERANK_COMPACTION` key):
+    ENABLED (default false), TOKENS_PER_BUSINESS (default 200),
+    ENCODING (tiktoken encoding, default cl100k_base).
+"""
+import re
+import logging
+import threading
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Tuple
+
+from src.app.services.business_formatter import format_business_metadata
+
+
+logger = logging.getLogger(__name__)
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_STOPWORDS = frozenset(
+    "a an and are as at be best by for from good great i in is it me near of on or place places "
+    "restaurant restaurants some the to want we where with".split()
+)
+_STEM_CHARS = 5  # "pizzas" and "pizzeria" both match "pizza"
+
+
+@lru_cache(maxsize=4)
+def _encoding(name: str):
+    try:
+        import tiktoken
+    except ImportError:
+        logger.info("tiktoken is not installed, estimating tokens from the text length")
+        return None
+    return tiktoken.get_encoding(name)
+
+
+def count_tokens(text: str, encoding: str = "cl100k_base") -> int:
+    """Tokens of `text`, estimated when tiktoken is not available."""
+    tokenizer = _encoding(encoding)
+    if tokenizer is None:
+        return (len(text) + 3) // 4
+    return len(tokenizer.encode(text, disallowed_special=()))
+
+
+def _terms(text: str) -> set:
+    return {word[:_STEM_CHARS] for word in _WORD_RE.findall(text.lower()) if word not in _STOPWORDS and len(word) > 2}
+
+
+def _dishes(value) -> List[str]:
+    ## Same formats as `format_business_metadata`
+    if isinstance(value, dict):
+        return list(value.keys())
+    return list(value or [])
+
+
+class PromptCompactor:
+    """Fits business blocks into a token budget, see module docstring."""
+
+    def __init__(self, tokens_per_business: int = 200, encoding: str = "cl100k_base") -> None:
+        self.tokens_per_business = tokens_per_business
+        self.encoding = encoding
+        self.businesses = 0
+        self.compacted = 0
+        self.tokens_before = 0
+        self.tokens_after = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]]) -> Optional["PromptCompactor"]:
+        """The compactor, or None when the compaction is disabled."""
+        config = config or {}
+        if not config.get("ENABLED", False):
+            return None
+        return cls(
+            tokens_per_business=int(config.get("TOKENS_PER_BUSINESS", 200)),
+            encoding=config.get("ENCODING", "cl100k_base"),
+        )
+
+    def _tokens(self, text: str) -> int:
+        return count_tokens(text, self.encoding)
+
+    def compact(self, business: Dict[str, Any], query: str) -> Tuple[str, int, int]:
+        """
+        Args:
+            business (dict): Business metadata, as given to `format_business_metadata`.
+            query (str): The (translated) user query.
+
+        Returns:
+            tuple: (formatted block, tokens of the full block, tokens of the compacted block).
+        """
+        full = format_business_metadata(business)
+        full_tokens = self._tokens(full)
+        if full_tokens <= self.tokens_per_business:
+            return full, full_tokens, full_tokens
+
+        sentences = [s for s in _SENTENCE_RE.split(business.get("business_summary") or "") if s.strip()]
+        must_try = _dishes(business.get("must_try"))
+        must_avoid = _dishes(business.get("must_avoid"))
+        skeleton = {**business, "business_summary": "", "must_try": [], "must_avoid": []}
+        budget = self.tokens_per_business - self._tokens(format_business_metadata(skeleton))
+
+        # (field, position, text): query-relevant pieces first, then the summary in order
+        query_terms = _terms(query or "")
+        pieces = [("summary", i, s) for i, s in enumerate(sentences)]
+        pieces += [("must_try", i, d) for i, d in enumerate(must_try)]
+        pieces += [("must_avoid", i, d) for i, d in enumerate(must_avoid)]
+        overlap = {piece: len(query_terms & _terms(piece[2])) for piece in pieces}
+        ranked = sorted(
+            (piece for piece in pieces if overlap[piece] or piece[0] == "summary"),
+            key=lambda piece: (-overlap[piece], piece[0] != "summary", piece[1]),
+        )
+
+        kept: Dict[str, List[Tuple[int, str]]] = {"summary": [], "must_try": [], "must_avoid": []}
+        for field, position, text in ranked:
+            cost = self._tokens(text) + 1  # the separator
+            if cost > budget:
+                continue
+            kept[field].append((position, text))
+            budget -= cost
+
+        compacted = format_business_metadata({
+            **business,
+            "business_summary": " ".join(text for _, text in sorted(kept["summary"])) or "No summary available.",
+            "must_try": [text for _, text in sorted(kept["must_try"])],
+            "must_avoid": [text for _, text in sorted(kept["must_avoid"])],
+        })
+        return compacted, full_tokens, self._tokens(compacted)
+
+    def compact_all(self, businesses: List[Dict[str, Any]], query: str) -> Tuple[List[str], int]:
+        """
+        Compacted blocks of every business.
+
+        Returns:
+            tuple: (formatted blocks, tokens saved).
+        """
+        blocks, before, after, compacted = [], 0, 0, 0
+        for business in businesses:
+            block, full_tokens, tokens = self.compact(business, query)
+            blocks.append(block)
+            before += full_tokens
+            after += tokens
+            compacted += tokens < full_tokens
+        with self._lock:
+            self.businesses += len(businesses)
+            self.compacted += compacted
+            self.tokens_before += before
+            self.tokens_after += after
+        return blocks, before - after
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "businesses": self.businesses,
+                "compacted": self.compacted,
+                "tokens_before": self.tokens_before,
+                "tokens_after": self.tokens_after,
+                "tokens_saved": self.tokens_before - self.tokens_after,
+                "saved_ratio": round(1 - self.tokens_after / self.tokens_before, 4) if self.tokens_before else 0.0,
+            }
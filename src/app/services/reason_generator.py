@@ -0,0 +1,129 @@
+"""
+On-demand reasons of the reranked results.
+
+In score-only rerank mode (`RERANK.MODE: score_only`) the reranker returns
+no reasons, which keeps its output to a few tokens per business. The user
+only reads the reasons of the cards on screen, so they are generated here,
+for the visible business ids only: one small LLM call per business, all in
+parallel, cached per (normalized query, business id).
+
+Config (`REASONS` key):
+    MAX_WORKERS (default 6), CACHE_SIZE (default 4096), TTL_S (default 3600).
+"""
+import time
+import logging
+import threading
+import contextvars
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+
+from src.app.monitoring.tracing import span
+from src.app.services.business_formatter import format_business_metadata
+from src.app.services.request_key import normalize_query
+from src.app.utils.common.resilience import resilient_call, LLM
+
+
+logger = logging.getLogger(__name__)
+
+
+class ReasonGenerator:
+    """Generates and caches the reason of each (query, business), see module docstring."""
+
+    def __init__(self, reason_chain, opik_tracer=None, max_workers: int = 6, cache_size: int = 4096,
+                 ttl_s: float = 3600.0) -> None:
+        """
+        Args:
+            reason_chain: Runnable `{"input", "business"} -> {"reason"}`.
+            opik_tracer: Callback handler of the LLM calls.
+            max_workers (int): Concurrent LLM calls.
+            cache_size (int): Cached reasons.
+            ttl_s (float): Lifetime of a cached reason.
+        """
+        self.reason_chain = reason_chain
+        self.opik_tracer = opik_tracer
+        self.cache_size = cache_size
+        self.ttl_s = ttl_s
+        self.hits = 0
+        self.misses = 0
+        self._cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="reasons")
+
+    def _cached(self, key: tuple) -> Optional[str]:
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                self.misses += 1
+                return None
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def _store(self, key: tuple, reason: str) -> None:
+        with self._lock:
+            self._cache[key] = (reason, time.monotonic() + self.ttl_s)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _generate(self, query: str, metadata: Dict[str, Any]) -> str:
+        business_id = metadata.get("business_id")
+        with span("reason", business_id=business_id):
+            config = {"callbacks": [self.opik_tracer]} if self.opik_tracer else None
+            result = resilient_call(
+                LLM, self.reason_chain.invoke,
+                {"input": query, "business": format_business_metadata(metadata)}, config=config,
+            )
+        return result["reason"]
+
+    def reasons(self, query: str, businesses: List[Dict[str, Any]]) -> Dict[str, Optional[str]]:
+        """
+        Args:
+            query (str): The user query.
+            businesses (list): Business metadata (`business_id`, summary, dishes...) of the visible results.
+
+        Returns:
+            dict: Reason of each business id, None when it could not be generated.
+
+        Raises:
+            Exception: The last generation error when no reason could be
+            generated nor read from the cache (e.g. `CircuitOpenError` with the LLM down).
+        """
+        normalized = normalize_query(query)
+        reasons: Dict[str, Optional[str]] = {}
+        pending = {}
+        for metadata in businesses:
+            business_id = metadata.get("business_id")
+            reason = self._cached((normalized, business_id))
+            if reason is not None:
+                reasons[business_id] = reason
+            elif business_id not in pending:
+                # Each task runs in a copy of the caller context: trace, span and deadline
+                pending[business_id] = self._executor.submit(
+                    contextvars.copy_context().run, self._generate, query, metadata
+                )
+
+        error = None
+        for business_id, future in pending.items():
+            try:
+                reasons[business_id] = future.result()
+                self._store((normalized, business_id), reasons[business_id])
+            except Exception as e:
+                logger.error(f"Could not generate the reason of {business_id}: {e}")
+                reasons[business_id] = None
+                error = e
+        if error is not None and not any(reasons.values()):
+            # Nothing to show: an outage, not a 200 full of None
+            raise error
+        return reasons
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "cached": len(self._cache),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
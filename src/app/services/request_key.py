@@ -0,0 +1,47 @@
+"""
+Canonical key of a filter request.
+
+Two requests get the same key when they are bound to return the same
+results: same normalized query, filters, search type, city and location
+bucket. Used to coalesce identical in-flight requests.
+"""
+import re
+import json
+import hashlib
+from typing import Optional
+
+from src.app.schemas.data_models import FilterEvent
+
+
+def normalize_query(query: Optional[str]) -> str:
+    """Lowercase, trim and collapse the whitespace and trailing punctuation of a query."""
+    query = re.sub(r"\s+", " ", (query or "").lower()).strip()
+    return query.rstrip("?!. ")
+
+
+def request_key(event_data: FilterEvent, location_decimals: int = 4) -> str:
+    """
+    Args:
+        event_data (FilterEvent): The validated request.
+        location_decimals (int): Decimals of lat/lng kept in the key (4 is ~10m).
+
+    Returns:
+        str: Hex digest identifying the request.
+    """
+    filter_data = event_data.filter_data
+    location = None
+    if filter_data.location is not None:
+        location = [round(filter_data.location.lat, location_decimals), round(filter_data.location.lng, location_decimals)]
+
+    canonical = {
+        "query": normalize_query(filter_data.natural_query),
+        "filters": filter_data.filters or {},
+        "global_fields": sorted(filter_data.global_fields or []),
+        "location": location,
+        "radius": filter_data.radius,
+        "filter_type": (event_data.filter_type or "").lower(),
+        "city_code": (event_data.city_code or "").lower(),
+        "country_code": (event_data.country_code or "").lower(),
+    }
+    payload = json.dumps(canonical, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
@@ -4,8 +4,28 @@ In this file we define a client that uses the LCEL (LangChain Expression Languag
 methodology to define a conversation pipeline. In this way, the method is more customizable,
 allowing to evaluate and trace each component separately.
 """
+import time
+import asyncio
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeout
+from contextlib import nullcontext
+from typing import Dict, List, Optional
+from typing_extensions import TypedDict
+
 from langchain_core.runnables import RunnableLambda, RunnableBranch, RunnablePassthrough
 
+from src.app.monitoring.tracing import span
+from src.app.services.prompt_compactor import count_tokens
+from src.app.utils.common.lazy_import import lazy_import
+from src.app.utils.common.concurrency_limiter import get_limiter
+from src.app.utils.common.deadline import current_deadline, DeadlineExceeded
+from src.app.utils.common.resilience import is_retryable, get_retry_policy, CircuitOpenError, LLM
+
+langgraph_graph = lazy_import("langgraph.graph")
+
+logger = logging.getLogger(__name__)
+
 
 
 
@@ -18,11 +38,15 @@ class RerankingChain:
             scoring_prompt,
             llm,
             opik_tracer,
-            logger=None
+            logger=None,
+            score_only=False
         ) -> None:
 
         """
         Initialize the RAG system with retriever and LLM
+
+        score_only: the LLM answers {"scores": {business_id: score}} (no reasons),
+        see `reranker_score_schema`; reasons are generated on demand by `ReasonGenerator`.
         """
         # Initialize all resources:
         # self.db = initializer.get_vector_db()
@@ -30,27 +54,56 @@ class RerankingChain:
         self.opik_tracer = opik_tracer
         self.scoring_prompt = scoring_prompt
         self.llm = llm
+        self.score_only = score_only
+        self.max_concurrency = None  # Parallel chunks, unbounded
+        self.limiter = None  # Process-wide bound of the chunk calls, see `RerankingGraph`
+        self.max_attempts = 1  # Attempts of a chunk, retries included
+
 
 
+    @staticmethod
+    def chunk_scores(group_result):
+        """Business scores of a chunk answer, in either output schema."""
+        if "scores" in group_result:
+            return [
+                {"business_id": business_id, "score": score, "reason": None}
+                for business_id, score in group_result["scores"].items()
+            ]
+        return group_result["business_scores"]
 
     def merge_results(self):
         def _merge(results_dict):
             all_results = []
             for group_result in results_dict.values():
-                all_results.extend(group_result["business_scores"])
+                all_results.extend(self.chunk_scores(group_result))
             # Sort businesses by score in descending order
             sorted_businesses = sorted(all_results, key=lambda x: x["score"], reverse=True)
             return {"sorted_businesses": sorted_businesses}
         return RunnableLambda(_merge)
 
 
+    def traced_chunk(self, chain, chunk_index, chunk_size):
+        """Wraps the chain of a chunk so each one shows up as its own span."""
+        def _score(inputs):
+            slot = self.limiter.slot(current_deadline().timeout("rerank")) if self.limiter else nullcontext()
+            with slot, span("rerank_chunk", chunk=chunk_index, businesses=chunk_size):
+                return chain.invoke(inputs)
+        return RunnableLambda(_score)
+
+    def split(self, business):
+        """Split the formatted businesses into chunks of 5"""
+        return [business[i:i + 5] for i in range(0, len(business), 5)]
+
+    def chunk_chain(self, chunk):
+        """Scoring chain of one chunk of formatted businesses."""
+        return self.scoring_prompt.partial(business=chunk) | self.llm
+
     def set_rag_pipeline(self, business):
         """_summary_
         """
-        # Split the list into chunks of 5
-        chunks = [business[i:i + 5] for i in range(0, len(business), 5)]
+        chunks = self.split(business)
         parallel_chains = {
-            f"group_{i}": self.scoring_prompt.partial(business=chunk) | self.llm
+            f"group_{i}": self.traced_chunk(self.chunk_chain(chunk), i, len(chunk))
             for i, chunk in enumerate(chunks)
         }
 
@@ -59,3 +112,223 @@ class RerankingChain:
         return main_chain.with_config(
             {"callbacks": [self.opik_tracer]}
         )
+
+    @staticmethod
+    def retryable_chunk_error(error):
+        """Whether a chunk that failed with `error` is worth scoring again."""
+        # Output parsing errors (ValueError) are worth another sample, a closed budget or circuit is not
+        if isinstance(error, (DeadlineExceeded, CircuitOpenError)):
+            return False
+        return is_retryable(error) or isinstance(error, ValueError)
+
+    @staticmethod
+    def retry_budget_left():
+        """Whether the request can still afford a retry of its failed chunks."""
+        delay_ms = get_retry_policy(LLM).max_delay_s * 1000
+        return current_deadline().remaining_ms() >= delay_ms and not current_deadline().should_degrade("rerank")
+
+    def _stream_chunk(self, index, chunk, query, config):
+        """Scores a chunk of `stream_scores`, retrying it like the graph does."""
+        attempt = 1
+        while True:
+            try:
+                return self.traced_chunk(self.chunk_chain(chunk), index, len(chunk)).invoke({"input": query}, config)
+            except Exception as e:
+                if attempt >= self.max_attempts or not self.retryable_chunk_error(e) or not self.retry_budget_left():
+                    raise
+                logger.warning(f"Rerank chunk {index} failed (attempt {attempt}): {type(e).__name__}: {e}")
+                time.sleep(get_retry_policy(LLM).delay(attempt))
+                attempt += 1
+
+    def _chunk_outcome(self, future):
+        """Business scores of a finished chunk, or its exception."""
+        try:
+            return self.chunk_scores(future.result())
+        except Exception as e:
+            return e
+
+    def stream_scores(self, business, query):
+        """
+        Scores the chunks in parallel and yields `(chunk_index, business_scores)`
+        as each one completes, so results can be refined progressively.
+        A failed chunk yields its exception instead of the scores, and the
+        chunks still running when the rerank stage times out yield
+        `DeadlineExceeded`.
+        """
+        chunks = self.split(business)
+        if not chunks:
+            return
+        config = {"callbacks": [self.opik_tracer]}
+        timeout = current_deadline().timeout("rerank")
+        max_workers = min(len(chunks), self.max_concurrency or len(chunks))
+        executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="rerank")
+        futures = {
+            executor.submit(contextvars.copy_context().run, self._stream_chunk, i, chunk, query, config): i
+            for i, chunk in enumerate(chunks)
+        }
+        pending = dict(futures)
+        try:
+            for future in as_completed(futures, timeout=timeout):
+                yield pending.pop(future), self._chunk_outcome(future)
+        except FuturesTimeout:
+            for future, index in sorted(pending.items(), key=lambda item: item[1]):
+                if future.done():
+                    yield index, self._chunk_outcome(future)
+                else:
+                    yield index, DeadlineExceeded(f"Rerank chunk {index} not scored within {timeout:.2f}s")
+        finally:
+            # The chunks still running finish in the background, their slots are released then
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+class RerankState(TypedDict):
+    input: str
+    business: List[str]
+    chunks: Optional[List[List[str]]]
+    pending: Optional[List[int]]
+    scores: Optional[Dict[int, list]]
+    errors: Optional[Dict[int, str]]
+    last_error: Optional[BaseException]
+    attempt: Optional[int]
+    sorted_businesses: Optional[list]
+
+
+class RerankingGraph(RerankingChain):
+    """
+    Async reranking graph: split -> score -> (score the failed chunks again) -> merge.
+
+    The chunks are sized by a token budget instead of a fixed 5 businesses, so
+    long summaries do not blow the context and short ones are not wasted on
+    extra calls. At most `max_concurrency` chunks are scored at the same time
+    across the whole process (the "rerank" `ConcurrencyLimiter`, shared by
+    every request, batch item and stream, tuned to the rate limits of the
+    provider), and only the failed chunks are
+    scored again, up to `max_attempts`. The output keeps the `sorted_businesses`
+    contract of `RerankingChain`; the businesses of chunks that still failed
+    are left out (see `failed_chunks`).
+    """
+    def __init__(
+            self,
+            scoring_prompt,
+            llm,
+            opik_tracer,
+            logger=None,
+            score_only=False,
+            chunk_tokens=1500,
+            max_chunk_size=8,
+            max_concurrency=4,
+            max_attempts=2,
+            encoding="cl100k_base"
+        ) -> None:
+        """
+        Args:
+            chunk_tokens (int): Token budget of the businesses of a chunk.
+            max_chunk_size (int): Businesses per chunk at most (the answer grows with them).
+            max_concurrency (int): Chunks scored at the same time, process-wide.
+            max_attempts (int): Attempts of a chunk, retries included.
+            encoding (str): tiktoken encoding used to count the tokens.
+        """
+        super().__init__(scoring_prompt, llm, opik_tracer, logger=logger, score_only=score_only)
+        self.chunk_tokens = chunk_tokens
+        self.max_chunk_size = max_chunk_size
+        self.max_concurrency = max_concurrency
+        self.limiter = get_limiter("rerank", max_concurrency)
+        self.max_attempts = max_attempts
+        self.encoding = encoding
+
+        process = langgraph_graph.StateGraph(RerankState)
+        # --- Define Nodes ---
+        process.add_node("split", self.split_chunks)
+        process.add_node("score", self.score_chunks)
+        process.add_node("merge", self.merge_chunks)
+
+        process.set_entry_point("split")
+        process.add_edge("split", "score")
+        # Loop on "score" while some chunks failed and may be retried
+        process.add_conditional_edges("score", self.route_retry, {"retry": "score", "merge": "merge"})
+        process.add_edge("merge", langgraph_graph.END)
+
+        self.graph = process.compile()
+
+    def build(self):
+        """The compiled graph, to run with `ainvoke({"input": query, "business": formatted})`."""
+        return self.graph.with_config({"callbacks": [self.opik_tracer]})
+
+    def split(self, business):
+        """
+        Greedy split in order: a chunk is closed when the next business would
+        exceed `chunk_tokens` or `max_chunk_size`. A business larger than the
+        budget gets a chunk of its own.
+        """
+        chunks, chunk, tokens = [], [], 0
+        for text in business:
+            text_tokens = count_tokens(text, self.encoding)
+            if chunk and (tokens + text_tokens > self.chunk_tokens or len(chunk) >= self.max_chunk_size):
+                chunks.append(chunk)
+                chunk, tokens = [], 0
+            chunk.append(text)
+            tokens += text_tokens
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
+    # -------------------------------------------------------------------------
+    # Nodes
+    # -------------------------------------------------------------------------
+    def split_chunks(self, state):
+        chunks = self.split(state["business"])
+        return {"chunks": chunks, "pending": list(range(len(chunks))), "scores": {}, "errors": {}, "last_error": None, "attempt": 0}
+
+    async def _score_chunk(self, index, chunk, query, attempt, config):
+        async with self.limiter.slot_async(current_deadline().timeout("rerank")):
+            with span("rerank_chunk", chunk=index, businesses=len(chunk), attempt=attempt):
+                return await asyncio.wait_for(
+                    self.chunk_chain(chunk).ainvoke({"input": query}, config),
+                    timeout=current_deadline().timeout("rerank"),
+                )
+
+    async def score_chunks(self, state, config=None):
+        attempt = state["attempt"] + 1
+        if attempt > 1:
+            await asyncio.sleep(get_retry_policy(LLM).delay(attempt - 1))
+        pending = state["pending"]
+        results = await asyncio.gather(
+            *(self._score_chunk(i, state["chunks"][i], state["input"], attempt, config) for i in pending),
+            return_exceptions=True,
+        )
+
+        scores, errors, failed = dict(state["scores"]), dict(state["errors"]), []
+        last_error = state.get("last_error")
+        for index, result in zip(pending, results):
+            if isinstance(result, Exception):
+                logger.warning(f"Rerank chunk {index} failed (attempt {attempt}): {type(result).__name__}: {result}")
+                errors[index] = f"{type(result).__name__}: {result}"
+                last_error = result
+                if self.retryable_chunk_error(result):
+                    failed.append(index)
+                continue
+            scores[index] = self.chunk_scores(result)
+            errors.pop(index, None)
+        return {"scores": scores, "errors": errors, "last_error": last_error, "pending": failed, "attempt": attempt}
+
+    def route_retry(self, state):
+        if not state["pending"] or state["attempt"] >= self.max_attempts:
+            return "merge"
+        return "retry" if self.retry_budget_left() else "merge"
+
+    def merge_chunks(self, state):
+        if state["chunks"] and not state["scores"]:
+            # The chunk error itself, so the LLM breaker and the retries classify the real failure
+            summary = RuntimeError(f"Every rerank chunk failed: {'; '.join(state['errors'].values())}")
+            raise state["last_error"] from summary
+        all_results = []
+        for index in sorted(state["scores"]):
+            all_results.extend(state["scores"][index])
+        # Sort businesses by score in descending order
+        sorted_businesses = sorted(all_results, key=lambda x: x["score"], reverse=True)
+        return {"sorted_businesses": sorted_businesses}
+
+    @staticmethod
+    def failed_chunks(result):
+        """Chunk index -> last error of the chunks left out of a graph result."""
+        return dict(result.get("errors") or {})
@@ -0,0 +1,199 @@
+"""
+Whole-response cache of the search pipeline.
+
+Keyed on the canonical request (`request_key`: normalized query, filters,
+search type, city, global fields and the location rounded to a grid cell),
+so a repeated search is answered without the LLM or any backend. Responses
+are stored as compressed JSON, within a memory budget (least recently used
+entries are evicted first) and a TTL. Degraded responses are never cached.
+
+Every entry belongs to a city and is dropped when that city gets new
+summaries: when a newer summary daterange shows up in the filter service
+results (`observe_daterange`), or when a new summary shard is published
+(`invalidate_city`, hooked to the shard store).
+
+The entries are partitioned per city, each with its own LRU order and
+memory quota: a city over its quota only evicts its own entries, and when
+the whole cache is full the city most over its quota gives way first, so
+the traffic of a new city does not evict the warm entries of the others.
+
+Config (`RESPONSE_CACHE` key):
+    ENABLED (default false), TTL_S (default 600), MAX_MB (default 64),
+    LOCATION_DECIMALS (default 3, ~100m cells), COMPRESSION_LEVEL (default 6),
+    CITY_MAX_MB: Quota of each city, e.g. {"es/vlc": 48, "es/mad": 32}.
+    DEFAULT_CITY_MAX_MB: Quota of the other cities (default MAX_MB).
+"""
+import time
+import zlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+from src.app.utils.common import json_codec
+
+
+logger = logging.getLogger(__name__)
+
+
+class _Entry:
+    __slots__ = ("city", "blob", "expires_at")
+
+    def __init__(self, city: str, blob: bytes, expires_at: float) -> None:
+        self.city = city
+        self.blob = blob
+        self.expires_at = expires_at
+
+
+class _Partition:
+    """Entries of one city, least recently used first."""
+    __slots__ = ("city", "entries", "size_bytes")
+
+    def __init__(self, city: str) -> None:
+        self.city = city
+        self.entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self.size_bytes = 0
+
+
+class ResponseCache:
+    """LRU cache of compressed responses, see module docstring."""
+
+    def __init__(self, ttl_s: float = 600.0, max_bytes: int = 64 * 1024 * 1024, compression_level: int = 6,
+                 location_decimals: int = 3, city_max_bytes: Optional[Dict[str, int]] = None,
+                 default_city_max_bytes: Optional[int] = None) -> None:
+        self.ttl_s = ttl_s
+        self.max_bytes = max_bytes
+        self.compression_level = compression_level
+        self.location_decimals = location_decimals
+        self.city_max_bytes = city_max_bytes or {}
+        self.default_city_max_bytes = default_city_max_bytes or max_bytes
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._partitions: Dict[str, _Partition] = {}
+        self._city_of: Dict[str, str] = {}
+        self._dateranges: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]]) -> Optional["ResponseCache"]:
+        """The cache, or None when it is disabled."""
+        config = config or {}
+        if not config.get("ENABLED", False):
+            return None
+        return cls(
+            ttl_s=float(config.get("TTL_S", 600)),
+            max_bytes=int(float(config.get("MAX_MB", 64)) * 1024 * 1024),
+            compression_level=int(config.get("COMPRESSION_LEVEL", 6)),
+            location_decimals=int(config.get("LOCATION_DECIMALS", 3)),
+            city_max_bytes={city: int(float(mb) * 1024 * 1024) for city, mb in (config.get("CITY_MAX_MB") or {}).items()},
+            default_city_max_bytes=int(float(config["DEFAULT_CITY_MAX_MB"]) * 1024 * 1024)
+            if config.get("DEFAULT_CITY_MAX_MB") else None,
+        )
+
+    def quota(self, city: str) -> int:
+        """Memory quota of a city, in bytes."""
+        return min(self.city_max_bytes.get(city, self.default_city_max_bytes), self.max_bytes)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """A fresh copy of the cached response, None on a miss."""
+        raw = self.get_raw(key)
+        return json_codec.loads(raw) if raw is not None else None
+
+    def get_raw(self, key: str) -> Optional[bytes]:
+        """The cached response as JSON bytes, for callers that send it as is."""
+        with self._lock:
+            city = self._city_of.get(key)
+            entry = self._partitions[city].entries.get(key) if city is not None else None
+            if entry is not None and entry.expires_at <= time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._partitions[city].entries.move_to_end(key)
+            self.hits += 1
+            blob = entry.blob
+        return zlib.decompress(blob)
+
+    def put(self, key: str, city: str, response: Dict[str, Any]) -> bool:
+        """Cache a response, unless it was degraded or does not fit the budget."""
+        if response.get("degraded"):
+            return False
+        blob = zlib.compress(json_codec.dumps(response), self.compression_level)
+        if len(blob) > self.quota(city):
+            return False
+        with self._lock:
+            if key in self._city_of:
+                self._remove(key)
+            partition = self._partitions.setdefault(city, _Partition(city))
+            partition.entries[key] = _Entry(city, blob, time.monotonic() + self.ttl_s)
+            partition.size_bytes += len(blob)
+            self._city_of[key] = city
+            self.size_bytes += len(blob)
+            # Over its quota, the city evicts its own entries
+            while partition.size_bytes > self.quota(city):
+                self._evict(partition)
+            # Over the whole budget, the city most over its quota evicts first
+            while self.size_bytes > self.max_bytes:
+                self._evict(max(
+                    (p for p in self._partitions.values() if p.entries),
+                    key=lambda p: p.size_bytes / self.quota(p.city),
+                ))
+        return True
+
+    def _evict(self, partition: _Partition) -> None:
+        self._remove(next(iter(partition.entries)))
+        self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        city = self._city_of.pop(key)
+        partition = self._partitions[city]
+        entry = partition.entries.pop(key)
+        partition.size_bytes -= len(entry.blob)
+        self.size_bytes -= len(entry.blob)
+        if not partition.entries:
+            del self._partitions[city]
+
+    def invalidate_city(self, city: str) -> int:
+        """Drop every response of a city. Returns the number of dropped entries."""
+        with self._lock:
+            partition = self._partitions.get(city)
+            keys = list(partition.entries) if partition else []
+            for key in keys:
+                self._remove(key)
+            self.invalidations += len(keys)
+        if keys:
+            logger.info(f"Invalidated {len(keys)} cached responses of {city}")
+        return len(keys)
+
+    def observe_daterange(self, city: str, date_range: Optional[str]) -> None:
+        """
+        Record the newest summary daterange seen for a city; a newer one than
+        before means new summaries were published, so its responses are stale.
+        """
+        if not date_range:
+            return
+        date_range = str(date_range)
+        with self._lock:
+            known = self._dateranges.get(city)
+            self._dateranges[city] = max(known or date_range, date_range)
+        if known is not None and date_range > known:
+            self.invalidate_city(city)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._city_of),
+                "size_bytes": self.size_bytes,
+                "cities": {city: {"entries": len(p.entries), "size_bytes": p.size_bytes, "quota_bytes": self.quota(city)}
+                           for city, p in self._partitions.items()},
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
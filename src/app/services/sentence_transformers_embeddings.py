@@ -1,14 +1,134 @@
 import os
+import time
+import queue
 import requests
 import logging
-from typing import List
-from langchain.embeddings.base import Embeddings  # or wherever Embeddings is imported from
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import List, Dict, Any, Optional
+from langchain_core.embeddings import Embeddings  # same class, without importing the whole langchain package
+
+from src.app.monitoring.tracing import LatencyHistogram, current_span
+from src.app.utils.common.deadline import current_deadline, DeadlineExceeded
+from src.app.utils.common.hedging import get_hedger
+from src.app.utils.common.resilience import resilient_call, EMBEDDING_SERVER
+from src.app.utils.common.single_flight import get_single_flight
+from src.app.utils.common import json_codec
+
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """
+    Collects the `embed_query` calls arriving within `window_ms` (or until
+    `max_batch_size` queries are waiting) and embeds them with a single
+    `embed_documents` request. Each caller gets its own vector.
+
+    Config (`EC2.MICRO_BATCH` key): ENABLED, WINDOW_MS (default 5), MAX_BATCH_SIZE (default 32).
+    """
+
+    def __init__(self, embed_documents, window_ms: float = 5.0, max_batch_size: int = 32) -> None:
+        self.embed_documents = embed_documents
+        self.window_ms = window_ms
+        self.max_batch_size = max_batch_size
+        self.batch_sizes: Dict[int, int] = {}
+        self.queueing_delay = LatencyHistogram()
+        self._metrics_lock = threading.Lock()
+        self._queue: "queue.Queue" = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="embed-micro-batcher", daemon=True)
+        self._worker.start()
+
+    def embed(self, query: str) -> List[float]:
+        future = Future()
+        self._queue.put((query, future, time.perf_counter()))
+        remaining_ms = current_deadline().remaining_ms()
+        try:
+            return future.result(timeout=None if remaining_ms == float("inf") else remaining_ms / 1000)
+        except FutureTimeoutError:
+            raise DeadlineExceeded("No budget left waiting for the query embedding")
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        closes_at = time.perf_counter() + self.window_ms / 1000
+        while len(batch) < self.max_batch_size:
+            timeout = closes_at - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        # The only worker: nothing a batch does may end the loop, or every later caller would hang
+        while True:
+            batch = self._collect()
+            try:
+                self._embed_batch(batch)
+            except Exception as e:
+                logger.exception(f"Micro-batch of {len(batch)} queries failed: {e}")
+                self._resolve(batch, error=e)
+
+    def _embed_batch(self, batch: list) -> None:
+        sent_at = time.perf_counter()
+        queries = list(dict.fromkeys(query for query, _, _ in batch))
+        with self._metrics_lock:
+            self.batch_sizes[len(queries)] = self.batch_sizes.get(len(queries), 0) + 1
+        for _, _, enqueued_at in batch:
+            self.queueing_delay.record((sent_at - enqueued_at) * 1000)
+        try:
+            embeddings = self.embed_documents(queries)
+            if len(embeddings) != len(queries):
+                raise ValueError(f"The embedding server returned {len(embeddings)} vectors for {len(queries)} queries")
+        except Exception as e:
+            self._resolve(batch, error=e)
+            return
+        self._resolve(batch, vectors=dict(zip(queries, embeddings)))
+
+    @staticmethod
+    def _resolve(batch: list, vectors: Optional[Dict[str, List[float]]] = None,
+                 error: Optional[BaseException] = None) -> None:
+        """Settle every pending future of the batch, each one on its own."""
+        for query, future, _ in batch:
+            if future.done():
+                continue
+            try:
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(vectors[query])
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._metrics_lock:
+            sizes = dict(self.batch_sizes)
+        batches = sum(sizes.values())
+        return {
+            "batches": batches,
+            "mean_batch_size": round(sum(size * count for size, count in sizes.items()) / batches, 3) if batches else 0.0,
+            "batch_sizes": dict(sorted(sizes.items())),
+            "queueing_delay": self.queueing_delay.summary(),
+        }
 
 class SentenceTransformerAPIEmbeddings(Embeddings):
-    def __init__(self, server_url: str = None, port: str = None, logger=None):
+    # Query embeddings computed ahead in bulk (batch requests), shared by every instance
+    _primed_queries: "OrderedDict[tuple, List[float]]" = OrderedDict()
+    _primed_lock = threading.Lock()
+    max_primed_queries = 4096
+    # One micro-batcher per server, shared by every retriever using it
+    _batchers: Dict[str, MicroBatcher] = {}
+    _batchers_lock = threading.Lock()
+
+    def __init__(self, server_url: str = None, port: str = None, logger=None, micro_batch: Optional[dict] = None):
         """
         :param server_url: Base URL of the FastAPI server, e.g. http://localhost:8000
         :param logger: optional logger object
+        :param micro_batch: micro-batching config (see `MicroBatcher`), disabled by default
         """
         self.logger = logger if logger else logging.getLogger(__name__)
         self.server_url = "http://" + server_url + ':' + port
@@ -16,6 +136,17 @@ class SentenceTransformerAPIEmbeddings(Embeddings):
         if not self.server_url:
             raise ValueError("No server_url provided and EMBEDDING_API_URL env var is not set.")
 
+        self.batcher = None
+        if (micro_batch or {}).get("ENABLED", False):
+            with self._batchers_lock:
+                if self.server_url not in self._batchers:
+                    self._batchers[self.server_url] = MicroBatcher(
+                        self.embed_documents,
+                        window_ms=float(micro_batch.get("WINDOW_MS", 5)),
+                        max_batch_size=int(micro_batch.get("MAX_BATCH_SIZE", 32)),
+                    )
+                self.batcher = self._batchers[self.server_url]
+
         # Optionally verify you can reach the server
         self.logger.info(f"Initializing SentenceTransformerAPIEmbeddings with URL: {self.server_url}")
 
@@ -31,11 +162,16 @@ class SentenceTransformerAPIEmbeddings(Embeddings):
         # Construct the request data per your FastAPI schema
         data = {"documents": documents}
 
-        response = requests.post(endpoint, json=data)
-        response.raise_for_status()  # raise an exception if the call failed
+        def _post():
+            response = requests.post(endpoint, data=json_codec.dumps(data), headers=json_codec.JSON_HEADERS,
+                                     timeout=current_deadline().timeout("embedding"))
+            response.raise_for_status()  # raise an exception if the call failed
+            return response
+
+        response = resilient_call(EMBEDDING_SERVER, _post)
 
         # The response is expected to have the structure: {"embeddings": [[...], [...]]}
-        result_json = response.json()
+        result_json = json_codec.loads(response.content)
         return result_json["embeddings"]
 
     def embed_query(self, query: str) -> List[float]:
@@ -47,16 +183,63 @@ class SentenceTransformerAPIEmbeddings(Embeddings):
 
         self.logger.debug(f"Sending query '{query}' to {endpoint}...")
         
+        with self._primed_lock:
+            primed = self._primed_queries.get((self.server_url, query))
+        if primed is not None:
+            return primed
+
+        # Concurrent requests embedding the same query share a single call
+        embedding, _ = get_single_flight("embed_query").do((endpoint, query), self._fetch_query_embedding, endpoint, query)
+        return embedding
+
+    def prime_query_embeddings(self, queries: List[str]) -> int:
+        """
+        Embeds the queries in a single `embed_documents` call, so the
+        following `embed_query` calls for them need no request.
+
+        Returns:
+            int: Number of queries that were embedded (the rest were primed already).
+        """
+        with self._primed_lock:
+            missing = [q for q in dict.fromkeys(queries) if q and (self.server_url, q) not in self._primed_queries]
+        if not missing:
+            return 0
+        vectors = self.embed_documents(missing)
+        with self._primed_lock:
+            for query, vector in zip(missing, vectors):
+                self._primed_queries[(self.server_url, query)] = vector
+                self._primed_queries.move_to_end((self.server_url, query))
+            while len(self._primed_queries) > self.max_primed_queries:
+                self._primed_queries.popitem(last=False)
+        return len(missing)
+
+    def _fetch_query_embedding(self, endpoint: str, query: str) -> List[float]:
+        if self.batcher is not None:
+            current_span().set(micro_batched=True)
+            return self.batcher.embed(query)
+
         params = {"query": query}
         
-        response = requests.get(endpoint, params=params)
-        response.raise_for_status()
+        # Idempotent, so a slow call can be hedged with a second attempt
+        def _get():
+            response = get_hedger("embed_query").call(requests.get, endpoint, params=params,
+                                                      timeout=current_deadline().timeout("embedding"))
+            response.raise_for_status()
+            return response
+
+        response = resilient_call(EMBEDDING_SERVER, _get)
 
         self.logger.info(f"Endpoint response: {response.content}")
 
-        result_json = response.json()
+        result_json = json_codec.loads(response.content)
 
         self.logger.info(f"Returning response")
         
         return result_json["embed"]
 
+
+def micro_batch_metrics() -> Dict[str, Dict[str, Any]]:
+    """Batch size and queueing delay of every micro-batcher."""
+    with SentenceTransformerAPIEmbeddings._batchers_lock:
+        batchers = dict(SentenceTransformerAPIEmbeddings._batchers)
+    return {server_url: batcher.metrics() for server_url, batcher in batchers.items()}
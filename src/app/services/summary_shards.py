@@ -0,0 +1,365 @@
+"""
+Packed per-city business summary shards.
+
+The summaries live as one S3 object per business
+(`prc/geo/{country}/{city}/{id}/summary/001_{daterange}_{lang}.json`). The
+packing job writes the current summary of every business of a city into a
+single versioned shard:
+
+    summaries.bin   concatenated zlib-compressed JSON records
+    index.json      {"version", "language", "records": {id: [offset, length, daterange]}}
+
+published under `{PREFIX}/{country}/{city}/{version}/`, with a
+`{PREFIX}/{country}/{city}/latest.json` pointer ({"version": ...}).
+
+At request time the records are read from a local memory-mapped copy of the
+shard (`local` mode, downloaded once to /tmp and deleted once replaced or
+unloaded), or with S3 byte-range reads, adjacent records sharing one request
+(`range` mode). Businesses missing
+from the shard, or whose daterange is newer than the packed one, are read
+from the per-object layout as before.
+
+Config (`SUMMARY_SHARDS` key):
+    ENABLED, BUCKET, PREFIX (default prc/shards), MODE (local | range),
+    LOCAL_DIR (default /tmp/summary_shards), POINTER_TTL_S (default 300),
+    MAX_CITIES: Shards kept loaded, the least recently used city is
+        unloaded beyond (default 0, no limit).
+
+Usage of the packing job:
+    python -m src.app.services.summary_shards --bucket <bucket> --country es --city vlc
+"""
+import os
+import json
+import mmap
+import time
+import zlib
+import shutil
+import logging
+import argparse
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+
+from src.app.utils.common import json_codec
+
+
+logger = logging.getLogger(__name__)
+
+SHARD = "summaries.bin"
+INDEX = "index.json"
+RANGE_GAP_BYTES = 64 * 1024  # records closer than this share one range request
+
+
+def _s3_client():
+    import boto3
+    return boto3.client("s3")
+
+
+# =============================================================================
+# Packing job
+# =============================================================================
+def _current_summary_keys(s3, bucket: str, country: str, city: str, language: str) -> Dict[str, Tuple[str, str]]:
+    """Key and daterange of the newest summary of each business of the city."""
+    current: Dict[str, Tuple[str, str]] = {}
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=f"prc/geo/{country}/{city}/"):
+        for item in page.get("Contents", []):
+            parts = item["Key"].split("/")
+            # prc/geo/{country}/{city}/{id}/summary/001_{daterange}_{lang}.json
+            if len(parts) != 7 or parts[5] != "summary" or not parts[6].endswith(f"_{language}.json"):
+                continue
+            business_id = parts[4]
+            date_range = parts[6][len("001_"):-len(f"_{language}.json")]
+            if business_id not in current or date_range > current[business_id][1]:
+                current[business_id] = (item["Key"], date_range)
+    return current
+
+
+def pack_city(bucket: str, country: str, city: str, output_dir: str, language: str = "en",
+              version: Optional[str] = None, prefix: str = "prc/shards", upload: bool = True) -> Dict[str, Any]:
+    """
+    Pack the current summaries of a city into one shard, and publish it.
+
+    Returns:
+        dict: The shard index.
+    """
+    s3 = _s3_client()
+    version = version or datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+    os.makedirs(output_dir, exist_ok=True)
+    records: Dict[str, List] = {}
+    offset = 0
+    with open(os.path.join(output_dir, SHARD), "wb") as shard:
+        for business_id, (key, date_range) in sorted(_current_summary_keys(s3, bucket, country, city, language).items()):
+            body = s3.get_object(Bucket=bucket, Key=key)["Body"].read()
+            # Re-serialized compactly, the records are read back with json_codec.loads
+            record = zlib.compress(json_codec.dumps(json_codec.loads(body)))
+            shard.write(record)
+            records[business_id] = [offset, len(record), date_range]
+            offset += len(record)
+
+    index = {"version": version, "country": country, "city": city, "language": language, "records": records}
+    with open(os.path.join(output_dir, INDEX), "w", encoding="utf-8") as file:
+        json.dump(index, file)
+    logger.info(f"Packed {len(records)} summaries of {country}/{city} into {offset} bytes")
+
+    if upload:
+        base = f"{prefix}/{country}/{city}"
+        s3.upload_file(os.path.join(output_dir, SHARD), bucket, f"{base}/{version}/{SHARD}")
+        s3.upload_file(os.path.join(output_dir, INDEX), bucket, f"{base}/{version}/{INDEX}")
+        # The pointer goes last, readers never see a partially uploaded version
+        s3.put_object(Bucket=bucket, Key=f"{base}/latest.json", Body=json.dumps({"version": version}).encode("utf-8"))
+    return index
+
+
+# =============================================================================
+# Readers
+# =============================================================================
+class SummaryShard(ABC):
+    """Index of one shard, and the records it holds."""
+
+    def __init__(self, index: Dict[str, Any]) -> None:
+        self.index = index
+        self.version = index["version"]
+        self.records: Dict[str, List] = index["records"]
+
+    def locate(self, business_id: str, date_range: Optional[str]) -> Optional[Tuple[int, int]]:
+        """Offset and length of the record, None if missing or older than `date_range`."""
+        record = self.records.get(business_id)
+        if record is None or (date_range and str(date_range) > record[2]):
+            return None
+        return record[0], record[1]
+
+    @abstractmethod
+    def _read(self, spans: List[Tuple[int, int]]) -> List[bytes]:
+        """Bytes of each (offset, length) record, in order."""
+
+    def get_many(self, places: List[Tuple[str, Optional[str]]]) -> Dict[str, Dict[str, Any]]:
+        """
+        Args:
+            places: (business_id, daterange) of the wanted summaries.
+
+        Returns:
+            dict: Summary of each business found in the shard.
+        """
+        located = {}
+        for business_id, date_range in places:
+            span = self.locate(business_id, date_range)
+            if span is not None:
+                located[business_id] = span
+        ids = list(located)
+        raw = self._read([located[business_id] for business_id in ids])
+        return {business_id: json_codec.loads(zlib.decompress(data)) for business_id, data in zip(ids, raw)}
+
+
+class LocalSummaryShard(SummaryShard):
+    """Shard downloaded once to local disk and memory-mapped."""
+
+    def __init__(self, directory: str) -> None:
+        with open(os.path.join(directory, INDEX), "r", encoding="utf-8") as file:
+            super().__init__(json.load(file))
+        self.directory = directory
+        self._file = open(os.path.join(directory, SHARD), "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(self._file.name) else b""
+
+    def _read(self, spans):
+        return [self._map[offset:offset + length] for offset, length in spans]
+
+
+class RangeSummaryShard(SummaryShard):
+    """Shard left in S3, read with byte-range requests."""
+
+    def __init__(self, index: Dict[str, Any], s3, bucket: str, key: str) -> None:
+        super().__init__(index)
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = key
+
+    def _read(self, spans):
+        if not spans:
+            return []
+        # Merge close records into one range request
+        order = sorted(range(len(spans)), key=lambda i: spans[i][0])
+        groups: List[List[int]] = []
+        for i in order:
+            if groups and spans[i][0] - sum(spans[groups[-1][-1]]) <= RANGE_GAP_BYTES:
+                groups[-1].append(i)
+            else:
+                groups.append([i])
+
+        results: List[bytes] = [b""] * len(spans)
+        for group in groups:
+            start = spans[group[0]][0]
+            end = max(sum(spans[i]) for i in group)
+            body = self.s3.get_object(Bucket=self.bucket, Key=self.key, Range=f"bytes={start}-{end - 1}")["Body"].read()
+            for i in group:
+                offset, length = spans[i]
+                results[i] = body[offset - start:offset - start + length]
+        return results
+
+
+class SummaryShardStore:
+    """Latest shard of each city, see module docstring."""
+
+    def __init__(self, bucket: str, prefix: str = "prc/shards", mode: str = "local",
+                 local_dir: str = "/tmp/summary_shards", pointer_ttl_s: float = 300.0, max_cities: int = 0) -> None:
+        if mode not in ("local", "range"):
+            raise ValueError(f"Unsupported shard mode: {mode}. Supported modes are 'local' and 'range'.")
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.mode = mode
+        self.local_dir = local_dir
+        self.pointer_ttl_s = pointer_ttl_s
+        self.max_cities = max_cities
+        self._shards: "OrderedDict[Tuple[str, str], SummaryShard]" = OrderedDict()
+        self._checked_at: Dict[Tuple[str, str], float] = {}
+        # Guards the dicts only; the loads of a city run under its own lock
+        self._lock = threading.Lock()
+        self._city_locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self._s3 = None
+        # Called with (country, city, version) when a newer shard replaces the loaded one
+        self.listeners: List = []
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]], default_bucket: Optional[str] = None) -> Optional["SummaryShardStore"]:
+        """The store, or None when the shards are disabled."""
+        config = config or {}
+        if not config.get("ENABLED", False):
+            return None
+        return cls(
+            bucket=config.get("BUCKET") or default_bucket,
+            prefix=config.get("PREFIX", "prc/shards"),
+            mode=config.get("MODE", "local"),
+            local_dir=config.get("LOCAL_DIR", "/tmp/summary_shards"),
+            pointer_ttl_s=float(config.get("POINTER_TTL_S", 300)),
+            max_cities=int(config.get("MAX_CITIES", 0)),
+        )
+
+    def cities(self) -> List[Tuple[str, str]]:
+        """Cities with a loaded shard, least recently used first."""
+        with self._lock:
+            return list(self._shards)
+
+    def loaded_version(self, country: str, city: str) -> Optional[str]:
+        """Version of the loaded shard of the city, None when none is loaded. Never loads one."""
+        with self._lock:
+            shard = self._shards.get((country, city))
+            return shard.version if shard is not None else None
+
+    def _client(self):
+        if self._s3 is None:
+            self._s3 = _s3_client()
+        return self._s3
+
+    def _load(self, country: str, city: str, version: str) -> SummaryShard:
+        base = f"{self.prefix}/{country}/{city}/{version}"
+        if self.mode == "range":
+            index = json.loads(self._client().get_object(Bucket=self.bucket, Key=f"{base}/{INDEX}")["Body"].read())
+            return RangeSummaryShard(index, self._client(), self.bucket, f"{base}/{SHARD}")
+
+        directory = os.path.join(self.local_dir, country, city, version)
+        if not os.path.exists(os.path.join(directory, INDEX)):
+            partial = f"{directory}.partial-{os.getpid()}-{threading.get_ident()}"
+            try:
+                os.makedirs(partial, exist_ok=True)
+                self._client().download_file(self.bucket, f"{base}/{SHARD}", os.path.join(partial, SHARD))
+                self._client().download_file(self.bucket, f"{base}/{INDEX}", os.path.join(partial, INDEX))
+                try:
+                    os.replace(partial, directory)
+                except OSError:
+                    # Installed meanwhile by another process: keep that one
+                    if not os.path.exists(os.path.join(directory, INDEX)):
+                        raise
+            finally:
+                shutil.rmtree(partial, ignore_errors=True)
+            logger.info(f"Downloaded summary shard {version} of {country}/{city}")
+        return LocalSummaryShard(directory)
+
+    def _cached(self, key: Tuple[str, str]):
+        """(loaded shard, whether its pointer was checked within the TTL)."""
+        with self._lock:
+            shard = self._shards.get(key)
+            if shard is not None:
+                self._shards.move_to_end(key)
+            return shard, shard is not None and time.monotonic() - self._checked_at.get(key, 0) < self.pointer_ttl_s
+
+    @staticmethod
+    def _delete(shard: SummaryShard) -> None:
+        """Delete the local copy of a shard no longer loaded, its readers keep it mapped until they are done."""
+        if isinstance(shard, LocalSummaryShard):
+            shutil.rmtree(shard.directory, ignore_errors=True)
+
+    def get(self, country: str, city: str) -> Optional[SummaryShard]:
+        """The shard of the city, None when it has none."""
+        key = (country, city)
+        shard, fresh = self._cached(key)
+        if fresh:
+            return shard
+        with self._lock:
+            city_lock = self._city_locks.setdefault(key, threading.Lock())
+        # One refresh per city at a time, the other cities are not blocked by it.
+        # While a loaded shard is refreshed, the other requests keep using it.
+        if not city_lock.acquire(blocking=shard is None):
+            return shard
+        try:
+            shard, fresh = self._cached(key)
+            if fresh:
+                return shard
+            replaced = None
+            try:
+                pointer = self._client().get_object(Bucket=self.bucket, Key=f"{self.prefix}/{country}/{city}/latest.json")
+                version = json.loads(pointer["Body"].read())["version"]
+                if shard is None or shard.version != version:
+                    replaced, shard = shard, self._load(country, city, version)
+                    with self._lock:
+                        self._shards[key] = shard
+            except Exception as e:
+                logger.error(f"Could not load the summary shard of {country}/{city}: {e}")
+                replaced = None
+            unloaded = []
+            with self._lock:
+                self._checked_at[key] = time.monotonic()
+                while self.max_cities and len(self._shards) > self.max_cities:
+                    unloaded.append(self._shards.popitem(last=False))
+                    self._checked_at.pop(unloaded[-1][0], None)
+            for other, other_shard in unloaded:
+                logger.info(f"Unloaded the summary shard of {other[0]}/{other[1]}")
+                # Kept when that city is being loaded again meanwhile, its download may be this very copy
+                with self._lock:
+                    other_lock = self._city_locks[other]
+                if other_lock.acquire(blocking=False):
+                    try:
+                        self._delete(other_shard)
+                    finally:
+                        other_lock.release()
+            if replaced is not None:
+                self._delete(replaced)
+                for listener in self.listeners:
+                    listener(country, city, shard.version)
+            return shard
+        finally:
+            city_lock.release()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Pack the summaries of a city into one shard")
+    parser.add_argument("--bucket", required=True)
+    parser.add_argument("--country", required=True)
+    parser.add_argument("--city", required=True)
+    parser.add_argument("--language", default="en")
+    parser.add_argument("--prefix", default="prc/shards")
+    parser.add_argument("--output-dir", default=None, help="Local copy of the shard (a temporary directory otherwise)")
+    parser.add_argument("--no-upload", action="store_true")
+    args = parser.parse_args(argv)
+
+    import tempfile
+
+    output_dir = args.output_dir or tempfile.mkdtemp(prefix="summary_shard_")
+    index = pack_city(args.bucket, args.country, args.city, output_dir, language=args.language,
+                      prefix=args.prefix, upload=not args.no_upload)
+    print(f"Shard {index['version']} with {len(index['records'])} summaries written to {output_dir}")
+
+
+if __name__ == "__main__":
+    main()
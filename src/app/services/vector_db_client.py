@@ -1,9 +1,10 @@
 from logging import Logger
-from typing import Dict, Any, List, Tuple
+from typing import Dict, Any, List, Tuple, Optional
 
-from pinecone import Pinecone, ServerlessSpec
+from src.app.services.local_embeddings import build_embeddings
+from src.app.utils.common.lazy_import import lazy_import
 
-from src.app.services.sentence_transformers_embeddings import SentenceTransformerAPIEmbeddings
+pinecone = lazy_import("pinecone")
 
 
 class VectorDBClient():
@@ -15,15 +16,17 @@ class VectorDBClient():
         server_url: str,
         aws_region: str,
         port: str,
-        logger: Logger
+        logger: Logger,
+        micro_batch: Optional[dict] = None,
+        embeddings: Optional[dict] = None
         ) -> None:
         self.logger = logger
-        self.client = Pinecone(api_key=api_key)
+        self.client = pinecone.Pinecone(api_key=api_key)
         self.logger.info(f"Initializing index--->{index_name}")
         self.index = self.client.Index(name=index_name)
         self.index_name = index_name
         self.namespace = namespace
-        self.embedding_model = SentenceTransformerAPIEmbeddings(server_url=server_url,port = port, logger=self.logger)
+        self.embedding_model = build_embeddings(embeddings, server_url=server_url, port=port, logger=self.logger, micro_batch=micro_batch)
         self.aws_region = aws_region
         
         
@@ -49,7 +52,7 @@ class VectorDBClient():
                 name=index_name,
                 dimension=dimension,
                 metric=metric,
-                spec=ServerlessSpec(
+                spec=pinecone.ServerlessSpec(
                 cloud="aws",
                 region=self.aws_region
                 )
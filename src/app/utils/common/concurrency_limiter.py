@@ -0,0 +1,142 @@
+"""
+Process-wide concurrency limits of a dependency.
+
+An `asyncio.Semaphore` only bounds the coroutines of one event loop, i.e.
+one request run. The provider rate limits apply to the whole process: every
+concurrent request, batch item and streamed rerank share them. A
+`ConcurrencyLimiter` is one counter for the whole process, acquired from
+threads (`acquire`) or from any event loop (`acquire_async`, which never
+blocks the loop). Slots are handed over in arrival order.
+
+A limiter bounds one process; with several server workers the provider
+sees `limit * workers` calls at most.
+"""
+import asyncio
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+from typing import Dict, Any, Optional
+
+from src.app.utils.common.deadline import DeadlineExceeded
+
+
+logger = logging.getLogger(__name__)
+
+
+class ConcurrencyLimiter:
+    """At most `limit` holders at a time, across threads and event loops."""
+
+    def __init__(self, name: str, limit: int) -> None:
+        if limit < 1:
+            raise ValueError(f"The limit of {name} must be at least 1, got {limit}")
+        self.name = name
+        self.limit = limit
+        self.in_use = 0
+        self.waited = 0
+        self._waiters: deque = deque()
+        self._lock = threading.Lock()
+
+    def _try_acquire(self, waiter) -> bool:
+        with self._lock:
+            if self.in_use < self.limit and not self._waiters:
+                self.in_use += 1
+                return True
+            self.waited += 1
+            self._waiters.append(waiter)
+            return False
+
+    def _withdraw(self, waiter) -> bool:
+        """Drop a waiter that gave up. False when it was handed a slot meanwhile."""
+        with self._lock:
+            try:
+                self._waiters.remove(waiter)
+                return True
+            except ValueError:
+                return False
+
+    def acquire(self, timeout: Optional[float] = None) -> None:
+        """Blocking acquire. Raises `DeadlineExceeded` after `timeout` seconds."""
+        event = threading.Event()
+        if self._try_acquire(event) or event.wait(timeout) or not self._withdraw(event):
+            return
+        raise DeadlineExceeded(f"No {self.name} slot within {timeout:.2f}s")
+
+    async def acquire_async(self, timeout: Optional[float] = None) -> None:
+        """Acquire from an event loop without blocking it. Raises `DeadlineExceeded` after `timeout` seconds."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if self._try_acquire((loop, future)):
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.cancel():
+                # Still queued, or picked with the hand-over pending (which then gives the slot back)
+                self._withdraw((loop, future))
+            else:
+                # Handed a slot while giving up: give it back
+                self.release()
+            if isinstance(e, asyncio.TimeoutError):
+                raise DeadlineExceeded(f"No {self.name} slot within {timeout:.2f}s")
+            raise
+
+    def release(self) -> None:
+        with self._lock:
+            if not self._waiters:
+                self.in_use -= 1
+                return
+            # The slot goes to the next waiter as is, `in_use` is unchanged
+            waiter = self._waiters.popleft()
+        if isinstance(waiter, threading.Event):
+            waiter.set()
+        else:
+            loop, future = waiter
+            loop.call_soon_threadsafe(self._hand_over, future)
+
+    def _hand_over(self, future) -> None:
+        if future.cancelled():
+            # Its waiter gave up between being picked and this callback
+            self.release()
+        else:
+            future.set_result(None)
+
+    @contextmanager
+    def slot(self, timeout: Optional[float] = None):
+        self.acquire(timeout)
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def slot_async(self, timeout: Optional[float] = None):
+        await self.acquire_async(timeout)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"limit": self.limit, "in_use": self.in_use, "waiting": len(self._waiters), "waited": self.waited}
+
+
+_limiters: Dict[str, ConcurrencyLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(name: str, limit: int) -> ConcurrencyLimiter:
+    """The limiter of `name`, created with `limit` by its first caller."""
+    with _limiters_lock:
+        if name not in _limiters:
+            _limiters[name] = ConcurrencyLimiter(name, limit)
+        elif _limiters[name].limit != limit:
+            logger.warning(f"Limiter {name} already exists with limit {_limiters[name].limit}, ignoring {limit}")
+        return _limiters[name]
+
+
+def limiter_metrics() -> Dict[str, Dict[str, Any]]:
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return {limiter.name: limiter.metrics() for limiter in limiters}
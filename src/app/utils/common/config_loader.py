@@ -1,21 +1,49 @@
 import os
 import json
+import time
 import yaml
+import argparse
 from glob import glob
 
 class ConfigLoader:
-    def __init__(self, env):
+    """
+    Loads the pipeline configuration. Sources, in order of precedence:
+
+    1. A precompiled JSON snapshot (`snapshot_path` or `CONFIG_SNAPSHOT` env var),
+       built once at deploy time with `build_snapshot`.
+    2. An explicit list of yaml files (`paths` or comma separated `CONFIG_PATHS`).
+    3. Legacy: a recursive glob of `**/config/{env}/*.yaml` from the CWD.
+
+    Environment variables are always applied on top.
+    """
+    def __init__(self, env, paths=None, snapshot_path=None):
         self.env = env
+        self.paths = paths or [p for p in os.getenv("CONFIG_PATHS", "").split(",") if p]
+        self.snapshot_path = snapshot_path or os.getenv("CONFIG_SNAPSHOT")
+        self.sources = []
         self.config = {}
         self.load_config()
 
 
+    def discover_yaml_files(self):
+        """Files to load: the explicit paths if given, the recursive glob otherwise."""
+        if self.paths:
+            return list(self.paths)
+        return sorted(glob(f"**/config/{self.env}/*.yaml", recursive=True))
+
     def load_from_yaml(self):
-        config_files = glob(f"**/config/{self.env}/*.yaml", recursive=True)
+        config_files = self.discover_yaml_files()
         for file_path in config_files:
             with open(file_path, 'r') as file:
                 data = yaml.safe_load(file)
                 self.config.update(data)
+        self.sources = config_files
+
+    def load_from_snapshot(self):
+        with open(self.snapshot_path, 'r', encoding='utf-8') as file:
+            snapshot = json.load(file)
+        self.config.update(snapshot["config"])
+        self.sources = snapshot.get("sources", [])
 
     def load_from_env(self):
         for key, value in os.environ.items():
@@ -23,8 +51,54 @@ class ConfigLoader:
             self.config[config_key] = value
 
     def load_config(self):
-        self.load_from_yaml()
+        if self.snapshot_path and os.path.isfile(self.snapshot_path):
+            self.load_from_snapshot()
+        else:
+            self.load_from_yaml()
         self.load_from_env()
 
     def get(self, key):
         return self.config.get(key)
+
+
+def build_snapshot(env, output_path, paths=None):
+    """
+    Merge the yaml config of `env` into a single JSON snapshot with the list
+    of files it was built from. Environment variables are NOT frozen into the
+    snapshot, they are still applied at load time.
+
+    Args:
+        env (str): Environment whose config is compiled (e.g. `dev`).
+        output_path (str): Where the JSON snapshot is written.
+        paths (list): Optional explicit yaml files, instead of the recursive glob.
+
+    Returns:
+        dict: The snapshot that was written.
+    """
+    loader = ConfigLoader.__new__(ConfigLoader)
+    loader.env = env
+    loader.paths = paths or []
+    loader.config = {}
+    loader.sources = []
+    loader.load_from_yaml()
+
+    snapshot = {
+        "env": env,
+        "created_at": int(time.time()),
+        "sources": [os.path.abspath(p) for p in loader.sources],
+        "config": loader.config,
+    }
+    with open(output_path, 'w', encoding='utf-8') as file:
+        json.dump(snapshot, file, indent=2, sort_keys=True)
+    return snapshot
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile the yaml config of an environment into a JSON snapshot")
+    parser.add_argument("--env", required=True)
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--paths", nargs="*", default=None, help="Explicit yaml files to compile")
+    args = parser.parse_args()
+
+    result = build_snapshot(args.env, args.output, args.paths)
+    print(f"Snapshot written to {args.output} from {len(result['sources'])} files")
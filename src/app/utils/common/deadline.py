@@ -0,0 +1,150 @@
+"""
+Per-request deadline propagation.
+
+A `Deadline` is created once per request and made current with
+`use_deadline`. Every stage reads it through `current_deadline()` to size its
+own timeout, and checks `should_degrade(stage)` to decide whether there is
+still budget for the full version of the stage or it should fall back to a
+cheaper one. Each fallback taken is recorded with `mark_degraded`, and the
+flags are returned in the response.
+
+Config (`DEADLINE` key):
+    BUDGET_MS: Default budget of a request.
+    SAFETY_MARGIN_MS: Kept free before the lambda timeout.
+    STAGE_TIMEOUTS_S: Upper bound of the timeout of each remote call.
+    DEGRADE: Minimum remaining budget (ms) a stage needs to run in full.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, List, Optional
+
+
+DEFAULT_DEGRADE_RULES = {
+    "translate": 6000,          # below -> search with the original query
+    "extract_filters": 4500,    # below -> lexicon-only extraction
+    "pinecone": 1000,           # below -> keep the filter service order
+    "s3_fetch": 1500,           # below -> stop fetching, partial metadata
+    "rerank": 2500,             # below -> keep the vector order
+}
+
+DEFAULT_STAGE_TIMEOUTS_S = {
+    "filter_service": 10,
+    "pinecone": 10,
+    "embedding": 5,             # also bounds the calls made outside a request (priming)
+}
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a stage that has no fallback runs out of budget."""
+
+
+class Deadline:
+    """Remaining time budget of a request and the degradation rules that apply to it."""
+
+    def __init__(self, budget_ms: Optional[float] = None, degrade_rules: Optional[Dict[str, float]] = None,
+                 stage_timeouts_s: Optional[Dict[str, float]] = None) -> None:
+        """
+        Args:
+            budget_ms: Total budget, `None` means no deadline.
+            degrade_rules: Minimum remaining ms each stage needs to run in full.
+            stage_timeouts_s: Cap of the timeout of each remote call.
+        """
+        self.budget_ms = budget_ms
+        self.expires_at = time.monotonic() + budget_ms / 1000 if budget_ms is not None else None
+        self.degrade_rules = {**DEFAULT_DEGRADE_RULES, **(degrade_rules or {})}
+        self.stage_timeouts_s = {**DEFAULT_STAGE_TIMEOUTS_S, **(stage_timeouts_s or {})}
+        self.degraded: List[str] = []
+
+    @classmethod
+    def for_request(cls, config: Optional[Dict[str, Any]], requested_ms: Optional[float] = None,
+                    context=None) -> "Deadline":
+        """
+        Build the deadline of a request: the smallest of the configured budget,
+        the budget requested by the caller and the lambda remaining time.
+        """
+        config = config or {}
+        candidates = [config.get("BUDGET_MS"), requested_ms]
+        if context is not None and hasattr(context, "get_remaining_time_in_millis"):
+            candidates.append(context.get_remaining_time_in_millis() - float(config.get("SAFETY_MARGIN_MS", 500)))
+        candidates = [float(c) for c in candidates if c is not None]
+        return cls(
+            budget_ms=min(candidates) if candidates else None,
+            degrade_rules=config.get("DEGRADE"),
+            stage_timeouts_s=config.get("STAGE_TIMEOUTS_S"),
+        )
+
+    def remaining_ms(self) -> float:
+        if self.expires_at is None:
+            return float("inf")
+        return max(0.0, (self.expires_at - time.monotonic()) * 1000)
+
+    def scope(self) -> "Deadline":
+        """
+        Same budget and rules with its own degraded flags, for the parts of a
+        request (e.g. the items of a batch) that are answered separately.
+        """
+        scoped = Deadline(degrade_rules=self.degrade_rules, stage_timeouts_s=self.stage_timeouts_s)
+        scoped.budget_ms = self.budget_ms
+        scoped.expires_at = self.expires_at
+        return scoped
+
+    def budget_bucket(self, bucket_ms: float = 1000.0) -> Optional[int]:
+        """
+        Remaining budget rounded down to `bucket_ms` (None without a deadline).
+        Requests in the same bucket take the same degradations.
+        """
+        if self.expires_at is None:
+            return None
+        return int(self.remaining_ms() // bucket_ms)
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining_ms() <= 0
+
+    def timeout(self, stage: str, floor_s: float = 0.05) -> Optional[float]:
+        """
+        Timeout (seconds) for a remote call of `stage`: the remaining budget,
+        capped by the stage timeout. Raises `DeadlineExceeded` when no budget is left.
+        """
+        if self.expired:
+            raise DeadlineExceeded(f"No budget left for {stage}")
+        cap = self.stage_timeouts_s.get(stage)
+        remaining_s = self.remaining_ms() / 1000
+        if cap is None:
+            return None if remaining_s == float("inf") else max(remaining_s, floor_s)
+        return max(min(remaining_s, float(cap)), floor_s)
+
+    def should_degrade(self, stage: str) -> bool:
+        """True when the remaining budget is below what `stage` needs to run in full."""
+        threshold = self.degrade_rules.get(stage)
+        return threshold is not None and self.remaining_ms() < float(threshold)
+
+    def mark_degraded(self, flag: str) -> None:
+        if flag not in self.degraded:
+            self.degraded.append(flag)
+
+
+_current_deadline: ContextVar[Optional[Deadline]] = ContextVar("current_deadline", default=None)
+_NO_DEADLINE = Deadline()
+
+
+def current_deadline() -> Deadline:
+    """Deadline of the current request, or an unlimited one outside a request."""
+    return _current_deadline.get() or _NO_DEADLINE
+
+
+@contextmanager
+def use_deadline(deadline: Deadline):
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+
+
+def mark_degraded(flag: str) -> None:
+    """Record a fallback taken by the current request."""
+    deadline = _current_deadline.get()
+    if deadline is not None:
+        deadline.mark_degraded(flag)
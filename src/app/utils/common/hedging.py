@@ -0,0 +1,179 @@
+"""
+Request hedging for idempotent, tail-latency-sensitive calls.
+
+The first attempt is sent as usual; if it has not answered after the
+configured percentile of the recent latencies of that endpoint, a second
+attempt is sent and the first answer wins. The extra load is capped: when
+the ratio of hedges to calls reaches `MAX_EXTRA_LOAD`, no more hedges are sent.
+
+Config (`HEDGING` key, one entry per endpoint):
+    HEDGING:
+      EMBED_QUERY: {ENABLED: true, PERCENTILE: 95, MAX_EXTRA_LOAD: 0.05}
+      PINECONE: {ENABLED: true, PERCENTILE: 90, MIN_DELAY_MS: 100}
+      S3_SUMMARY: {ENABLED: true}
+"""
+import time
+import logging
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass
+from typing import Dict, Any, Callable, Optional
+
+from src.app.monitoring.tracing import current_span
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class HedgePolicy:
+    """Hedging settings of one endpoint."""
+    enabled: bool = False
+    percentile: float = 95.0
+    min_delay_ms: float = 10.0
+    max_delay_ms: float = 2000.0
+    initial_delay_ms: float = 500.0  # used until `min_samples` latencies are known
+    min_samples: int = 20
+    max_extra_load: float = 0.05
+    window: int = 500
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]]) -> "HedgePolicy":
+        config = config or {}
+        defaults = cls()
+        return cls(
+            enabled=bool(config.get("ENABLED", defaults.enabled)),
+            percentile=float(config.get("PERCENTILE", defaults.percentile)),
+            min_delay_ms=float(config.get("MIN_DELAY_MS", defaults.min_delay_ms)),
+            max_delay_ms=float(config.get("MAX_DELAY_MS", defaults.max_delay_ms)),
+            initial_delay_ms=float(config.get("INITIAL_DELAY_MS", defaults.initial_delay_ms)),
+            min_samples=int(config.get("MIN_SAMPLES", defaults.min_samples)),
+            max_extra_load=float(config.get("MAX_EXTRA_LOAD", defaults.max_extra_load)),
+            window=int(config.get("WINDOW", defaults.window)),
+        )
+
+
+class Hedger:
+    """Sends hedged calls to one endpoint and keeps its latency window and metrics."""
+
+    _executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="hedge")
+
+    def __init__(self, endpoint: str, policy: HedgePolicy) -> None:
+        self.endpoint = endpoint
+        self.policy = policy
+        self.latencies = deque(maxlen=policy.window)
+        self.calls = 0
+        self.hedges_sent = 0
+        self.hedge_wins = 0
+        self.hedges_suppressed = 0
+        self._lock = threading.Lock()
+
+    def hedge_delay_ms(self) -> float:
+        """Delay before hedging: the configured percentile of the recent latencies."""
+        with self._lock:
+            samples = sorted(self.latencies)
+        if len(samples) < self.policy.min_samples:
+            delay = self.policy.initial_delay_ms
+        else:
+            index = min(len(samples) - 1, int(len(samples) * self.policy.percentile / 100))
+            delay = samples[index]
+        return min(max(delay, self.policy.min_delay_ms), self.policy.max_delay_ms)
+
+    def _reserve_hedge(self) -> bool:
+        """Check the extra load cap and count the hedge if it is allowed."""
+        with self._lock:
+            if self.hedges_sent + 1 > self.policy.max_extra_load * self.calls:
+                self.hedges_suppressed += 1
+                return False
+            self.hedges_sent += 1
+            return True
+
+    def _submit(self, fn, args, kwargs):
+        # Run in a copy of the caller context, so tracing / deadlines still apply
+        context = contextvars.copy_context()
+        return self._executor.submit(context.run, fn, *args, **kwargs)
+
+    def call(self, fn: Callable, *args, **kwargs):
+        """
+        Call `fn(*args, **kwargs)`, hedging it if it is slow.
+
+        Returns:
+            The result of whichever attempt finished first (successfully, if any did).
+        """
+        with self._lock:
+            self.calls += 1
+        if not self.policy.enabled:
+            return fn(*args, **kwargs)
+
+        start = time.perf_counter()
+        primary = self._submit(fn, args, kwargs)
+        done, _ = wait([primary], timeout=self.hedge_delay_ms() / 1000)
+        if done or not self._reserve_hedge():
+            result = primary.result()
+            self._record_latency(start)
+            return result
+
+        hedge = self._submit(fn, args, kwargs)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = future.exception()
+                    continue
+                won = future is hedge
+                if won:
+                    with self._lock:
+                        self.hedge_wins += 1
+                current_span().set(hedged=True, hedge_won=won)
+                self._record_latency(start)
+                return future.result()
+        raise error
+
+    def _record_latency(self, start: float) -> None:
+        with self._lock:
+            self.latencies.append((time.perf_counter() - start) * 1000)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "endpoint": self.endpoint,
+                "calls": self.calls,
+                "hedges_sent": self.hedges_sent,
+                "hedge_wins": self.hedge_wins,
+                "hedges_suppressed": self.hedges_suppressed,
+                "hedge_rate": round(self.hedges_sent / self.calls, 4) if self.calls else 0.0,
+                "hedge_win_rate": round(self.hedge_wins / self.hedges_sent, 4) if self.hedges_sent else 0.0,
+            }
+
+
+_hedgers: Dict[str, Hedger] = {}
+_hedging_config: Dict[str, Any] = {}
+_hedgers_lock = threading.Lock()
+
+
+def configure_hedging(config: Optional[Dict[str, Any]]) -> None:
+    """Set the per-endpoint hedging config (the `HEDGING` config key)."""
+    global _hedging_config
+    with _hedgers_lock:
+        _hedging_config = {str(k).upper(): v for k, v in (config or {}).items()}
+        for endpoint, hedger in _hedgers.items():
+            hedger.policy = HedgePolicy.from_config(_hedging_config.get(endpoint.upper()))
+
+
+def get_hedger(endpoint: str) -> Hedger:
+    """Hedger of `endpoint`, disabled unless configured."""
+    with _hedgers_lock:
+        if endpoint not in _hedgers:
+            _hedgers[endpoint] = Hedger(endpoint, HedgePolicy.from_config(_hedging_config.get(endpoint.upper())))
+        return _hedgers[endpoint]
+
+
+def hedging_metrics() -> Dict[str, Dict[str, Any]]:
+    """Metrics of every endpoint, including how often the hedge won."""
+    with _hedgers_lock:
+        hedgers = list(_hedgers.values())
+    return {hedger.endpoint: hedger.metrics() for hedger in hedgers}
@@ -0,0 +1,71 @@
+"""
+Pluggable JSON codec with bytes-in / bytes-out APIs.
+
+Uses `orjson` when it is installed (several times faster than the stdlib on
+our payloads, and it writes bytes directly), the stdlib `json` otherwise.
+Both backends produce compact output and accept the same inputs: objects
+they cannot serialize natively are converted with `str`.
+
+Config (`JSON_CODEC` key): "auto" (default), "orjson" or "json".
+"""
+import json
+import logging
+from typing import Any, Union
+
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the deployment image
+    orjson = None
+
+_backend = "orjson" if orjson is not None else "json"
+
+# Headers of a request whose body is `dumps(...)` (what `requests`' `json=` would set)
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+
+def configure_codec(name: str = "auto") -> str:
+    """Select the backend. Returns the one in use ("orjson" falls back to "json" when missing)."""
+    global _backend
+    name = (name or "auto").lower()
+    if name not in ("auto", "orjson", "json"):
+        raise ValueError(f"Unsupported JSON codec: {name}. Supported codecs are 'auto', 'orjson' and 'json'.")
+    if name == "json" or orjson is None:
+        if name == "orjson":
+            logger.warning("orjson is not installed, using the stdlib json codec")
+        _backend = "json"
+    else:
+        _backend = "orjson"
+    return _backend
+
+
+def backend() -> str:
+    return _backend
+
+
+def dumps(obj: Any, sort_keys: bool = False) -> bytes:
+    """Serialize to compact UTF-8 JSON bytes."""
+    if _backend == "orjson":
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=str, option=option)
+    return json.dumps(obj, default=str, separators=(",", ":"), ensure_ascii=False,
+                      sort_keys=sort_keys).encode("utf-8")
+
+
+def dumps_str(obj: Any, sort_keys: bool = False) -> str:
+    """Same as `dumps`, as text (for APIs that only take `str`)."""
+    return dumps(obj, sort_keys=sort_keys).decode("utf-8")
+
+
+def loads(data: Union[bytes, bytearray, memoryview, str]) -> Any:
+    """Parse JSON from bytes or text."""
+    if _backend == "orjson":
+        return orjson.loads(data)
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    return json.loads(data)
+
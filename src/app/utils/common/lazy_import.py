@@ -0,0 +1,44 @@
+import importlib
+import threading
+from types import ModuleType
+
+
+class LazyModule(ModuleType):
+    """
+    Module proxy that imports the real module on first attribute access.
+    Used for heavy dependencies (pinecone, langgraph, langid, ...) so they
+    are only paid for when the code path that needs them actually runs.
+    """
+
+    def __init__(self, module_name: str) -> None:
+        super().__init__(module_name)
+        self.__dict__["_lazy_module_name"] = module_name
+        self.__dict__["_lazy_module"] = None
+        self.__dict__["_lazy_lock"] = threading.Lock()
+
+    def _load(self) -> ModuleType:
+        module = self.__dict__["_lazy_module"]
+        if module is None:
+            with self.__dict__["_lazy_lock"]:
+                module = self.__dict__["_lazy_module"]
+                if module is None:
+                    module = importlib.import_module(self.__dict__["_lazy_module_name"])
+                    self.__dict__["_lazy_module"] = module
+        return module
+
+    def __getattr__(self, name: str):
+        return getattr(self._load(), name)
+
+    def __dir__(self):
+        return dir(self._load())
+
+
+def lazy_import(module_name: str) -> LazyModule:
+    """
+    Return a proxy for `module_name` that defers the import until first use.
+
+    Example:
+    >>> pinecone = lazy_import("pinecone")
+    >>> client = pinecone.Pinecone(api_key=...)  # pinecone is imported here
+    """
+    return LazyModule(module_name)
@@ -0,0 +1,277 @@
+"""
+Retries with exponential backoff and jitter, and per-dependency circuit breakers.
+
+Only errors classified as transient (timeouts, connection errors, throttling,
+5xx) are retried; anything else fails at once. Every dependency (the LLM
+provider, Pinecone, the embedding server, the filter service) has its own
+circuit breaker: after `FAILURE_THRESHOLD` consecutive failures it opens and
+calls fail fast with `CircuitOpenError` for `RECOVERY_TIMEOUT_S`, so callers
+go straight to their fallback path instead of waiting for timeouts during an
+outage. After that a single trial call is let through (half-open). Only
+transient errors count as failures: a dependency that answers with a bad
+request or an unparsable output is up, and must not trip its breaker.
+
+Config (`RESILIENCE` key, one entry per dependency):
+    RESILIENCE:
+      LLM: {MAX_ATTEMPTS: 2, BASE_DELAY_S: 0.2, FAILURE_THRESHOLD: 5, RECOVERY_TIMEOUT_S: 30}
+      PINECONE: {MAX_ATTEMPTS: 3}
+      EMBEDDING_SERVER: {MAX_ATTEMPTS: 3, BASE_DELAY_S: 0.05}
+      FILTER_SERVICE: {MAX_ATTEMPTS: 3}
+"""
+import time
+import random
+import asyncio
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Dict, Any, Callable, Optional
+
+from src.app.utils.common.deadline import current_deadline, DeadlineExceeded
+
+
+logger = logging.getLogger(__name__)
+
+LLM = "llm"
+PINECONE = "pinecone"
+EMBEDDING_SERVER = "embedding_server"
+FILTER_SERVICE = "filter_service"
+
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+RETRYABLE_ERROR_NAMES = (
+    "RateLimit", "Timeout", "APIConnectionError", "InternalServerError",
+    "ServiceUnavailable", "Throttling", "ConnectionError",
+)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose circuit breaker is open."""
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Classify an error as transient. Covers requests, botocore and the LLM
+    SDKs (matched by class name, so none of them needs to be imported).
+    """
+    if isinstance(error, (CircuitOpenError, DeadlineExceeded)):
+        return False
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+
+    response = getattr(error, "response", None)
+    status_code = getattr(response, "status_code", None) or getattr(error, "status_code", None)
+    if status_code is None and isinstance(response, dict):
+        # botocore ClientError
+        status_code = response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+        if response.get("Error", {}).get("Code") in ("Throttling", "ThrottlingException", "SlowDown"):
+            return True
+    if status_code is not None:
+        return int(status_code) in RETRYABLE_STATUS_CODES
+
+    return any(name in type(error).__name__ for name in RETRYABLE_ERROR_NAMES)
+
+
+@dataclass
+class RetryPolicy:
+    """Exponential backoff with full jitter."""
+    max_attempts: int = 3
+    base_delay_s: float = 0.1
+    max_delay_s: float = 2.0
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]]) -> "RetryPolicy":
+        config = config or {}
+        defaults = cls()
+        return cls(
+            max_attempts=int(config.get("MAX_ATTEMPTS", defaults.max_attempts)),
+            base_delay_s=float(config.get("BASE_DELAY_S", defaults.base_delay_s)),
+            max_delay_s=float(config.get("MAX_DELAY_S", defaults.max_delay_s)),
+        )
+
+    def delay(self, attempt: int) -> float:
+        """Sleep before retry number `attempt` (starting at 1)."""
+        return random.uniform(0, min(self.max_delay_s, self.base_delay_s * 2 ** (attempt - 1)))
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker of one dependency."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout_s: float = 30.0) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout_s = recovery_timeout_s
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self) -> None:
+        """Raise `CircuitOpenError` if the call must not reach the dependency."""
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.recovery_timeout_s:
+                    self.rejected += 1
+                    raise CircuitOpenError(f"Circuit breaker of {self.name} is open")
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == self.HALF_OPEN:
+                if self._trial_in_flight:
+                    self.rejected += 1
+                    raise CircuitOpenError(f"Circuit breaker of {self.name} is half open, trial call in flight")
+                self._trial_in_flight = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def release(self) -> None:
+        """The call failed for a reason unrelated to the health of the dependency."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"Opening circuit breaker of {self.name} after {self.failures} failures")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"state": self.state, "failures": self.failures, "rejected": self.rejected}
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_policies: Dict[str, RetryPolicy] = {}
+_resilience_config: Dict[str, Any] = {}
+_registry_lock = threading.Lock()
+
+
+def configure_resilience(config: Optional[Dict[str, Any]]) -> None:
+    """Set the per-dependency retry and breaker config (the `RESILIENCE` config key)."""
+    global _resilience_config
+    with _registry_lock:
+        _resilience_config = {str(k).upper(): v for k, v in (config or {}).items()}
+        _breakers.clear()
+        _policies.clear()
+
+
+def get_breaker(dependency: str) -> CircuitBreaker:
+    with _registry_lock:
+        if dependency not in _breakers:
+            config = _resilience_config.get(dependency.upper()) or {}
+            _breakers[dependency] = CircuitBreaker(
+                dependency,
+                failure_threshold=int(config.get("FAILURE_THRESHOLD", 5)),
+                recovery_timeout_s=float(config.get("RECOVERY_TIMEOUT_S", 30)),
+            )
+        return _breakers[dependency]
+
+
+def get_retry_policy(dependency: str) -> RetryPolicy:
+    with _registry_lock:
+        if dependency not in _policies:
+            _policies[dependency] = RetryPolicy.from_config(_resilience_config.get(dependency.upper()))
+        return _policies[dependency]
+
+
+def _retry_delay(error: Exception, attempt: int, policy: RetryPolicy, breaker: Optional[CircuitBreaker], log) -> float:
+    """
+    Record a failed attempt on the breaker. Returns the sleep before the next
+    attempt, or re-raises `error` when it must not be retried.
+    """
+    retryable = is_retryable(error)
+    if breaker and retryable:
+        breaker.record_failure()
+    elif breaker:
+        breaker.release()
+    if attempt >= policy.max_attempts or not retryable:
+        raise error
+    if breaker and breaker.state == CircuitBreaker.OPEN:
+        # This very failure opened the breaker, report it rather than the open circuit
+        raise error
+    delay = policy.delay(attempt)
+    if current_deadline().remaining_ms() < delay * 1000:
+        raise error
+    log.warning(f"{type(error).__name__}: {error}. Retry {attempt}/{policy.max_attempts - 1} in {delay:.2f}s")
+    return delay
+
+
+def call_with_retry(fn: Callable, *args, policy: Optional[RetryPolicy] = None, breaker: Optional[CircuitBreaker] = None,
+                    log=None, **kwargs):
+    """
+    Call `fn`, retrying classified errors with backoff. Never sleeps past
+    the deadline of the current request. The last error is re-raised.
+    """
+    policy = policy or RetryPolicy()
+    log = log or logger
+    attempt = 0
+    while True:
+        attempt += 1
+        if breaker:
+            breaker.before_call()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            time.sleep(_retry_delay(e, attempt, policy, breaker, log))
+            continue
+        if breaker:
+            breaker.record_success()
+        return result
+
+
+async def acall_with_retry(fn: Callable, *args, policy: Optional[RetryPolicy] = None,
+                           breaker: Optional[CircuitBreaker] = None, log=None, **kwargs):
+    """Same as `call_with_retry` for a coroutine function, sleeping without blocking the event loop."""
+    policy = policy or RetryPolicy()
+    log = log or logger
+    attempt = 0
+    while True:
+        attempt += 1
+        if breaker:
+            breaker.before_call()
+        try:
+            result = await fn(*args, **kwargs)
+        except Exception as e:
+            await asyncio.sleep(_retry_delay(e, attempt, policy, breaker, log))
+            continue
+        if breaker:
+            breaker.record_success()
+        return result
+
+
+def _policy(dependency: str, max_attempts: Optional[int]) -> RetryPolicy:
+    policy = get_retry_policy(dependency)
+    if max_attempts is not None:
+        policy = RetryPolicy(max_attempts=max_attempts, base_delay_s=policy.base_delay_s, max_delay_s=policy.max_delay_s)
+    return policy
+
+
+def resilient_call(dependency: str, fn: Callable, *args, max_attempts: Optional[int] = None, **kwargs):
+    """
+    Call `fn` through the breaker and retry policy of `dependency`.
+    `max_attempts` overrides the configured attempts (e.g. 1 for slow LLM calls).
+    """
+    return call_with_retry(fn, *args, policy=_policy(dependency, max_attempts), breaker=get_breaker(dependency), **kwargs)
+
+
+async def resilient_acall(dependency: str, fn: Callable, *args, max_attempts: Optional[int] = None, **kwargs):
+    """Async version of `resilient_call`, `fn` is a coroutine function."""
+    return await acall_with_retry(fn, *args, policy=_policy(dependency, max_attempts),
+                                  breaker=get_breaker(dependency), **kwargs)
+
+
+def breaker_metrics() -> Dict[str, Dict[str, Any]]:
+    with _registry_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.metrics() for breaker in breakers}
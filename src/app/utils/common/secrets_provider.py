@@ -0,0 +1,296 @@
+"""
+Secrets provider with an in-process TTL cache.
+
+Every component of the pipeline asks for its credentials through the same
+provider, so each secret is fetched at most once per TTL instead of once per
+caller. The storage is pluggable: AWS Secrets Manager in the deployed Lambda,
+or local JSON files / environment variables so tests and benchmarks can run
+without network access.
+"""
+import os
+import json
+import time
+import logging
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Iterable, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+# =============================================================================
+# Backends
+# =============================================================================
+class SecretsBackend(ABC):
+    """
+    Abstract storage for secrets. A secret is always returned as a dictionary,
+    the same shape `SecretsManagerClient.get_secret` returns.
+    """
+
+    @abstractmethod
+    def fetch(self, secret_name: str) -> Dict[str, Any]:
+        """Fetch the secret from the underlying storage (no caching)."""
+
+
+class AWSSecretsBackend(SecretsBackend):
+    """Backend that reads secrets from AWS Secrets Manager."""
+
+    def __init__(self, region_name: str) -> None:
+        # Imported here so the local backends never need boto3 on the path
+        from src.app.utils.aws.secrets_manager_client import SecretsManagerClient
+
+        self.client = SecretsManagerClient(region_name=region_name)
+
+    def fetch(self, secret_name: str) -> Dict[str, Any]:
+        return self.client.get_secret(secret_name)
+
+
+class LocalFileSecretsBackend(SecretsBackend):
+    """
+    Backend that reads each secret from `<directory>/<secret_name>.json`.
+    Also accepts the docker secrets layout (`/run/secrets/<name>`), where the
+    file content can be plain text; in that case it is returned as `api_key`.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+
+    def fetch(self, secret_name: str) -> Dict[str, Any]:
+        for file_name in (f"{secret_name}.json", secret_name):
+            path = os.path.join(self.directory, file_name)
+            if not os.path.isfile(path):
+                continue
+            with open(path, "r", encoding="utf-8") as file:
+                content = file.read().strip()
+            try:
+                return json.loads(content)
+            except json.JSONDecodeError:
+                return {"api_key": content}
+        raise KeyError(f"Secret {secret_name} not found in {self.directory}")
+
+
+class EnvSecretsBackend(SecretsBackend):
+    """
+    Backend that reads secrets from environment variables.
+    `gma-dev-opik-api-sec` is looked up as `SECRET_GMA_DEV_OPIK_API_SEC`, and its
+    value can be either a JSON object or a plain api key.
+    """
+
+    def __init__(self, prefix: str = "SECRET_") -> None:
+        self.prefix = prefix
+
+    def env_name(self, secret_name: str) -> str:
+        normalized = "".join(c if c.isalnum() else "_" for c in secret_name)
+        return f"{self.prefix}{normalized.upper()}"
+
+    def fetch(self, secret_name: str) -> Dict[str, Any]:
+        value = os.environ.get(self.env_name(secret_name))
+        if value is None:
+            raise KeyError(f"Secret {secret_name} not found in env var {self.env_name(secret_name)}")
+        try:
+            return json.loads(value)
+        except json.JSONDecodeError:
+            return {"api_key": value}
+
+
+# =============================================================================
+# Cached provider
+# =============================================================================
+class SecretsProvider:
+    """
+    Caches secrets in memory for `ttl_seconds`, with batch prefetch and an
+    optional background refresh. Keeps the `get_secret(name) -> dict` signature
+    of `SecretsManagerClient`, so it can be used as a drop-in replacement.
+    """
+
+    def __init__(self, backend: SecretsBackend, ttl_seconds: float = 3600, max_workers: int = 4) -> None:
+        """
+        Args:
+            backend: Storage used to fetch secrets on a cache miss.
+            ttl_seconds: Time a cached secret is considered fresh.
+            max_workers: Threads used to prefetch secrets in parallel.
+        """
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.max_workers = max_workers
+        self._cache: Dict[str, tuple] = {}  # name -> (value, fetched_at)
+        self._lock = threading.Lock()
+        self._name_locks: Dict[str, threading.Lock] = {}
+        self._refresh_thread: Optional[threading.Thread] = None
+        self._stop_refresh = threading.Event()
+
+    def _lock_for(self, secret_name: str) -> threading.Lock:
+        with self._lock:
+            return self._name_locks.setdefault(secret_name, threading.Lock())
+
+    def _is_fresh(self, fetched_at: float) -> bool:
+        return time.monotonic() - fetched_at < self.ttl_seconds
+
+    def _load(self, secret_name: str) -> Dict[str, Any]:
+        value = self.backend.fetch(secret_name)
+        with self._lock:
+            self._cache[secret_name] = (value, time.monotonic())
+        return value
+
+    def get_secret(self, secret_name: str) -> Dict[str, Any]:
+        """
+        Return the secret from cache, fetching it from the backend when missing
+        or expired. Concurrent callers of the same secret share a single fetch.
+        """
+        cached = self._cache.get(secret_name)
+        if cached and self._is_fresh(cached[1]):
+            return cached[0]
+
+        with self._lock_for(secret_name):
+            # Another thread may have loaded it while we were waiting
+            cached = self._cache.get(secret_name)
+            if cached and self._is_fresh(cached[1]):
+                return cached[0]
+            logger.debug(f"Fetching secret {secret_name}")
+            return self._load(secret_name)
+
+    def prefetch(self, secret_names: Iterable[str]) -> None:
+        """
+        Fetch all the given secrets in parallel, so the cold start pays a single
+        round trip instead of one per component. Failures are logged and left to
+        surface on the first `get_secret`.
+        """
+        pending = [name for name in dict.fromkeys(secret_names) if name and name not in self._cache]
+        if not pending:
+            return
+
+        def _safe_get(name):
+            try:
+                self.get_secret(name)
+            except Exception as e:
+                logger.error(f"Could not prefetch secret {name}: {e}")
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(pending))) as executor:
+            list(executor.map(_safe_get, pending))
+
+    def refresh(self) -> None:
+        """Re-fetch every cached secret, keeping the old value if a fetch fails."""
+        for name in list(self._cache.keys()):
+            try:
+                self._load(name)
+            except Exception as e:
+                logger.warning(f"Could not refresh secret {name}, keeping cached value: {e}")
+
+    def start_background_refresh(self, interval_seconds: Optional[float] = None) -> None:
+        """
+        Start a daemon thread that refreshes cached secrets before they expire.
+        Defaults to refreshing at 80% of the TTL.
+        """
+        if self._refresh_thread and self._refresh_thread.is_alive():
+            return
+        interval = interval_seconds or self.ttl_seconds * 0.8
+        self._stop_refresh.clear()
+
+        def _loop():
+            while not self._stop_refresh.wait(interval):
+                self.refresh()
+
+        self._refresh_thread = threading.Thread(target=_loop, name="secrets-refresh", daemon=True)
+        self._refresh_thread.start()
+
+    def stop_background_refresh(self) -> None:
+        self._stop_refresh.set()
+
+    def invalidate(self, secret_name: Optional[str] = None) -> None:
+        """Drop one secret (or all of them) from the cache."""
+        with self._lock:
+            if secret_name is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(secret_name, None)
+
+
+# =============================================================================
+# Factory helpers
+# =============================================================================
+def collect_secret_names(config: Dict[str, Any]) -> List[str]:
+    """
+    Collect every secret name referenced in the pipeline config, so they can
+    be prefetched together at cold start.
+    """
+    names = [
+        config.get("OPIK_SECRET"),
+        config.get("GROQ_SECRET"),
+        (config.get("AZURE") or {}).get("OPENAI_API_SECRET"),
+        (config.get("PINECONE_DB") or {}).get("SECRET"),
+    ]
+    names.extend((config.get("SECRETS") or {}).get("PREFETCH", []))
+    return [name for name in dict.fromkeys(names) if name]
+
+
+def provider_settings(config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Resolved provider settings: each key from `config`, else from the
+    environment variable of the same name, else its default.
+    """
+    config = config or {}
+
+    def _get(key, default):
+        return config.get(key) or os.environ.get(key) or default
+
+    return {
+        "backend": str(_get("SECRETS_BACKEND", "aws")).lower(),
+        "directory": _get("SECRETS_DIR", "/run/secrets"),
+        "ttl_seconds": float(_get("SECRETS_TTL_SECONDS", 3600)),
+        "region": _get("AWS_REGION", "eu-central-1"),
+    }
+
+
+def build_secrets_provider(config: Optional[Dict[str, Any]] = None) -> SecretsProvider:
+    """
+    Build a provider from config (each missing key falls back to its environment variable).
+
+    Keys:
+        SECRETS_BACKEND: `aws` (default), `file` or `env`.
+        SECRETS_DIR: Directory used by the `file` backend.
+        SECRETS_TTL_SECONDS: Cache TTL, defaults to one hour.
+        AWS_REGION: Region used by the `aws` backend.
+    """
+    settings = provider_settings(config)
+    backend_name = settings["backend"]
+
+    if backend_name == "file":
+        backend = LocalFileSecretsBackend(directory=settings["directory"])
+    elif backend_name == "env":
+        backend = EnvSecretsBackend()
+    elif backend_name == "aws":
+        backend = AWSSecretsBackend(region_name=settings["region"])
+    else:
+        raise ValueError(f"Unsupported secrets backend: {backend_name}. Supported backends are 'aws', 'file' and 'env'.")
+
+    logger.info(f"Using {backend_name} secrets backend with a TTL of {settings['ttl_seconds']}s")
+    return SecretsProvider(backend=backend, ttl_seconds=settings["ttl_seconds"])
+
+
+_default_provider: Optional[SecretsProvider] = None
+_default_settings: Optional[Dict[str, Any]] = None
+_default_provider_lock = threading.Lock()
+
+
+def get_secrets_provider(config: Optional[Dict[str, Any]] = None) -> SecretsProvider:
+    """
+    Return the process-wide provider, creating it on first use. Every caller
+    (settings, resource initializer, ...) shares the same cache.
+
+    A provider created without config (from the environment, e.g. by
+    `src.settings` at import) is rebuilt by the first call whose config
+    resolves to other settings, so the configured backend, directory and
+    TTL always win. Calls without config never rebuild it.
+    """
+    global _default_provider, _default_settings
+    with _default_provider_lock:
+        settings = provider_settings(config)
+        if _default_provider is None or (config is not None and settings != _default_settings):
+            if _default_provider is not None:
+                logger.info(f"Rebuilding the secrets provider with the settings of the config: {settings}")
+                _default_provider.stop_background_refresh()
+            _default_provider = build_secrets_provider(config)
+            _default_settings = settings
+        return _default_provider
@@ -0,0 +1,126 @@
+"""
+Single-flight coalescing of identical in-flight calls.
+
+The first caller of a key runs the function; callers arriving with the same
+key while it is running wait for it and get its result (or its error)
+instead of running it again. Nothing is kept once the call finishes, this is
+not a cache.
+
+Config (`SINGLE_FLIGHT` key):
+    ENABLED: Coalesce whole requests in the handler (default true).
+    LOCATION_DECIMALS: Decimals of lat/lng in the request key (4 is ~10m).
+    BUDGET_BUCKET_MS: Requests only share a run with requests whose remaining
+        budget falls in the same bucket (default 1000), so a caller with a
+        large budget never gets the degraded response of a short one.
+"""
+import copy
+import logging
+import threading
+from typing import Dict, Any, Callable, Hashable, Tuple
+
+from src.app.monitoring.tracing import current_span
+from src.app.utils.common.deadline import current_deadline, DeadlineExceeded
+
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesces concurrent calls sharing a key, see module docstring."""
+
+    def __init__(self, name: str, copy_result: bool = False) -> None:
+        """
+        Args:
+            name: Used in logs and metrics.
+            copy_result: Give every waiter its own deep copy of the result,
+                for results the callers mutate.
+        """
+        self.name = name
+        self.copy_result = copy_result
+        self.calls = 0
+        self.coalesced = 0
+        self._in_flight: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable, /, *args, **kwargs) -> Tuple[Any, bool]:
+        """
+        Run `fn(*args, **kwargs)` unless a call with the same key is in flight.
+
+        Returns:
+            tuple: (result, shared), `shared` is True when the result came from
+            another caller.
+        """
+        with self._lock:
+            self.calls += 1
+            call = self._in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = self._in_flight[key] = _Call()
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+
+        if leader:
+            return self._lead(key, call, fn, args, kwargs), False
+
+        # A waiter never waits past its own deadline
+        remaining_ms = current_deadline().remaining_ms()
+        timeout = None if remaining_ms == float("inf") else remaining_ms / 1000
+        if not call.done.wait(timeout):
+            raise DeadlineExceeded(f"Gave up waiting for the in-flight {self.name} call")
+        current_span().set(coalesced=True)
+        if call.error is not None:
+            raise call.error
+        return (copy.deepcopy(call.result) if self.copy_result else call.result), True
+
+    def _lead(self, key, call: _Call, fn, args, kwargs):
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                # No waiter can join once the key is gone, so `waiters` is final
+                self._in_flight.pop(key, None)
+                waiters = call.waiters
+            if call.error is None and waiters:
+                # Waiters copy a snapshot, the leader is free to mutate its own result
+                call.result = copy.deepcopy(result) if self.copy_result else result
+            call.done.set()
+        return result
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "name": self.name,
+                "calls": self.calls,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._in_flight),
+            }
+
+
+_groups: Dict[str, SingleFlight] = {}
+_groups_lock = threading.Lock()
+
+
+def get_single_flight(name: str, copy_result: bool = False) -> SingleFlight:
+    """Shared coalescing group of `name` (one per stage or endpoint)."""
+    with _groups_lock:
+        if name not in _groups:
+            _groups[name] = SingleFlight(name, copy_result=copy_result)
+        return _groups[name]
+
+
+def single_flight_metrics() -> Dict[str, Dict[str, Any]]:
+    with _groups_lock:
+        groups = list(_groups.values())
+    return {group.name: group.metrics() for group in groups}
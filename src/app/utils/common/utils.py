@@ -5,21 +5,23 @@ import logging
 from typing import Dict, Any
 
 
-def retry(max_retries=3, logger=None):
+def retry(max_retries=3, logger=None, base_delay_s=0.1, max_delay_s=2.0):
+    """
+    Retry a function on transient errors, with exponential backoff and jitter.
+
+    Errors that are not transient (see `resilience.is_retryable`) are raised
+    at once, and the last error is re-raised once the retries are exhausted.
+    """
     if logger is None:
         logger = logging.getLogger(__name__)
 
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
-            retries = 0
-            while retries < max_retries:
-                try:
-                    return func(*args, **kwargs)
-                except Exception as e:
-                    logger.error(f"Exception occurred: {e}. Retrying...")
-                    retries += 1
-            raise Exception("Max retries exceeded. Could not process reviews.")
+            from src.app.utils.common.resilience import RetryPolicy, call_with_retry
+
+            policy = RetryPolicy(max_attempts=max_retries, base_delay_s=base_delay_s, max_delay_s=max_delay_s)
+            return call_with_retry(func, *args, policy=policy, log=logger, **kwargs)
         return wrapper
     return decorator
 
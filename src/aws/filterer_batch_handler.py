@@ -0,0 +1,265 @@
+"""
+Batch entry point of the filtering microservice: many `FilterEvent`s per call.
+
+Meant for offline jobs (evaluation, cache warming, digests). Compared with one
+`data_filterer_handler` call per query, the batch:
+    - dedupes identical requests (same `request_key`),
+    - embeds every distinct query in a single `embed_documents` call, and
+      the translated ones in a second call once the filters are extracted,
+    - sends each distinct filter service request once,
+    - fetches the union of the S3 summaries once,
+    - reranks every query in one event loop, so their chunks share one
+      fan-out (bounded by the process-wide rerank limiter).
+
+Each item gets its own response, in the input order, and a failing item does
+not fail the batch. The items share the budget of the batch, but each one
+has its own degraded flags: a slow item does not flag the others.
+
+Event:
+    {"events": [FilterEvent, ...], "deadline_ms": optional budget of the whole batch}
+"""
+import copy
+import json
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+
+from pydantic import ValidationError
+
+from src.aws import filterer_flow_handler as pipeline
+from src.app.schemas.data_models import FilterEvent
+from src.app.services.request_key import request_key
+from src.app.monitoring.tracing import start_trace, span
+from src.app.utils.common.deadline import Deadline, use_deadline, current_deadline
+
+
+logger = pipeline.logger
+BATCH_CONFIG = pipeline.config.get("BATCH") or {}
+
+
+class BatchItem:
+    """Intermediate state of one distinct request of the batch."""
+
+    def __init__(self, event_data: FilterEvent) -> None:
+        self.event_data = event_data
+        self.query = event_data.filter_data.natural_query
+        self.country_code, self.city_code = pipeline.request_city(event_data)
+        self.filters = None
+        self.params = None
+        self.body = None
+        self.results = None
+        self.recommended = []
+        self.rest = []
+        self.response = None
+        self.error: Optional[str] = None
+        # Budget of the batch, degraded flags of this item only
+        self.deadline = current_deadline().scope()
+
+
+def _run_item(fn, item: BatchItem) -> None:
+    try:
+        with use_deadline(item.deadline):
+            fn(item)
+    except Exception as e:
+        logger.exception(f"Batch item failed: {e}")
+        item.error = f"{type(e).__name__}: {e}"
+
+
+def _shared_stage(items: List[BatchItem], fn, *args):
+    """Run a stage shared by `items`, flagging each of them with what the stage degraded."""
+    scope = current_deadline().scope()
+    try:
+        with use_deadline(scope):
+            return fn(*args)
+    finally:
+        for item in items:
+            for flag in scope.degraded:
+                item.deadline.mark_degraded(flag)
+
+
+def _for_each(executor: ThreadPoolExecutor, fn, items: List[BatchItem]) -> None:
+    """Run `fn` on every item still alive, concurrently, keeping the trace and deadline."""
+    futures = [
+        executor.submit(contextvars.copy_context().run, _run_item, fn, item)
+        for item in items if item.error is None
+    ]
+    for future in futures:
+        future.result()
+
+
+def _extract_filters(item: BatchItem) -> None:
+    item.filters, item.params, state = pipeline.get_filters(
+        item.query, item.event_data.filter_type, item.city_code, item.country_code
+    )
+    item.query = state.get("translated_query") or item.query
+    item.body = pipeline.build_filter_request(item.event_data, item.filters)
+
+
+def _call_filter_service(executor: ThreadPoolExecutor, items: List[BatchItem]) -> None:
+    """One filter service call per distinct (body, params), shared by the items that sent it."""
+    groups: Dict[str, List[BatchItem]] = {}
+    for item in items:
+        if item.error is None:
+            key = json.dumps([item.body, item.params], sort_keys=True, default=str)
+            groups.setdefault(key, []).append(item)
+
+    def _call(group: List[BatchItem]):
+        try:
+            results = _shared_stage(group, pipeline.call_filter_service, group[0].body, group[0].params)
+        except Exception as e:
+            logger.exception(f"Filter service call failed for {len(group)} batch items: {e}")
+            for item in group:
+                item.error = f"{type(e).__name__}: {e}"
+            return
+        for item in group:
+            item.results = copy.deepcopy(results)
+
+    futures = [executor.submit(contextvars.copy_context().run, _call, group) for group in groups.values()]
+    for future in futures:
+        future.result()
+
+
+def _score_and_split(item: BatchItem) -> None:
+    if not item.results:
+        return
+    results = pipeline.score_candidates(item.results, item.query, item.city_code)
+    item.recommended, item.rest = pipeline.split_by_score(results, 30)
+
+
+def _fetch_summaries(executor: ThreadPoolExecutor, items: List[BatchItem], max_workers: int) -> None:
+    """Fetch the summary of every recommended place of the batch once, per city."""
+    union: Dict[tuple, Dict[str, Any]] = {}
+    for item in items:
+        if item.error is None:
+            for place in item.recommended:
+                union.setdefault((item.country_code, item.city_code, place["id"]),
+                                 {"id": place["id"], "processed_daterange_001": place.get("processed_daterange_001")})
+    if not union:
+        return
+
+    by_city: Dict[tuple, List[Dict[str, Any]]] = {}
+    for (country_code, city_code, _), place in union.items():
+        by_city.setdefault((country_code, city_code), []).append(place)
+    city_items: Dict[tuple, List[BatchItem]] = {}
+    for item in items:
+        if item.error is None:
+            city_items.setdefault((item.country_code, item.city_code), []).append(item)
+    slice_size = max(1, -(-len(union) // max_workers))
+    # A partial fetch flags the items of its city only
+    futures = [
+        executor.submit(contextvars.copy_context().run, _shared_stage, city_items[city], pipeline.get_data,
+                        pipeline.s3_client, places[i:i + slice_size], *city)
+        for city, places in by_city.items()
+        for i in range(0, len(places), slice_size)
+    ]
+    for future in futures:
+        try:
+            future.result()
+        except Exception as e:
+            logger.exception(f"Summary fetch failed: {e}")
+
+    for item in items:
+        for place in item.recommended:
+            metadata = union[(item.country_code, item.city_code, place["id"])].get("metadata")
+            if metadata is not None:
+                place["metadata"] = metadata
+
+
+async def _rerank(item: BatchItem) -> None:
+    # Each item runs in its own task, so its deadline scope does not leak to the others
+    with use_deadline(item.deadline):
+        try:
+            if not item.results:
+                item.response = pipeline.build_response(item.filters, [], [])
+                return
+            recommended, rest = pipeline.apply_global_fields(item.event_data, item.recommended, item.rest)
+            recommended = await pipeline.arerank_recommended(recommended, item.query)
+            item.response = pipeline.build_response(item.filters, recommended, rest)
+        except Exception as e:
+            logger.exception(f"Batch item failed: {e}")
+            item.error = f"{type(e).__name__}: {e}"
+
+
+async def _rerank_all(items: List[BatchItem]) -> None:
+    """Rerank every item in one event loop: their chunks share one fan-out."""
+    await asyncio.gather(*(_rerank(item) for item in items if item.error is None))
+
+
+def _prime_queries(queries: List[str]) -> None:
+    """Embed the queries in one bulk call, so their `embed_query` calls need no request."""
+    try:
+        pipeline.agent.cuisine_type_retriever.embedding_model.prime_query_embeddings(queries)
+    except Exception as e:
+        logger.error(f"Could not embed the batch queries in bulk, embedding one by one: {e}")
+
+
+def run_batch(events: List[Dict[str, Any]], max_workers: int = 8) -> List[Dict[str, Any]]:
+    """
+    Args:
+        events (list): Raw `FilterEvent` payloads.
+        max_workers (int): Items processed concurrently in each stage.
+
+    Returns:
+        list: One response per event, in the input order. Failed items have
+        an `error` and a 4xx/5xx `statusCode`.
+    """
+    responses: List[Optional[Dict[str, Any]]] = [None] * len(events)
+    items: Dict[str, BatchItem] = {}
+    positions: Dict[str, List[int]] = {}
+    for index, event in enumerate(events):
+        try:
+            event_data = FilterEvent.model_validate(event)
+        except ValidationError as e:
+            responses[index] = {"statusCode": 400, "error": str(e)}
+            continue
+        key = request_key(event_data)
+        items.setdefault(key, BatchItem(event_data))
+        positions.setdefault(key, []).append(index)
+
+    unique = list(items.values())
+    logger.info(f"Batch of {len(events)} events, {len(unique)} distinct requests")
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="batch") as executor:
+        with span("batch_embed", queries=len(unique)):
+            # The catalog retrievers embed the query when it needs no translation, one bulk call for all of them
+            _prime_queries([item.query for item in unique])
+        with span("batch_extract_filters"):
+            _for_each(executor, _extract_filters, unique)
+        translated = [item.query for item in unique if item.error is None and item.query != item.event_data.filter_data.natural_query]
+        if translated:
+            with span("batch_embed_translated", queries=len(translated)):
+                # The candidates are scored against the translated query
+                _prime_queries(translated)
+        with span("batch_filter_service"):
+            _call_filter_service(executor, unique)
+        with span("batch_vector_scoring"):
+            _for_each(executor, _score_and_split, unique)
+        with span("batch_s3_fetch"):
+            _fetch_summaries(executor, unique, max_workers)
+        with span("batch_rerank"):
+            asyncio.run(_rerank_all(unique))
+
+    for key, item in items.items():
+        for n, index in enumerate(positions[key]):
+            if item.error is not None:
+                responses[index] = {"statusCode": 500, "error": item.error}
+            else:
+                responses[index] = item.response if n == 0 else copy.deepcopy(item.response)
+    return responses
+
+
+def data_filterer_batch_handler(event, context):
+    """
+    Handler of the batch entry point, see module docstring.
+
+    Returns:
+        dict: {"statusCode": 200, "results": [one response per event]}
+    """
+    events = event.get("events") or []
+    with start_trace("data_filterer_batch_handler", events=len(events)):
+        # A single budget for the whole batch, each item keeps its own degraded flags (`BatchItem.deadline`)
+        deadline = Deadline.for_request(pipeline.DEADLINE_CONFIG, event.get("deadline_ms"), context)
+        with use_deadline(deadline):
+            results = run_batch(events, max_workers=int(BATCH_CONFIG.get("MAX_WORKERS", 8)))
+    return {"statusCode": 200, "results": results}
@@ -1,4 +1,11 @@
+## Must run before any other import, so the startup and memory profiles cover all of them
+from src.app.monitoring.startup_profiler import startup_profiler
+from src.app.monitoring.memory_profiler import memory_profiler
+memory_profiler.install(startup_profiler)
+startup_profiler.install()
+
 import asyncio
+from typing import Iterator, Generator
 
 from pydantic import ValidationError
 from src.app.schemas.data_models import *  # Assuming you placed your models in src/app/models.py
@@ -13,6 +20,22 @@ import yaml
 from pathlib import Path
 from src.app.services.business_formatter import format_business_metadata
 from src.app.utils.common.time_decor import timeit, timeblock
+from src.app.monitoring.tracing import start_trace, span, traced, current_span, annotate_request, trace_exporter
+from src.app.monitoring.traffic_capture import traffic_recorder
+from src.app.utils.common.hedging import get_hedger
+from src.app.utils.common.deadline import Deadline, DeadlineExceeded, use_deadline, current_deadline, mark_degraded
+from src.app.utils.common.resilience import (
+    resilient_call, resilient_acall, get_breaker, is_retryable, CircuitOpenError, LLM, PINECONE, FILTER_SERVICE
+)
+from src.app.utils.common.single_flight import get_single_flight
+from src.app.utils.common import json_codec
+from src.app.services.request_key import request_key
+from src.app.services.embedding_store import EmbeddingStoreManager
+from src.app.services.summary_shards import SummaryShardStore
+from src.app.services.response_cache import ResponseCache
+from src.app.services.precomputed_results import PrecomputedResultsStore
+from src.app.services.prompt_compactor import PromptCompactor
+from src.app.services.city_partitions import CityPartitions, city_name
 
 
 # Get the current file's directory
@@ -28,18 +51,100 @@ config_path = current_dir / "app" / "config" / "pipeline_config.yaml"
 with open(config_path, "r", encoding='utf-8') as file:
     chain_config = yaml.safe_load(file)
 ## Create connections to the SDKs outside the main function:
-resource_initializer = ResourceInitializer()
+with startup_profiler.step("resource_initializer"):
+    resource_initializer = ResourceInitializer()
 
 ## TODO: Rename
-reranker_client =resource_initializer.get_reranker(chain_config)
-agent = resource_initializer.get_filterer_agent(chain_config)
-
-s3_client = resource_initializer.get_s3_client()
+with startup_profiler.step("reranker"):
+    reranker_client =resource_initializer.get_reranker(chain_config)
+with startup_profiler.step("reason_generator"):
+    reason_generator = resource_initializer.get_reason_generator(chain_config)
+with startup_profiler.step("filterer_agent"):
+    agent = resource_initializer.get_filterer_agent(chain_config)
+
+with startup_profiler.step("s3_client"):
+    s3_client = resource_initializer.get_s3_client()
 logger = resource_initializer.logger
 config = resource_initializer.config
 
 PINECONE_URL = config.get("PINECONE_URL")
 API_URL = config.get("API_URL")
+DEADLINE_CONFIG = config.get("DEADLINE") or {}
+SINGLE_FLIGHT_CONFIG = config.get("SINGLE_FLIGHT") or {}
+
+# City of the requests without a city code, and the cities this worker loads at startup
+city_partitions = CityPartitions.from_config(config.get("CITIES"))
+
+# Local candidate scoring (None unless EMBEDDING_STORE.ENABLED), the Pinecone lambda otherwise
+embedding_stores = EmbeddingStoreManager.from_config(config.get("EMBEDDING_STORE"))
+
+SUMMARY_BUCKET = config.get("SUMMARY_BUCKET") or "gma-dev-data-364969088603-eu-central-1-s3"
+# Packed per-city summaries (None unless SUMMARY_SHARDS.ENABLED), one S3 object per business otherwise
+summary_shards = SummaryShardStore.from_config(config.get("SUMMARY_SHARDS"), default_bucket=SUMMARY_BUCKET)
+
+# Whole responses of repeated searches (None unless RESPONSE_CACHE.ENABLED), dropped per city on new summaries
+response_cache = ResponseCache.from_config(config.get("RESPONSE_CACHE"))
+if response_cache and summary_shards:
+    summary_shards.listeners.append(lambda country, city, version: response_cache.invalidate_city(f"{country}/{city}"))
+
+# Offline results of the popular searches of each city (None unless PRECOMPUTED_RESULTS.ENABLED)
+precomputed_results = PrecomputedResultsStore.from_config(config.get("PRECOMPUTED_RESULTS"), default_bucket=SUMMARY_BUCKET)
+
+# Per-business token budget of the reranking prompt (None unless RERANK_COMPACTION.ENABLED)
+prompt_compactor = PromptCompactor.from_config(config.get("RERANK_COMPACTION"))
+
+
+def precompute_inputs(country_code: str, city_code: str, load: bool = False) -> Optional[dict]:
+    """
+    Versions of the data the results of a city are computed from, see `precomputed_results`.
+    On the request path (`load=False`) only the loaded snapshots are read, and
+    None is returned when one of them is not loaded yet (no precomputed match).
+    """
+    if load:
+        shard = summary_shards.get(country_code, city_code) if summary_shards else None
+        store = embedding_stores.get(city_code) if embedding_stores else None
+        summaries, embeddings = shard.version if shard else None, store.version if store else None
+    else:
+        summaries = summary_shards.loaded_version(country_code, city_code) if summary_shards else None
+        embeddings = embedding_stores.loaded_version(city_code) if embedding_stores else None
+        if (summary_shards and summaries is None) or (embedding_stores and embeddings is None):
+            return None
+    return {
+        "summaries": summaries,
+        "embeddings": embeddings,
+        "index": (config.get("PRECOMPUTED_RESULTS") or {}).get("INDEX_VERSION"),
+    }
+
+
+def request_city(event_data) -> tuple:
+    """(country, city) of a request, the default city when it has no city code."""
+    return city_partitions.resolve(event_data.country_code, event_data.city_code)
+
+
+def cache_city(event_data: FilterEvent) -> str:
+    """City the cached responses of a request belong to, and its routing key."""
+    return city_name(request_city(event_data))
+
+
+def preload_cities() -> None:
+    """Loads the snapshots of the preloaded cities, so their first requests find them warm."""
+    for country_code, city_code in city_partitions.preload:
+        with startup_profiler.step(f"city:{country_code}/{city_code}"):
+            if summary_shards:
+                summary_shards.get(country_code, city_code)
+            if embedding_stores:
+                embedding_stores.get(city_code)
+
+def resident_cities() -> dict:
+    """Cities whose snapshots and cached responses this worker holds, per cache."""
+    return {
+        "summaries": [city_name(city) for city in summary_shards.cities()] if summary_shards else [],
+        "embeddings": embedding_stores.cities() if embedding_stores else [],
+        "responses": list(response_cache.metrics()["cities"]) if response_cache else [],
+    }
+
+# Identical concurrent requests share one pipeline run, each caller gets its own copy
+request_flight = get_single_flight("request", copy_result=True)
 
 # Filter mapping and service
 filter_mapping = {
@@ -50,6 +155,23 @@ filter_mapping = {
 
 filter_service = FilterService(default_mapping=filter_mapping)
 
+preload_cities()
+
+startup_profiler.finish(logger)
+
+if memory_profiler.enabled:
+    from src.app.services.sentence_transformers_embeddings import SentenceTransformerAPIEmbeddings
+
+    # The containers only: the clients the services hold are not part of their cache
+    memory_profiler.register_cache("response_cache", lambda: response_cache.size_bytes if response_cache else 0)
+    memory_profiler.register_cache("primed_query_embeddings", lambda: SentenceTransformerAPIEmbeddings._primed_queries)
+    memory_profiler.register_cache("reasons", lambda: reason_generator._cache)
+    memory_profiler.register_cache("precomputed_results", lambda: precomputed_results._sets if precomputed_results else 0)
+    memory_profiler.register_cache("summary_shard_indexes", lambda: summary_shards._shards if summary_shards else 0)
+    memory_profiler.register_cache("embedding_store_ids", lambda: embedding_stores._stores if embedding_stores else 0)
+    memory_profiler.finish_startup(logger)
+
+@traced("parse")
 def parse_event(event: dict) -> FilterEvent:
     try:
         return FilterEvent.model_validate(event)
@@ -58,7 +180,8 @@ def parse_event(event: dict) -> FilterEvent:
         raise
 
 @timeit("get_filters", logger)
-def get_filters(input_query: str, filter_type: Optional[str], city_code: Optional[str],country_code: Optional[str] = "es" ) -> (dict, dict):
+@traced("get_filters")
+def get_filters(input_query: str, filter_type: Optional[str], city_code: Optional[str],country_code: Optional[str] = None) -> (dict, dict):
     filter_state = agent.graph.invoke({"question": input_query})
     filters = filter_state['filters']
     logger.info(f"Retrieved filters: {filter_state['filters']}")
@@ -75,54 +198,109 @@ def get_filters(input_query: str, filter_type: Optional[str], city_code: Optiona
 
 
 @timeit("call_filter_service", logger)
+@traced("filter_service")
 def call_filter_service(body: dict, params: dict) -> list:
     logger.info(f"Calling filter service with filters: {body} {params}")
-    response = requests.post(API_URL, data=json.dumps(body), params=params)
-    data = response.json()
-    return data.get("body", [])
+    payload = json_codec.dumps(body)
+
+    # No fallback without candidates: retried on transient errors, fails fast if the breaker is open
+    def _post():
+        response = requests.post(API_URL, data=payload, params=params, headers=json_codec.JSON_HEADERS,
+                                 timeout=current_deadline().timeout("filter_service"))
+        response.raise_for_status()
+        return response
+
+    response = resilient_call(FILTER_SERVICE, _post)
+    data = json_codec.loads(response.content)
+    candidates = data.get("body", [])
+    current_span().set(request_bytes=len(payload), response_bytes=len(response.content), candidates=len(candidates))
+    return candidates
 
 @timeit("call_pinecone", logger)
-def call_pinecone(ids: list, query: str, city: str = "vlc") -> list:
-    payload = {"business_IDS": ids, "query": query}
-    response = requests.post(PINECONE_URL, data=json.dumps(payload), params={"city": city}, timeout=100)
-    return response.json().get("body", {}).get("matches", [])
+@traced("pinecone")
+def call_pinecone(ids: list, query: str, city: str) -> list:
+    payload = json_codec.dumps({"business_IDS": ids, "query": query})
+
+    def _post():
+        response = get_hedger("pinecone").call(
+            requests.post, PINECONE_URL, data=payload, params={"city": city}, headers=json_codec.JSON_HEADERS,
+            timeout=current_deadline().timeout("pinecone")
+        )
+        response.raise_for_status()
+        return response
 
-@timeit("Rerank", logger)
-def rerank_businesses(businesses: list, query: str) -> list:
+    response = resilient_call(PINECONE, _post)
+    matches = json_codec.loads(response.content).get("body", {}).get("matches", [])
+    current_span().set(candidates=len(ids), request_bytes=len(payload), response_bytes=len(response.content), matches=len(matches))
+    return matches
+
+@timeit("score_locally", logger)
+@traced("local_scoring")
+def score_locally(ids: list, query: str, city: str) -> Optional[list]:
+    """
+    Scores the candidates against the local embedding snapshot of the city,
+    in the `matches` shape of `call_pinecone`. None when there is no snapshot.
+    """
+    store = embedding_stores.get(city) if embedding_stores else None
+    if store is None:
+        return None
+    query_vector = agent.cuisine_type_retriever.embedding_model.embed_query(query)
+    matches = store.score(query_vector, ids)
+    current_span().set(candidates=len(ids), matches=len(matches), snapshot=store.version)
+    return matches
+
+@traced("rerank")
+async def arerank_businesses(businesses: list, query: str) -> list:
+    """
+    Scores the businesses with the reranking graph and returns the scored
+    ones, best first. Runs in the caller's event loop, so the reranks of
+    several requests (a batch) share one fan-out.
+    """
     logger.info(f"Starting reranking for {len(businesses)} businesses")
-    formatted = [format_business_metadata(b.get("metadata")) for b in businesses]
+    current_span().set(businesses=len(businesses))
+    formatted = format_for_rerank(businesses, query)
     logger.info(f"Formatted {len(formatted)} businesses for reranking")
     
-    # reranker_chain = reranker_client.set_rag_pipeline(formatted)
-    # result = reranker_chain.invoke({"input": query},config={"callbacks": [reranker_client.opik_tracer]})
-
-    # reranker_client is what get_reranker(...) now returns (RerankingGraph)
-    logger.info("Building reranker graph...")
+    # reranker_client is what get_reranker(...) returns (RerankingGraph)
     graph = reranker_client.build()
 
-    
-
-# Invoke with asyncio so fan-out runs concurrently
-# initial_state = {"input": ..., "business": [...]}  # your data
-# result = await graph.ainvoke(initial_state)
+    # The chunks are scored concurrently (bounded process-wide by RERANK.MAX_CONCURRENCY)
     logger.info("Invoking reranker graph with OpikTracer...")
-    result = asyncio.run(
-        graph.ainvoke(
-            {"input": query, "business": formatted},
-            config={"callbacks": [reranker_client.opik_tracer]},
-        )
+    result = await graph.ainvoke(
+        {"input": query, "business": formatted},
+        config={"callbacks": [reranker_client.opik_tracer]},
     )
-    logger.info(f"Reranker result: {result.keys() if result else 'None'}")
+    failed_chunks = reranker_client.failed_chunks(result)
+    current_span().set(chunks=len(result.get("chunks") or []), failed_chunks=len(failed_chunks))
+    if failed_chunks:
+        logger.error(f"Rerank chunks failed after retries: {failed_chunks}")
+        mark_degraded("rerank_partial")
+
+    return apply_scores(businesses, scores_by_id(result.get("sorted_businesses", [])))
+
+
+def format_for_rerank(businesses: list, query: str) -> list:
+    """Prompt text of each business, compacted to its token budget when enabled."""
+    if prompt_compactor:
+        formatted, tokens_saved = prompt_compactor.compact_all([b.get("metadata") for b in businesses], query)
+        current_span().set(tokens_saved=tokens_saved)
+        return formatted
+    return [format_business_metadata(b.get("metadata")) for b in businesses]
 
-    scores_by_id = {item['business_id']: {'score': item['score'], 'reason': item['reason']}
-                    for item in result.get("sorted_businesses", [])}
 
-    # Update original businesses with scores and reasons
+def scores_by_id(business_scores: list) -> dict:
+    """business_id -> {score, reason} of the scores of the reranker."""
+    # No reasons in score-only mode, `data_reasons_handler` generates them for the visible results
+    return {item['business_id']: {'score': item['score'], 'reason': item.get('reason')} for item in business_scores}
+
+
+def apply_scores(businesses: list, scores: dict) -> list:
+    """Updates the businesses with their scores and reasons. Only the scored ones are kept, best first."""
     updated_businesses = []
     for biz in businesses:
         biz_id = biz.get("metadata", {}).get("business_id")
-        if biz_id in scores_by_id:
-            biz.update(scores_by_id[biz_id])
+        if biz_id in scores:
+            biz.update(scores[biz_id])
             updated_businesses.append(biz)
 
     # Sort businesses based on score
@@ -132,6 +310,7 @@ def rerank_businesses(businesses: list, query: str) -> list:
 
 
 @timeit("Split by Score", logger)
+@traced("split_by_score")
 def split_by_score(data: list, n: int):
     """
     Splits a list of dictionaries into two lists based on a score threshold.
@@ -157,22 +336,50 @@ def split_by_score(data: list, n: int):
     return top_n, remaining
 
 @timeit("get_data", logger)
-def get_data(s3_client, places: List, country_code: str = "es", city_code: str = "vlc"):
+@traced("s3_fetch")
+def get_data(s3_client, places: List, country_code: str, city_code: str):
     """
     Retrieve from S3 the metadata for the business
     """
 
-    for place in places:
+    from_shard = 0
+    shard = summary_shards.get(country_code, city_code) if summary_shards else None
+    if shard is not None:
+        with span("shard_fetch", shard=shard.version) as shard_span:
+            try:
+                summaries = shard.get_many([(place.get("id"), place.get("processed_daterange_001")) for place in places])
+            except Exception as e:
+                logger.error(f"Summary shard read failed, reading the summaries one by one: {e}")
+                summaries = {}
+            for place in places:
+                if place.get("id") in summaries:
+                    place['metadata'] = summaries[place.get("id")]
+            from_shard = len(summaries)
+            shard_span.set(hits=from_shard, misses=len(places) - from_shard)
+
+    # Per-object layout, for whatever the shard does not have
+    deadline = current_deadline()
+    missing = [place for place in places if shard is None or place.get("id") not in summaries]
+    for fetched, place in enumerate(missing):
+        if deadline.should_degrade("s3_fetch"):
+            logger.warning(f"Running out of budget, returning metadata for {from_shard + fetched}/{len(places)} places")
+            mark_degraded("partial_metadata")
+            break
         business_id = place.get("id")
         date_range = place.get("processed_daterange_001")
         language = "en"
         # Construct the S3 key
         s3_key = f'prc/geo/{country_code}/{city_code}/{business_id}/summary/001_{date_range}_{language}.json'
 
-        summary_json = s3_client.load_json_as_dict(bucket_name="gma-dev-data-364969088603-eu-central-1-s3", key=s3_key)
+        with span("s3_fetch_summary", business_id=business_id):
+            summary_json, _ = get_single_flight("s3_summary").do(
+                s3_key, get_hedger("s3_summary").call,
+                s3_client.load_json_as_dict, bucket_name=SUMMARY_BUCKET, key=s3_key
+            )
 
         place['metadata'] = summary_json
 
+    current_span().set(places=len(places))
     return places
 
 
@@ -188,13 +395,140 @@ def data_filterer_handler(event, context):
     Returns:
         _type_: _description_
     """
+    return handle_filter_event(event, context)
+
+
+def data_filterer_handler_bytes(event, context) -> bytes:
+    """
+    Same as `data_filterer_handler`, with the response serialized to JSON
+    bytes (server mode). Cached responses are sent as stored, with no
+    parse / re-serialize round trip.
+    """
+    return handle_filter_event(event, context, raw=True)
+
+
+def handle_filter_event(event, context, raw: bool = False):
     logger.info("Event----> %s", str(event))
-    event_data = parse_event(event)
-    query = event_data.filter_data.natural_query
-    filters, params, full_state = get_filters(query, event_data.filter_type, event_data.city_code,  event_data.country_code)
-    logger.info("Extracted filters ---> %s", str(filters))
-    logger.info("Extracted filter keys ---> %s", list(filters.keys()))
-    
+    event_data, trace, status = None, None, "ok"
+    try:
+        with start_trace("data_filterer_handler") as trace:
+            event_data = parse_event(event)
+            trace.root.set(filter_type=event_data.filter_type, city_code=event_data.city_code, city=cache_city(event_data))
+            deadline = Deadline.for_request(DEADLINE_CONFIG, event_data.deadline_ms, context)
+            response = None
+            if precomputed_results:
+                city = request_city(event_data)
+                with span("precomputed_lookup"):
+                    response = precomputed_results.lookup(event_data, city, lambda: precompute_inputs(*city))
+                trace.root.set(precomputed=response is not None)
+            cache_key = request_key(event_data, response_cache.location_decimals) if response_cache else None
+            if response is None and response_cache:
+                cached = response_cache.get_raw(cache_key)
+                if cached is not None:
+                    response = cached if raw else json_codec.loads(cached)
+                trace.root.set(cache_hit=cached is not None)
+            if response is None:
+                with use_deadline(deadline):
+                    if SINGLE_FLIGHT_CONFIG.get("ENABLED", True):
+                        key = (
+                            request_key(event_data, int(SINGLE_FLIGHT_CONFIG.get("LOCATION_DECIMALS", 4))),
+                            deadline.budget_bucket(float(SINGLE_FLIGHT_CONFIG.get("BUDGET_BUCKET_MS", 1000))),
+                        )
+                        response, coalesced = request_flight.do(key, run_filter_pipeline, event_data)
+                        trace.root.set(coalesced=coalesced)
+                    else:
+                        response = run_filter_pipeline(event_data)
+                if response_cache:
+                    response_cache.put(cache_key, cache_city(event_data), response)
+
+            with span("response") as response_span:
+                if raw and not isinstance(response, bytes):
+                    response = json_codec.dumps(response)
+                if trace_exporter.mode != "off":
+                    # The size is only known in raw mode, a dict is not serialized again just to measure it
+                    if isinstance(response, bytes):
+                        response_span.set(payload_bytes=len(response))
+                    else:
+                        response_span.set(
+                            recommended=len(response["recommended_result"]),
+                            rest=len(response["rest_result"]),
+                        )
+    except Exception as e:
+        status = type(e).__name__
+        raise
+    finally:
+        # Failed requests are captured too, with their error as status
+        if event_data is not None:
+            traffic_recorder.record(event_data, trace, status=status)
+    return response
+
+
+def data_reasons_handler(event, context):
+    """
+    Reasons of the visible results of a search, generated on demand (see
+    `ReasonGenerator`), for the score-only rerank mode.
+
+    Places without metadata are fetched from S3, which needs their
+    `processed_daterange_001`; the ones without it get no reason and are
+    listed in `skipped`.
+
+    Args:
+        event (dict): A `ReasonEvent`.
+
+    Returns:
+        dict: {"statusCode": 200, "reasons": {business_id: reason}, "skipped": [business_id]},
+        or a 400 (invalid event), 503 (dependency down), 504 (out of time) or 500 with the error as `body`.
+        A dependency error is returned when no reason at all could be generated.
+    """
+    with start_trace("data_reasons_handler") as trace:
+        try:
+            event_data = ReasonEvent.model_validate(event)
+        except ValidationError as e:
+            logger.error(f"Invalid input: {e}")
+            return {"statusCode": 400, "body": str(e)}
+        places = [place.model_dump() for place in event_data.places]
+        country_code, city_code = request_city(event_data)
+        trace.root.set(places=len(places), city_code=event_data.city_code, city=f"{country_code}/{city_code}")
+        missing = [place for place in places if not place.get("metadata")]
+        # Without a daterange the summary key can not be built (`001_None_en.json`)
+        skipped = [place["id"] for place in missing if not place.get("processed_daterange_001")]
+        missing = [place for place in missing if place.get("processed_daterange_001")]
+        if skipped:
+            logger.warning(f"No metadata nor daterange for {len(skipped)} places, skipping their reasons: {skipped}")
+        trace.root.set(skipped=len(skipped))
+        try:
+            if missing:
+                get_data(s3_client=s3_client, places=missing, country_code=country_code, city_code=city_code)
+            businesses = [{"business_id": place["id"], **place["metadata"]} for place in places if place.get("metadata")]
+            reasons = reason_generator.reasons(event_data.natural_query, businesses)
+        except (CircuitOpenError, DeadlineExceeded) as e:
+            logger.error(f"Reasons unavailable: {e}")
+            trace.root.set(error=type(e).__name__)
+            return {"statusCode": 504 if isinstance(e, DeadlineExceeded) else 503, "body": str(e)}
+        except Exception as e:
+            logger.exception("Reasons failed")
+            trace.root.set(error=type(e).__name__)
+            return {"statusCode": 500, "body": str(e)}
+    reasons.update({business_id: None for business_id in skipped})
+    return {"statusCode": 200, "reasons": reasons, "skipped": skipped}
+
+
+def build_response(filters: dict, recommended: list, rest: list) -> dict:
+    """Lambda response, flagging every stage that was degraded to meet the deadline."""
+    return {
+        "statusCode":200,
+        "body":str(filters),
+        "recommended_result":recommended,
+        "rest_result":rest,
+        "degraded":list(current_deadline().degraded),
+    }
+
+
+def build_filter_request(event_data: FilterEvent, filters: dict) -> dict:
+    """
+    Merges the extracted filters with the ones of the request, and builds
+    the body of the filter service call.
+    """
     # Process extracted filters (transform values and apply mapping)
     processed_filters = filter_service.process_extracted_filters(filters, filter_mapping)
     logger.info("Processed extracted filters ---> %s", str(processed_filters))
@@ -210,49 +544,280 @@ def data_filterer_handler(event, context):
 
     body = event_data.filter_data.model_dump()
     body["filters"] = cleaned_filters
+    return body
 
-    results = call_filter_service(body, params)
-    if not results:
-        logger.info("Not results Retrieved from DynamoDB")
-        return {
-            "statusCode":200,
-            "body":str(filters),
-            "recommended_result":[],
-            "rest_result":[]
-        }
 
+def score_candidates(results: list, query: str, city: str) -> list:
+    """
+    Adds the vector scores to the filter service candidates. Without them
+    (no budget, timeout or Pinecone down) the candidates keep the filter service order.
+    """
+    if current_deadline().should_degrade("pinecone"):
+        mark_degraded("vector_scoring_skipped")
+        return results
     ids = [item["id"] for item in results]
-    query = full_state.get("translation", query)
-    pinecone_matches = call_pinecone(ids, query)
+    try:
+        local_matches = score_locally(ids, query, city)
+    except Exception as e:
+        logger.error(f"Local scoring failed, using Pinecone: {e}")
+        local_matches = None
+    if local_matches is not None:
+        return merge_dicts_by_id(results, local_matches, "id")
+    try:
+        pinecone_matches = call_pinecone(ids, query, city)
+        return merge_dicts_by_id(results, pinecone_matches, "id")
+    except (requests.Timeout, DeadlineExceeded) as e:
+        logger.error(f"Vector scoring ran out of time: {e}")
+        mark_degraded("vector_scoring_timeout")
+    except Exception as e:
+        logger.error(f"Vector scoring unavailable, keeping the filter service order: {e}")
+        mark_degraded("vector_scoring_failed")
+    return results
 
-    results = merge_dicts_by_id(results, pinecone_matches, "id")
 
+def apply_global_fields(event_data: FilterEvent, recommended: list, rest: list):
+    """Keeps only the fields requested in `global_fields` (plus id and metadata)."""
+    if not event_data.filter_data.global_fields:
+        return recommended, rest
+    if "id" not in event_data.filter_data.global_fields:
+        event_data.filter_data.global_fields.append("id")
+    if "metadata" not in event_data.filter_data.global_fields:
+        event_data.filter_data.global_fields.append("metadata")
 
-    top_n = 30
-    recommended, rest = split_by_score(results, top_n)
-    
+    return filter_dicts(recommended, event_data.filter_data.global_fields), filter_dicts(rest, event_data.filter_data.global_fields)
 
-    recommended = get_data(s3_client=s3_client, places = recommended)
 
-    if event_data.filter_data.global_fields:
-        if "id" not in event_data.filter_data.global_fields:
-            event_data.filter_data.global_fields.append("id")
-        if "metadata" not in event_data.filter_data.global_fields:
-            event_data.filter_data.global_fields.append("metadata")
+@timeit("Rerank", logger)
+def rerank_recommended(recommended: list, query: str) -> list:
+    """Blocking version of `arerank_recommended`."""
+    return asyncio.run(arerank_recommended(recommended, query))
 
-        recommended = filter_dicts(recommended, event_data.filter_data.global_fields)
-        rest = filter_dicts(rest, event_data.filter_data.global_fields)
 
+async def arerank_recommended(recommended: list, query: str) -> list:
+    """
+    Reranks the places with metadata, the rest are appended. Without enough
+    budget, or with the LLM down, the places keep the vector order.
+    """
+    if current_deadline().should_degrade("rerank"):
+        mark_degraded("rerank_skipped")
+        return recommended
     try:
-        recommended = rerank_businesses(recommended, query)
+        with_metadata = [place for place in recommended if place.get("metadata")]
+        without_metadata = [place for place in recommended if not place.get("metadata")]
+        # A single attempt: a retry would not fit in the budget of a slow LLM call (the graph retries failed chunks)
+        recommended = await resilient_acall(LLM, arerank_businesses, with_metadata, query, max_attempts=1) + without_metadata
         logger.info("Places succesfully sorted")
 
+    except CircuitOpenError as e:
+        logger.error(f"Reranking skipped: {e}")
+        mark_degraded("rerank_unavailable")
     except Exception as e:
         logger.error(f"Reranking failed: {e}")
+        mark_degraded("rerank_failed")
+    return recommended
+
+
+def extract_filters(event_data: FilterEvent) -> tuple:
+    """
+    First stage of the pipeline: the filters of the natural query.
+
+    Returns:
+        tuple: (filters, params, full_state) of `get_filters`.
+    """
+    country_code, city_code = request_city(event_data)
+    filters, params, full_state = get_filters(event_data.filter_data.natural_query, event_data.filter_type, city_code, country_code)
+    annotate_request(search_type=params["filter_type"], translated=bool(full_state.get("translated_query")))
+    logger.info("Extracted filters ---> %s", str(filters))
+    logger.info("Extracted filter keys ---> %s", list(filters.keys()))
+    return filters, params, full_state
 
+
+def fetch_candidates(event_data: FilterEvent, filters: dict, params: dict, full_state: dict) -> Optional[tuple]:
+    """
+    Second stage of the pipeline: the filter service candidates, vector
+    scored and split, the recommended ones with their S3 metadata.
+
+    Returns:
+        Optional[tuple]: (query, recommended, rest), the query being the translated
+        one when there is one. None when the filter service has no results.
+    """
+    country_code, city_code = request_city(event_data)
+    body = build_filter_request(event_data, filters)
+    results = call_filter_service(body, params)
+    if response_cache and results:
+        response_cache.observe_daterange(cache_city(event_data), max(str(item.get("processed_daterange_001") or "") for item in results))
+    if not results:
+        logger.info("Not results Retrieved from DynamoDB")
+        return None
+
+    query = full_state.get("translated_query") or event_data.filter_data.natural_query
+    results = score_candidates(results, query, city_code)
+
+    top_n = 30
+    recommended, rest = split_by_score(results, top_n)
+
+    recommended = get_data(s3_client=s3_client, places=recommended, country_code=country_code, city_code=city_code)
+    recommended, rest = apply_global_fields(event_data, recommended, rest)
+    return query, recommended, rest
+
+
+def run_filter_pipeline(event_data: FilterEvent) -> dict:
+    """
+    Runs the whole filtering pipeline (filter extraction, filter service,
+    vector scoring, S3 metadata and reranking) for an already parsed event.
+
+    Args:
+        event_data (FilterEvent): The validated request.
+
+    Returns:
+        dict: The lambda response, with the recommended and the rest of results.
+    """
+    filters, params, full_state = extract_filters(event_data)
+    candidates = fetch_candidates(event_data, filters, params, full_state)
+    if candidates is None:
+        return build_response(filters, [], [])
+
+    query, recommended, rest = candidates
+    recommended = rerank_recommended(recommended, query)
+
+    return build_response(filters, recommended, rest)
+
+
+def ranking_event(recommended: list, scores: dict, chunks_done: int, chunks: int) -> dict:
+    """
+    Current ranking of the recommended places: the scored ones by score,
+    then the ones still waiting for their rerank chunk, in vector order.
+    """
+    scored = [b for b in recommended if b.get("metadata", {}).get("business_id") in scores]
+    for biz in scored:
+        biz.update(scores[biz["metadata"]["business_id"]])
+    scored.sort(key=lambda x: x["score"], reverse=True)
+    pending = [b for b in recommended if b.get("metadata", {}).get("business_id") not in scores]
     return {
-        "statusCode":200,
-        "body":str(filters),
-        "recommended_result":recommended,
-        "rest_result":rest
+        "type": "ranking",
+        "chunks_done": chunks_done,
+        "chunks": chunks,
+        "ranking": [{"id": b.get("id"), "score": b["score"], "reason": b.get("reason")} for b in scored]
+                   + [{"id": b.get("id"), "score": None, "reason": None} for b in pending],
     }
+
+
+def stream_rerank_recommended(recommended: list, query: str) -> Generator[dict, None, list]:
+    """
+    Streaming version of `arerank_recommended`: yields a ranking event after
+    each rerank chunk and returns the reranked places. Same fallbacks, breaker
+    and chunk retries (see `RerankingChain.stream_scores`).
+    """
+    if current_deadline().should_degrade("rerank"):
+        mark_degraded("rerank_skipped")
+        return recommended
+    with_metadata = [place for place in recommended if place.get("metadata")]
+    without_metadata = [place for place in recommended if not place.get("metadata")]
+    if not with_metadata:
+        return recommended
+
+    # One call of the breaker for the whole rerank, as `resilient_acall` in `arerank_recommended`
+    breaker = get_breaker(LLM)
+    try:
+        breaker.before_call()
+    except CircuitOpenError as e:
+        logger.error(f"Reranking skipped: {e}")
+        mark_degraded("rerank_unavailable")
+        return recommended
+
+    scores, failed, error = {}, [], None
+    try:
+        with span("rerank", businesses=len(with_metadata), streamed=True) as rerank_span:
+            formatted = format_for_rerank(with_metadata, query)
+            chunks = len(reranker_client.split(formatted))
+            for done, (chunk, chunk_scores) in enumerate(reranker_client.stream_scores(formatted, query), start=1):
+                if isinstance(chunk_scores, Exception):
+                    logger.error(f"Rerank chunk {chunk} failed: {chunk_scores}")
+                    failed.append(chunk)
+                    error = chunk_scores
+                    continue
+                scores.update(scores_by_id(chunk_scores))
+                yield ranking_event(with_metadata, scores, done, chunks)
+            rerank_span.set(chunks=chunks, failed_chunks=len(failed))
+    except Exception as e:
+        error = e
+
+    if scores:
+        breaker.record_success()
+        if failed:
+            mark_degraded("rerank_partial")
+        logger.info("Places succesfully sorted")
+        return apply_scores(with_metadata, scores) + without_metadata
+
+    if error is not None and is_retryable(error):
+        breaker.record_failure()
+    else:
+        breaker.release()
+    logger.error(f"Reranking failed: {error}")
+    mark_degraded("rerank_failed")
+    return recommended
+
+
+def stream_filter_pipeline(event_data: FilterEvent) -> Iterator[dict]:
+    """
+    Same pipeline as `run_filter_pipeline`, yielding progressively:
+
+        {"type": "filters", "filters"}                      once the filters are extracted
+        {"type": "provisional", "recommended", "rest"}      vector-ordered places, with metadata
+        {"type": "ranking", "chunks_done", "chunks", "ranking"}  after each rerank chunk
+        {"type": "final", **response}                       the same response as the handler
+
+    Must run inside the request trace and deadline.
+    """
+    filters, params, full_state = extract_filters(event_data)
+    yield {"type": "filters", "filters": filters}
+
+    candidates = fetch_candidates(event_data, filters, params, full_state)
+    if candidates is None:
+        yield {"type": "final", **build_response(filters, [], [])}
+        return
+
+    query, recommended, rest = candidates
+    yield {"type": "provisional", "recommended": recommended, "rest": rest}
+    recommended = yield from stream_rerank_recommended(recommended, query)
+
+    yield {"type": "final", **build_response(filters, recommended, rest)}
+
+
+def data_filterer_stream(event: dict, context=None) -> Iterator[dict]:
+    """
+    Streaming variant of `data_filterer_handler`, see `stream_filter_pipeline`.
+    Cached and precomputed responses are sent as a single final event.
+    """
+    event_data, trace, status = None, None, "ok"
+    try:
+        with start_trace("data_filterer_stream") as trace:
+            event_data = parse_event(event)
+            trace.root.set(filter_type=event_data.filter_type, city_code=event_data.city_code, city=cache_city(event_data), streamed=True)
+            deadline = Deadline.for_request(DEADLINE_CONFIG, event_data.deadline_ms, context)
+            response = None
+            if precomputed_results:
+                city = request_city(event_data)
+                response = precomputed_results.lookup(event_data, city, lambda: precompute_inputs(*city))
+            cache_key = request_key(event_data, response_cache.location_decimals) if response_cache else None
+            if response is None and response_cache:
+                response = response_cache.get(cache_key)
+            if response is not None:
+                yield {"type": "final", **response}
+            else:
+                with use_deadline(deadline):
+                    for message in stream_filter_pipeline(event_data):
+                        if message["type"] == "final" and response_cache:
+                            response_cache.put(cache_key, cache_city(event_data), {k: v for k, v in message.items() if k != "type"})
+                        yield message
+    except GeneratorExit:
+        # The client went away mid-stream
+        status = "cancelled"
+        raise
+    except Exception as e:
+        status = type(e).__name__
+        raise
+    finally:
+        # Failed requests are captured too, with their error as status
+        if event_data is not None:
+            traffic_recorder.record(event_data, trace, status=status)
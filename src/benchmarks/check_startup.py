@@ -0,0 +1,100 @@
+"""
+Checks the cold start of the filterer lambda against time and memory targets.
+
+The handler module is imported in a fresh interpreter with the startup
+profiler enabled, so every run measures a real cold start. Exits with a
+non zero status when a target is missed, so it can run in CI.
+
+Usage (from the repository root):
+    python -m src.benchmarks.check_startup --max-cold-start-ms 4000 --max-rss-mb 512
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+
+DEFAULT_MODULE = "src.aws.filterer_flow_handler"
+RSS_MARKER = "__PEAK_RSS_KB__"
+
+
+def measure_cold_start(module: str) -> dict:
+    """
+    Import `module` in a child interpreter and measure it.
+
+    Returns:
+        dict: Wall time, peak RSS of the child and the startup profile report.
+    """
+    with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as tmp:
+        profile_path = tmp.name
+
+    env = dict(os.environ, STARTUP_PROFILE="1", STARTUP_PROFILE_OUTPUT=profile_path)
+    start = time.perf_counter()
+    code = (
+        "import resource\n"
+        "from src.app.monitoring.startup_profiler import startup_profiler\n"
+        "startup_profiler.install()\n"
+        f"import {module}\n"
+        "startup_profiler.finish()\n"
+        f"print('{RSS_MARKER}', resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)\n"
+    )
+    completed = subprocess.run(
+        [sys.executable, "-c", code],
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+
+    if completed.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{completed.stderr}")
+
+    # ru_maxrss is in KB on linux
+    rss_lines = [line for line in completed.stdout.splitlines() if line.startswith(RSS_MARKER)]
+    peak_rss_mb = int(rss_lines[-1].split()[1]) / 1024
+
+    with open(profile_path, "r", encoding="utf-8") as file:
+        profile = json.load(file)
+    os.remove(profile_path)
+
+    return {"wall_ms": round(wall_ms, 1), "peak_rss_mb": round(peak_rss_mb, 1), "profile": profile}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check cold start time and RSS targets")
+    parser.add_argument("--module", default=DEFAULT_MODULE)
+    parser.add_argument("--max-cold-start-ms", type=float, default=None)
+    parser.add_argument("--max-rss-mb", type=float, default=None)
+    parser.add_argument("--runs", type=int, default=3, help="Cold starts to measure, the median is checked")
+    parser.add_argument("--top", type=int, default=10, help="Slowest imports/steps to print")
+    args = parser.parse_args()
+
+    runs = [measure_cold_start(args.module) for _ in range(args.runs)]
+    runs.sort(key=lambda r: r["wall_ms"])
+    median = runs[len(runs) // 2]
+
+    print(f"Cold start of {args.module} (median of {args.runs}): {median['wall_ms']} ms, peak RSS {median['peak_rss_mb']} MB")
+    print("Slowest imports:")
+    for record in median["profile"]["slowest_imports"][:args.top]:
+        print(f"  {record['cumulative_ms']:>10.1f} ms  {record['module']}")
+    print("Init steps:")
+    for record in median["profile"]["init_steps"]:
+        print(f"  {record['duration_ms']:>10.1f} ms  {record['step']}")
+
+    failures = []
+    if args.max_cold_start_ms is not None and median["wall_ms"] > args.max_cold_start_ms:
+        failures.append(f"cold start {median['wall_ms']} ms > {args.max_cold_start_ms} ms")
+    if args.max_rss_mb is not None and median["peak_rss_mb"] > args.max_rss_mb:
+        failures.append(f"peak RSS {median['peak_rss_mb']} MB > {args.max_rss_mb} MB")
+
+    if failures:
+        print("FAILED: " + "; ".join(failures))
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Offline end-to-end benchmark of `data_filterer_handler`.
+
+Drives the real handler against the local stand-ins of `harness.py` at a
+configurable concurrency, and reports throughput, latency percentiles and a
+per-stage breakdown built from the request traces.
+
+Usage (from the repository root):
+    python -m src.benchmarks.e2e_benchmark --requests 200 --concurrency 8 --llm-latency-ms 300
+"""
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+
+from src.app.monitoring.tracing import HistogramRegistry, LatencyHistogram, trace_exporter
+from src.app.utils.common.hedging import hedging_metrics
+from src.app.utils.common.resilience import breaker_metrics
+from src.app.utils.common.single_flight import single_flight_metrics
+from src.app.services.sentence_transformers_embeddings import micro_batch_metrics
+from src.benchmarks.harness import OfflineEnvironment, sample_events
+
+
+def run_benchmark(handler, events: List[Dict[str, Any]], requests: int, concurrency: int,
+                  warmup: int = 2) -> Dict[str, Any]:
+    """
+    Send `requests` events (cycling over `events`) to `handler` from
+    `concurrency` threads.
+
+    Args:
+        handler (callable): `data_filterer_handler(event, context)`.
+        events (list): Events to cycle over.
+        requests (int): Total number of measured requests.
+        concurrency (int): Number of concurrent callers.
+        warmup (int): Requests sent before measuring (not reported).
+
+    Returns:
+        dict: Throughput, latency percentiles, error count and per-stage breakdown.
+    """
+    for i in range(warmup):
+        handler(events[i % len(events)], None)
+
+    stages = HistogramRegistry()
+    latency = LatencyHistogram()
+    errors: Dict[str, int] = {}
+    errors_lock = threading.Lock()
+
+    def _collect(trace):
+        for finished in trace.spans:
+            stages.record(finished.name, finished.duration_ms)
+
+    def _call(i):
+        start = time.perf_counter()
+        try:
+            handler(events[i % len(events)], None)
+        except Exception as e:
+            with errors_lock:
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+        latency.record((time.perf_counter() - start) * 1000)
+
+    trace_exporter.listeners.append(_collect)
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(_call, range(requests)))
+        elapsed = time.perf_counter() - start
+    finally:
+        trace_exporter.listeners.remove(_collect)
+
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(requests / elapsed, 3),
+        "latency": latency.summary(),
+        "errors": errors,
+        "stages": stages.summary(),
+        "hedging": hedging_metrics(),
+        "circuit_breakers": breaker_metrics(),
+        "single_flight": single_flight_metrics(),
+        "micro_batching": micro_batch_metrics(),
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    latency = report["latency"]
+    print(f"{report['requests']} requests at concurrency {report['concurrency']} in {report['elapsed_s']} s "
+          f"-> {report['throughput_rps']} req/s, errors: {report['errors'] or 0}")
+    print(f"latency ms: p50 {latency['p50_ms']}  p95 {latency['p95_ms']}  p99 {latency['p99_ms']}  max {latency['max_ms']}")
+    print(f"{'stage':<28}{'count':>8}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for stage, stats in sorted(report["stages"].items(), key=lambda item: -item[1]["mean_ms"] * item[1]["count"]):
+        print(f"{stage:<28}{stats['count']:>8}{stats['mean_ms']:>10.1f}{stats['p50_ms']:>10.1f}"
+              f"{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}")
+    for endpoint, metrics in report.get("hedging", {}).items():
+        if metrics["hedges_sent"]:
+            print(f"hedging {endpoint}: {metrics['hedges_sent']}/{metrics['calls']} hedged, "
+                  f"hedge won {metrics['hedge_wins']} times")
+    for name, metrics in report.get("single_flight", {}).items():
+        if metrics["coalesced"]:
+            print(f"single flight {name}: {metrics['coalesced']}/{metrics['calls']} calls coalesced")
+    for server_url, metrics in report.get("micro_batching", {}).items():
+        if metrics["batches"]:
+            print(f"micro batching {server_url}: {metrics['batches']} batches, mean size {metrics['mean_batch_size']}, "
+                  f"queueing p95 {metrics['queueing_delay']['p95_ms']} ms")
+    for dependency, metrics in report.get("circuit_breakers", {}).items():
+        if metrics["state"] != "closed" or metrics["rejected"]:
+            print(f"circuit breaker {dependency}: {metrics['state']}, {metrics['rejected']} calls rejected")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark of the filterer handler")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--events", default=None, help="JSON file with a list of events (sample events otherwise)")
+    parser.add_argument("--summaries-dir", default=None, help="Recorded S3 summaries, same key layout as the bucket")
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0)
+    parser.add_argument("--llm-per-business-ms", type=float, default=5.0)
+    parser.add_argument("--embed-latency-ms", type=float, default=30.0)
+    parser.add_argument("--filter-latency-ms", type=float, default=120.0)
+    parser.add_argument("--pinecone-latency-ms", type=float, default=150.0)
+    parser.add_argument("--s3-latency-ms", type=float, default=25.0)
+    parser.add_argument("--candidates", type=int, default=300)
+    parser.add_argument("--output", default=None, help="Write the report as JSON")
+    args = parser.parse_args(argv)
+
+    events = sample_events()
+    if args.events:
+        with open(args.events, "r", encoding="utf-8") as file:
+            events = json.load(file)
+
+    trace_exporter.mode = "off"
+    with OfflineEnvironment(
+        llm_latency_ms=args.llm_latency_ms,
+        llm_per_business_ms=args.llm_per_business_ms,
+        embed_latency_ms=args.embed_latency_ms,
+        filter_latency_ms=args.filter_latency_ms,
+        pinecone_latency_ms=args.pinecone_latency_ms,
+        s3_latency_ms=args.s3_latency_ms,
+        candidates=args.candidates,
+        summaries_dir=args.summaries_dir,
+    ) as env:
+        report = run_benchmark(env.handler.data_filterer_handler, events, args.requests, args.concurrency)
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Compare the in-process embedding backend with the remote embedding server.
+
+For a set of queries it reports, per backend, the warm `embed_query`
+latency percentiles, and between the two backends the similarity drift:
+the cosine similarity of the two embeddings of each query, and the largest
+change in the query-to-query similarity matrix (what ranking sees).
+
+Usage (from the repository root):
+    python -m src.benchmarks.embedding_backends --server-url 10.0.0.12 --port 8000 \\
+        --model-path /models/gma-embeddings-onnx --onnx-file onnx/model_qint8_avx2.onnx
+"""
+import json
+import math
+import time
+import argparse
+from typing import Dict, Any, List, Optional
+
+from src.app.monitoring.tracing import LatencyHistogram
+from src.app.services.local_embeddings import LocalSentenceTransformerEmbeddings
+from src.app.services.sentence_transformers_embeddings import SentenceTransformerAPIEmbeddings
+from src.benchmarks.harness import SAMPLE_QUERIES
+
+
+def _cosine(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+def time_backend(embeddings, queries: List[str], repeats: int = 3) -> Dict[str, Any]:
+    """Warm `embed_query` latency, the first call of each backend is left out."""
+    embeddings.embed_query(queries[0])
+    latency = LatencyHistogram()
+    vectors = {}
+    for _ in range(repeats):
+        for query in queries:
+            start = time.perf_counter()
+            vectors[query] = embeddings.embed_query(query)
+            latency.record((time.perf_counter() - start) * 1000)
+    return {"latency": latency.summary(), "vectors": vectors}
+
+
+def similarity_drift(reference: Dict[str, List[float]], candidate: Dict[str, List[float]]) -> Dict[str, float]:
+    queries = list(reference)
+    same_query = [_cosine(reference[q], candidate[q]) for q in queries]
+    matrix_delta = 0.0
+    for i, a in enumerate(queries):
+        for b in queries[i + 1:]:
+            delta = abs(_cosine(reference[a], reference[b]) - _cosine(candidate[a], candidate[b]))
+            matrix_delta = max(matrix_delta, delta)
+    return {
+        "mean_cosine": round(sum(same_query) / len(same_query), 5),
+        "min_cosine": round(min(same_query), 5),
+        "max_similarity_delta": round(matrix_delta, 5),
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Latency and drift of the local vs. remote embedding backends")
+    parser.add_argument("--server-url", required=True, help="Host of the remote embedding server (EC2.PRIVATE_IP)")
+    parser.add_argument("--port", default="8000")
+    parser.add_argument("--model-path", required=True, help="Exported model directory or s3:// archive")
+    parser.add_argument("--runtime", default="onnx", choices=["onnx", "torch"])
+    parser.add_argument("--onnx-file", default=None, help="e.g. onnx/model_qint8_avx2.onnx for the quantized model")
+    parser.add_argument("--queries", default=None, help="JSON file with a list of queries (sample queries otherwise)")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output", default=None, help="Write the report as JSON")
+    args = parser.parse_args(argv)
+
+    queries = [query for query, _ in SAMPLE_QUERIES]
+    if args.queries:
+        with open(args.queries, "r", encoding="utf-8") as file:
+            queries = json.load(file)
+
+    cold_start = time.perf_counter()
+    local = LocalSentenceTransformerEmbeddings(args.model_path, runtime=args.runtime, onnx_file=args.onnx_file)
+    load_ms = (time.perf_counter() - cold_start) * 1000
+    remote = SentenceTransformerAPIEmbeddings(server_url=args.server_url, port=args.port)
+
+    remote_run = time_backend(remote, queries, args.repeats)
+    local_run = time_backend(local, queries, args.repeats)
+    report = {
+        "queries": len(queries),
+        "local_model_load_ms": round(load_ms, 1),
+        "remote": remote_run["latency"],
+        "local": local_run["latency"],
+        "drift": similarity_drift(remote_run["vectors"], local_run["vectors"]),
+    }
+
+    print(f"local model load: {report['local_model_load_ms']} ms")
+    for backend in ("remote", "local"):
+        latency = report[backend]
+        print(f"{backend:<8} p50 {latency['p50_ms']:>8.1f} ms  p95 {latency['p95_ms']:>8.1f} ms  p99 {latency['p99_ms']:>8.1f} ms")
+    drift = report["drift"]
+    print(f"drift: mean cosine {drift['mean_cosine']}, min cosine {drift['min_cosine']}, "
+          f"max query-query similarity change {drift['max_similarity_delta']}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
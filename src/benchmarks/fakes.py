@@ -0,0 +1,315 @@
+"""
+Local stand-ins for every external service of the filterer pipeline, so the
+real handler can be benchmarked on a laptop with no network access:
+
+    - FakeLLM: structured output LLM with configurable latency and canned answers.
+    - FakeBackendServer: local HTTP server playing the EC2 embedding server,
+      the filter service lambda and the Pinecone scoring lambda.
+    - FakePineconeIndex / FakePineconeModule: in-memory Pinecone index.
+    - FakeS3Service: serves recorded (or synthetic) business summaries.
+"""
+import os
+import re
+import json
+import time
+import random
+import hashlib
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, Any, List, Optional
+from urllib.parse import urlparse, parse_qs
+
+
+CUISINES = ["Italian", "Spanish", "Japanese", "Sushi", "Mexican", "Indian", "Vegan", "Mediterranean", "Paella", "Tapas"]
+BUSINESS_TYPES = ["Restaurant", "Cafe", "Bakery", "Bar", "Cocktail Bar", "Fine Dining"]
+
+
+def _sleep(latency_ms: float, jitter_ms: float = 0.0) -> None:
+    delay = latency_ms + (random.uniform(-jitter_ms, jitter_ms) if jitter_ms else 0.0)
+    if delay > 0:
+        time.sleep(delay / 1000)
+
+
+def fake_vector(text: str, dimension: int = 384) -> List[float]:
+    """Deterministic pseudo-embedding, so identical texts get identical vectors."""
+    seed = int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:16], 16)
+    rng = random.Random(seed)
+    vector = [rng.uniform(-1, 1) for _ in range(dimension)]
+    norm = sum(v * v for v in vector) ** 0.5
+    return [v / norm for v in vector]
+
+
+def business_id(index: int) -> str:
+    return f"biz{index:05d}"
+
+
+# =============================================================================
+# LLM
+# =============================================================================
+class FakeLLM:
+    """
+    Stand-in for ChatGroq / AzureChatOpenAI. Only `with_structured_output` is
+    used by the pipeline; the returned runnable sleeps for the configured
+    latency and answers according to the schema it was built for.
+    """
+
+    def __init__(self, latency_ms: float = 300.0, jitter_ms: float = 50.0, per_business_ms: float = 0.0,
+                 filters: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Args:
+            latency_ms: Base latency of every call.
+            jitter_ms: Uniform jitter added to the latency.
+            per_business_ms: Extra latency per business in a rerank prompt (output tokens).
+            filters: Canned filter extraction answer.
+        """
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.per_business_ms = per_business_ms
+        self.filters = filters or {
+            "search_type": "Around",
+            "place": "",
+            "business_type": ["Restaurant"],
+            "keywords": [],
+            "min_price": None,
+            "max_price": None,
+            "cuisine_type": [],
+            "overall_score": None,
+        }
+
+    def _answer(self, schema: dict, text: str) -> dict:
+        title = schema.get("title", "")
+        if title == "TranslationSchema":
+            question = text.rsplit("Input to translate:", 1)[-1].strip()
+            return {"translation": question}
+        if title == "BusinessScores":
+            ids = re.findall(r"Business ID: (\S+)", text)
+            _sleep(self.per_business_ms * len(ids))
+            return {"business_scores": [
+                {"business_id": biz_id, "score": random.randint(20, 100), "reason": "Matches the query."}
+                for biz_id in ids
+            ]}
+        if title == "BusinessScoresCompact":
+            ids = re.findall(r"Business ID: (\S+)", text)
+            return {"scores": {biz_id: random.randint(20, 100) for biz_id in ids}}
+        if title == "BusinessReason":
+            return {"reason": "Matches the query."}
+        # Filter extraction: pick up any known cuisine mentioned in the question
+        question = text.rsplit("Here is the question:", 1)[-1].lower()
+        filters = dict(self.filters)
+        filters["cuisine_type"] = [c for c in CUISINES if c.lower() in question]
+        return filters
+
+    def with_structured_output(self, schema: dict, method: str = None, **kwargs):
+        from langchain_core.runnables import RunnableLambda
+
+        def _invoke(prompt_value):
+            _sleep(self.latency_ms, self.jitter_ms)
+            text = prompt_value.to_string() if hasattr(prompt_value, "to_string") else str(prompt_value)
+            return self._answer(schema, text)
+
+        return RunnableLambda(_invoke)
+
+
+class FakeOpikLangchainModule:
+    """Replaces `opik.integrations.langchain`, whose tracer would ship traces to Comet."""
+
+    @staticmethod
+    def OpikTracer(*args, **kwargs):
+        from langchain_core.callbacks import BaseCallbackHandler
+        return BaseCallbackHandler()
+
+
+# =============================================================================
+# Pinecone
+# =============================================================================
+class FakePineconeIndex:
+    """In-memory index answering queries with the cuisine / business type catalog."""
+
+    def __init__(self, name: str, latency_ms: float = 40.0) -> None:
+        self.name = name
+        self.latency_ms = latency_ms
+        values = BUSINESS_TYPES if "business" in name else CUISINES
+        self.records = [
+            {"id": f"{name}-{i}", "values": fake_vector(value), "metadata": {"name": value}}
+            for i, value in enumerate(values)
+        ]
+
+    def query(self, vector=None, top_k=20, filter=None, include_metadata=True, namespace="", **kwargs):
+        _sleep(self.latency_ms)
+        allowed = set((filter or {}).get("business_id", {}).get("$in", [])) or None
+        scored = []
+        for record in self.records:
+            if allowed is not None and record["id"] not in allowed:
+                continue
+            score = sum(a * b for a, b in zip(vector, record["values"]))
+            match = {"id": record["id"], "score": score}
+            if include_metadata:
+                match["metadata"] = record["metadata"]
+            scored.append(match)
+        scored.sort(key=lambda m: m["score"], reverse=True)
+        return {"matches": scored[:top_k], "namespace": namespace}
+
+    def fetch(self, ids, namespace=""):
+        return {"vectors": {r["id"]: r for r in self.records if r["id"] in set(ids)}}
+
+
+class FakePineconeModule:
+    """Replaces the `pinecone` module used by VectorDBClient."""
+
+    def __init__(self, latency_ms: float = 40.0) -> None:
+        self.latency_ms = latency_ms
+        outer = self
+
+        class _Client:
+            def __init__(self, api_key=None, **kwargs):
+                pass
+
+            def Index(self, name):
+                return FakePineconeIndex(name, latency_ms=outer.latency_ms)
+
+            def list_indexes(self):
+                return []
+
+        self.Pinecone = _Client
+        self.ServerlessSpec = dict
+
+
+# =============================================================================
+# S3
+# =============================================================================
+class FakeS3Service:
+    """
+    Stand-in for S3Service. Serves summaries recorded under `summaries_dir`
+    (same key layout as the bucket), or synthesizes one of `summary_words`.
+    """
+
+    def __init__(self, summaries_dir: Optional[str] = None, latency_ms: float = 25.0,
+                 jitter_ms: float = 10.0, summary_words: int = 250) -> None:
+        self.summaries_dir = summaries_dir
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.summary_words = summary_words
+
+    def _synthetic(self, key: str) -> dict:
+        biz_id = key.split("/")[4] if key.count("/") >= 5 else key
+        rng = random.Random(biz_id)
+        words = ["cozy", "fresh", "seafood", "paella", "friendly", "staff", "terrace", "wine", "tapas",
+                 "dessert", "authentic", "prices", "service", "atmosphere", "rice", "local", "quick"]
+        sentences = " ".join(
+            " ".join(rng.choice(words) for _ in range(12)).capitalize() + "."
+            for _ in range(max(1, self.summary_words // 12))
+        )
+        return {
+            "business_id": biz_id,
+            "business_summary": sentences,
+            "cuisine_type": {"main_cuisine_types": rng.sample(CUISINES, 2)},
+            "price_range": rng.choice(["€", "€€", "€€€"]),
+            "min_price": rng.randint(8, 20),
+            "max_price": rng.randint(25, 60),
+            "must_try": {rng.choice(words): "Very popular" for _ in range(3)},
+            "must_avoid": [rng.choice(words)],
+        }
+
+    def load_json_as_dict(self, bucket_name: str, key: str) -> dict:
+        _sleep(self.latency_ms, self.jitter_ms)
+        if self.summaries_dir:
+            path = os.path.join(self.summaries_dir, key)
+            if os.path.isfile(path):
+                with open(path, "r", encoding="utf-8") as file:
+                    return json.load(file)
+        return self._synthetic(key)
+
+
+# =============================================================================
+# HTTP services (embedding server, filter service, Pinecone lambda)
+# =============================================================================
+class FakeBackendServer:
+    """
+    Local HTTP server with the same routes the pipeline calls:
+
+        GET  /embed?query=...         -> {"embed": [...]}
+        POST /embed_documents         -> {"embeddings": [[...], ...]}
+        POST /filter                  -> {"body": [{"id", "processed_daterange_001"}, ...]}
+        POST /pinecone?city=...       -> {"body": {"matches": [{"id", "score"}, ...]}}
+    """
+
+    def __init__(self, embed_latency_ms: float = 30.0, filter_latency_ms: float = 120.0,
+                 pinecone_latency_ms: float = 150.0, candidates: int = 300, jitter_ms: float = 10.0) -> None:
+        self.embed_latency_ms = embed_latency_ms
+        self.filter_latency_ms = filter_latency_ms
+        self.pinecone_latency_ms = pinecone_latency_ms
+        self.candidates = candidates
+        self.jitter_ms = jitter_ms
+        self.request_counts: Dict[str, int] = {}
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def _handle(self, method: str, path: str, query: dict, body: Optional[dict]) -> dict:
+        self.request_counts[path] = self.request_counts.get(path, 0) + 1
+        if path == "/embed":
+            _sleep(self.embed_latency_ms, self.jitter_ms)
+            return {"embed": fake_vector(query.get("query", [""])[0])}
+        if path == "/embed_documents":
+            _sleep(self.embed_latency_ms, self.jitter_ms)
+            return {"embeddings": [fake_vector(doc) for doc in body.get("documents", [])]}
+        if path == "/filter":
+            _sleep(self.filter_latency_ms, self.jitter_ms)
+            return {"body": [
+                {"id": business_id(i), "name": f"Business {i}", "processed_daterange_001": "20240101_20241231"}
+                for i in range(self.candidates)
+            ]}
+        if path == "/pinecone":
+            _sleep(self.pinecone_latency_ms, self.jitter_ms)
+            query_vector = fake_vector(body.get("query", ""), dimension=32)
+            return {"body": {"matches": [
+                {"id": biz_id, "score": sum(a * b for a, b in zip(query_vector, fake_vector(biz_id, dimension=32)))}
+                for biz_id in body.get("business_IDS", [])
+            ]}}
+        raise KeyError(path)
+
+    def start(self) -> "FakeBackendServer":
+        outer = self
+
+        class _RequestHandler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _respond(self, method):
+                parsed = urlparse(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}") if length else None
+                try:
+                    payload = json.dumps(outer._handle(method, parsed.path, parse_qs(parsed.query), body)).encode()
+                    status = 200
+                except KeyError:
+                    payload, status = b'{"error": "not found"}', 404
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                self._respond("GET")
+
+            def do_POST(self):
+                self._respond("POST")
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _RequestHandler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-backend", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
@@ -0,0 +1,172 @@
+"""
+Offline environment for the filterer lambda.
+
+`OfflineEnvironment` starts the local service stand-ins from `fakes.py`,
+points the config and secrets at them and imports the real handler module,
+so `data_filterer_handler` runs unmodified with no network access. It is
+shared by the benchmark, the traffic replay and the precomputation jobs.
+"""
+import os
+import sys
+import json
+import tempfile
+import importlib
+from unittest import mock
+from typing import Dict, Any, List, Optional
+
+from src.benchmarks.fakes import (
+    FakeLLM,
+    FakeS3Service,
+    FakeBackendServer,
+    FakePineconeModule,
+    FakeOpikLangchainModule,
+)
+
+
+HANDLER_MODULE = "src.aws.filterer_flow_handler"
+
+SAMPLE_QUERIES = [
+    ("best paella in valencia", "city"),
+    ("cheap sushi near me", None),
+    ("italian restaurant with a great terrace", None),
+    ("mejor paella de valencia", "city"),
+    ("sitio barato para comer tapas", None),
+    ("fancy dinner with good wine", "city"),
+    ("vegan brunch", None),
+    ("cafe with cakes and coffee", None),
+]
+
+
+def sample_events(location: Optional[Dict[str, float]] = None) -> List[Dict[str, Any]]:
+    """A small mix of city / around and english / spanish searches."""
+    location = location or {"lat": 39.4699, "lng": -0.3763}
+    events = []
+    for query, filter_type in SAMPLE_QUERIES:
+        event = {
+            "filter_data": {
+                "natural_query": query,
+                "filters": {"status": {"value": ["OPERATIONAL"], "type": "is_in"}},
+                "location": location,
+                "radius": 2000,
+            },
+            "filter_type": filter_type,
+            "city_code": "vlc",
+            "country_code": "es",
+        }
+        events.append(event)
+    return events
+
+
+def _offline_config(base_url: str, port: int) -> Dict[str, Any]:
+    return {
+        "LOGGER_NAME": "gma-filterer-offline",
+        "LOGGING_CONFIG": {
+            "version": 1,
+            "disable_existing_loggers": False,
+            "handlers": {"console": {"class": "logging.StreamHandler", "level": "WARNING"}},
+            "root": {"handlers": ["console"], "level": "WARNING"},
+        },
+        "AWS_REGION": "eu-central-1",
+        "OPIK_SECRET": "offline-opik",
+        "GROQ_SECRET": "offline-groq",
+        "GROQ_MODEL_NAME": "fake",
+        "PINECONE_DB": {"INDEX_NAME": "cuisine-types-index", "SECRET": "offline-pinecone"},
+        "EC2": {"PRIVATE_IP": "127.0.0.1", "PORT": str(port)},
+        "API_URL": f"{base_url}/filter",
+        "PINECONE_URL": f"{base_url}/pinecone",
+        "SECRETS": {"BACKGROUND_REFRESH": False},
+    }
+
+
+class OfflineEnvironment:
+    """
+    Context manager that runs the real handler against local stand-ins.
+
+    Example:
+    >>> with OfflineEnvironment(llm_latency_ms=200) as env:
+    ...     env.handler.data_filterer_handler(sample_events()[0], None)
+    """
+
+    def __init__(
+            self,
+            llm_latency_ms: float = 300.0,
+            llm_per_business_ms: float = 5.0,
+            embed_latency_ms: float = 30.0,
+            filter_latency_ms: float = 120.0,
+            pinecone_latency_ms: float = 150.0,
+            index_latency_ms: float = 40.0,
+            s3_latency_ms: float = 25.0,
+            candidates: int = 300,
+            summaries_dir: Optional[str] = None,
+            config_overrides: Optional[Dict[str, Any]] = None,
+        ) -> None:
+        self.llm = FakeLLM(latency_ms=llm_latency_ms, per_business_ms=llm_per_business_ms)
+        self.s3 = FakeS3Service(summaries_dir=summaries_dir, latency_ms=s3_latency_ms)
+        self.pinecone = FakePineconeModule(latency_ms=index_latency_ms)
+        self.server = FakeBackendServer(
+            embed_latency_ms=embed_latency_ms,
+            filter_latency_ms=filter_latency_ms,
+            pinecone_latency_ms=pinecone_latency_ms,
+            candidates=candidates,
+        )
+        self.config_overrides = config_overrides or {}
+        self.handler = None
+        self._patches = []
+        self._env_backup = {}
+        self._snapshot_path = None
+
+    def _set_env(self, values: Dict[str, str]) -> None:
+        for key, value in values.items():
+            self._env_backup.setdefault(key, os.environ.get(key))
+            os.environ[key] = value
+
+    def __enter__(self) -> "OfflineEnvironment":
+        self.server.start()
+        _, port = self.server._server.server_address
+
+        config = _offline_config(self.server.base_url, port)
+        config.update(self.config_overrides)
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as tmp:
+            json.dump({"env": "offline", "sources": [], "config": config}, tmp)
+            self._snapshot_path = tmp.name
+
+        self._set_env({
+            "env": "offline",
+            "platform": "groq",
+            "CONFIG_SNAPSHOT": self._snapshot_path,
+            "SECRETS_BACKEND": "env",
+            "SECRET_GMA_DEV_OPIK_API_SEC": "offline",
+            "SECRET_OFFLINE_OPIK": "offline",
+            "SECRET_OFFLINE_GROQ": "offline",
+            "SECRET_OFFLINE_PINECONE": "offline",
+        })
+
+        from src.app import resource_initializer
+        from src.app.services import vector_db_client
+
+        self._patches = [
+            mock.patch.object(resource_initializer.ResourceInitializer, "_get_llm", lambda _self: self.llm),
+            mock.patch.object(resource_initializer.ResourceInitializer, "get_s3_client", lambda _self: self.s3),
+            mock.patch.object(resource_initializer, "opik_langchain", FakeOpikLangchainModule),
+            mock.patch.object(vector_db_client, "pinecone", self.pinecone),
+        ]
+        for patch in self._patches:
+            patch.start()
+
+        # Always build the handler's module level resources against the stand-ins
+        sys.modules.pop(HANDLER_MODULE, None)
+        self.handler = importlib.import_module(HANDLER_MODULE)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        for patch in reversed(self._patches):
+            patch.stop()
+        self.server.stop()
+        for key, value in self._env_backup.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        if self._snapshot_path:
+            os.remove(self._snapshot_path)
+        sys.modules.pop(HANDLER_MODULE, None)
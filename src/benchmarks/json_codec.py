@@ -0,0 +1,105 @@
+"""
+Encode / decode cost of the JSON payloads of the pipeline, per codec backend.
+
+Payloads have the sizes of the real hops (see `fakes.py` for their shape):
+
+    filter_request       filter service request body
+    filter_response      filter service candidates (`--candidates`)
+    pinecone_request     ids + query sent to the Pinecone lambda
+    pinecone_response    scores of the candidates
+    summary              one S3 business summary (`--summary-words`)
+    final_response       30 recommended places with metadata + the rest
+
+For each payload and backend it reports the mean time of `dumps` and
+`loads`, and for the final response the cost of sending a cached response
+as stored (`raw`) vs. parsing and re-serializing it.
+
+Usage (from the repository root):
+    python -m src.benchmarks.json_codec --candidates 300 --summary-words 250
+"""
+import time
+import random
+import argparse
+from typing import Dict, Any, List, Optional, Callable
+
+from src.app.utils.common import json_codec
+from src.benchmarks.fakes import FakeS3Service, business_id
+
+
+def build_payloads(candidates: int = 300, summary_words: int = 250, recommended: int = 30) -> Dict[str, Any]:
+    s3 = FakeS3Service(latency_ms=0, jitter_ms=0, summary_words=summary_words)
+    rng = random.Random(0)
+    places = [
+        {"id": business_id(i), "name": f"Business {i}", "processed_daterange_001": "20240101_20241231",
+         "processed_avg_score_001": round(rng.uniform(3, 5), 2), "score": rng.random()}
+        for i in range(candidates)
+    ]
+    with_metadata = [{**place, "metadata": s3._synthetic(place["id"]), "reason": "Matches the query."}
+                     for place in places[:recommended]]
+    return {
+        "filter_request": {"filters": {"processed_refined_cuisine_types_001": ["Spanish", "Paella"],
+                                       "processed_avg_score_001": {"gte": 4}}, "global_fields": None},
+        "filter_response": {"body": [{k: v for k, v in place.items() if k != "score"} for place in places]},
+        "pinecone_request": {"business_IDS": [place["id"] for place in places], "query": "best paella near the beach"},
+        "pinecone_response": {"body": {"matches": [{"id": place["id"], "score": place["score"]} for place in places]}},
+        "summary": s3._synthetic(business_id(0)),
+        "final_response": {"statusCode": 200, "body": "{}", "recommended_result": with_metadata,
+                           "rest_result": places[recommended:], "degraded": []},
+    }
+
+
+def _mean_us(fn: Callable[[], Any], repeats: int) -> float:
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) / repeats * 1e6
+
+
+def run(payloads: Dict[str, Any], backends: List[str], repeats: int = 200) -> Dict[str, Any]:
+    report: Dict[str, Any] = {}
+    for backend in backends:
+        json_codec.configure_codec(backend)
+        results = {}
+        for name, payload in payloads.items():
+            encoded = json_codec.dumps(payload)
+            results[name] = {
+                "bytes": len(encoded),
+                "dumps_us": round(_mean_us(lambda: json_codec.dumps(payload), repeats), 1),
+                "loads_us": round(_mean_us(lambda: json_codec.loads(encoded), repeats), 1),
+            }
+        cached = json_codec.dumps(payloads["final_response"])
+        results["final_response"]["round_trip_us"] = round(
+            _mean_us(lambda: json_codec.dumps(json_codec.loads(cached)), repeats), 1)
+        results["final_response"]["raw_us"] = round(_mean_us(lambda: bytes(cached), repeats), 1)
+        report[json_codec.backend()] = results
+    json_codec.configure_codec("auto")
+    return report
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="JSON codec cost on the pipeline payloads")
+    parser.add_argument("--candidates", type=int, default=300)
+    parser.add_argument("--summary-words", type=int, default=250)
+    parser.add_argument("--repeats", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    payloads = build_payloads(args.candidates, args.summary_words)
+    backends = ["json"] + (["orjson"] if json_codec.orjson is not None else [])
+    report = run(payloads, backends, args.repeats)
+
+    print(f"{'payload':<20}{'bytes':>10}" + "".join(f"{b + ' dumps':>16}{b + ' loads':>16}" for b in report))
+    for name in payloads:
+        first = next(iter(report.values()))[name]
+        row = f"{name:<20}{first['bytes']:>10}"
+        for results in report.values():
+            row += f"{results[name]['dumps_us']:>13.1f} us{results[name]['loads_us']:>13.1f} us"
+        print(row)
+    for backend, results in report.items():
+        final = results["final_response"]
+        print(f"{backend}: cached final response sent raw {final['raw_us']} us vs. parsed and re-serialized "
+              f"{final['round_trip_us']} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Memory footprint of the filterer, offline.
+
+Loads the handler with the memory profiler enabled (see
+`src.app.monitoring.memory_profiler`) against the local stand-ins of
+`harness.py`, sends a few requests one at a time, and reports the RSS growth
+of each import / client / component, the peak allocation of each request
+stage, the size of each cache and a Lambda memory size. Exits with a non
+zero status when `--max-rss-mb` is missed, so it can run in CI.
+
+Usage (from the repository root):
+    python -m src.benchmarks.memory_profile --requests 20 --cache-budgets-mb 64 --max-rss-mb 512
+"""
+import os
+import sys
+import json
+import argparse
+from typing import List, Optional
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Memory footprint per component and request stage")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--candidates", type=int, default=300)
+    parser.add_argument("--summaries-dir", default=None, help="Recorded S3 summaries, same key layout as the bucket")
+    parser.add_argument("--snapshot", action="store_true", help="Add the tracemalloc snapshot diff")
+    parser.add_argument("--cache-budgets-mb", type=float, default=0.0, help="Sum of the configured cache budgets")
+    parser.add_argument("--headroom", type=float, default=0.3)
+    parser.add_argument("--max-rss-mb", type=float, default=None)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--output", default=None, help="Write the report as JSON")
+    args = parser.parse_args(argv)
+
+    ## The profiler reads its env vars when it is first imported
+    if "src.app.monitoring.memory_profiler" in sys.modules:
+        raise RuntimeError("The memory profiler was imported before it could be enabled")
+    os.environ["MEMORY_PROFILE"] = "1"
+    os.environ["MEMORY_PROFILE_SNAPSHOT"] = "1" if args.snapshot else "0"
+
+    from src.app.monitoring.memory_profiler import memory_profiler, recommend_lambda_mb
+    from src.app.monitoring.tracing import trace_exporter
+    from src.benchmarks.harness import OfflineEnvironment, sample_events
+
+    trace_exporter.mode = "off"
+    events = sample_events()
+    with OfflineEnvironment(llm_latency_ms=0, llm_per_business_ms=0, embed_latency_ms=0, filter_latency_ms=0,
+                            pinecone_latency_ms=0, index_latency_ms=0, s3_latency_ms=0,
+                            candidates=args.candidates, summaries_dir=args.summaries_dir) as env:
+        for i in range(args.requests):
+            env.handler.data_filterer_handler(events[i % len(events)], None)
+        report = memory_profiler.report(args.top)
+
+    report["recommended_lambda_mb"] = recommend_lambda_mb(report, args.headroom, args.cache_budgets_mb)
+    print(f"RSS {report['rss_mb']} MB, peak {report['peak_rss_mb']} MB -> Lambda memory {report['recommended_lambda_mb']} MB")
+    print("Largest imports:")
+    for record in report["largest_imports"][:args.top]:
+        print(f"  {record['rss_growth_mb']:>8.2f} MB  {record['name']}")
+    print("Init steps and components:")
+    for record in report["init_steps"] + report["components"]:
+        print(f"  {record['rss_growth_mb']:>8.2f} MB  {record['name']}")
+    print(f"{'stage':<28}{'count':>8}{'max peak MB':>14}{'mean peak MB':>14}")
+    for stage, stats in list(report["stages"].items())[:args.top]:
+        print(f"{stage:<28}{stats['count']:>8}{stats['max_peak_mb']:>14.3f}{stats['mean_peak_mb']:>14.3f}")
+    for cache, size_mb in report["caches_mb"].items():
+        print(f"cache {cache}: {size_mb} MB")
+    for record in report.get("snapshot_diff", [])[:args.top]:
+        print(f"  {record['size_diff_kb']:>10.1f} KB  {record['site']}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+    if args.max_rss_mb is not None and report["peak_rss_mb"] > args.max_rss_mb:
+        print(f"FAILED: peak RSS {report['peak_rss_mb']} MB > {args.max_rss_mb} MB")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""
+Recorded-traffic replay and load generator.
+
+Replays a capture file (see `src.app.monitoring.traffic_capture`) against the
+handler (in-process, with the offline stand-ins) or against a server
+deployment over HTTP, in one of three modes:
+
+    recorded: keeps the recorded inter-arrival times (optionally sped up).
+    qps:      open loop Poisson arrivals, for each target QPS in `--qps`.
+    ramp:     closed loop, for each concurrency level in `--concurrency`.
+
+Latency is measured from the scheduled arrival time, so queueing delay is
+included (no coordinated omission). The report has, per step, the achieved
+throughput, error rate and latency percentiles, overall and per event class
+(city/around x english/translated), which together form the saturation curve.
+
+Usage (from the repository root):
+    python -m src.benchmarks.replay capture.jsonl --mode qps --qps 1,2,4,8 --duration 30
+    python -m src.benchmarks.replay capture.jsonl --mode ramp --concurrency 1,4,16 --url http://localhost:8080/filter
+"""
+import json
+import time
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Callable
+
+from src.app.monitoring.tracing import LatencyHistogram, trace_exporter
+from src.app.monitoring.traffic_capture import classify_event, read_capture
+
+
+# =============================================================================
+# Replay file
+# =============================================================================
+def load_replay(path: str) -> List[Dict[str, Any]]:
+    """
+    Load captured records, sorted by arrival time. Accepts the JSON lines
+    written by the `file` capture mode, and log lines exported from the `log`
+    mode (anything before the capture marker is ignored).
+    """
+    records = read_capture(path)
+    for record in records:
+        record.setdefault("event_class", classify_event(record["event"]))
+    records.sort(key=lambda r: r.get("ts", 0))
+    return records
+
+
+def class_key(record: Dict[str, Any]) -> str:
+    event_class = record.get("event_class") or {}
+    return f"{event_class.get('search', 'unknown')}/{event_class.get('language', 'unknown')}"
+
+
+# =============================================================================
+# Targets
+# =============================================================================
+def handler_target(handler: Callable) -> Callable[[Dict[str, Any]], None]:
+    """Calls the lambda handler in-process."""
+    def _send(event):
+        handler(event, None)
+    return _send
+
+
+def http_target(url: str, timeout: float = 60.0) -> Callable[[Dict[str, Any]], None]:
+    """Posts the event to a server deployment; non 2xx responses count as errors."""
+    import requests
+
+    session = requests.Session()
+
+    def _send(event):
+        response = session.post(url, json=event, timeout=timeout)
+        response.raise_for_status()
+    return _send
+
+
+# =============================================================================
+# Load generation
+# =============================================================================
+class StepStats:
+    """Latency and errors of one load step, overall and per event class."""
+
+    def __init__(self) -> None:
+        self.latency = LatencyHistogram()
+        self.per_class: Dict[str, LatencyHistogram] = {}
+        self.errors: Dict[str, int] = {}
+        self.sent = 0
+        self._lock = threading.Lock()
+
+    def record(self, record: Dict[str, Any], latency_ms: float, error: Optional[str]) -> None:
+        key = class_key(record)
+        with self._lock:
+            self.sent += 1
+            histogram = self.per_class.setdefault(key, LatencyHistogram())
+            if error:
+                self.errors[key] = self.errors.get(key, 0) + 1
+        self.latency.record(latency_ms)
+        histogram.record(latency_ms)
+
+    def report(self, elapsed_s: float, **step) -> Dict[str, Any]:
+        total_errors = sum(self.errors.values())
+        return {
+            **step,
+            "sent": self.sent,
+            "elapsed_s": round(elapsed_s, 3),
+            "throughput_rps": round(self.sent / elapsed_s, 3) if elapsed_s else 0.0,
+            "error_rate": round(total_errors / self.sent, 4) if self.sent else 0.0,
+            "latency": self.latency.summary(),
+            "per_class": {
+                key: {**histogram.summary(), "errors": self.errors.get(key, 0)}
+                for key, histogram in sorted(self.per_class.items())
+            },
+        }
+
+
+def _timed_send(send, record, scheduled_at, stats: StepStats) -> None:
+    error = None
+    try:
+        send(record["event"])
+    except Exception as e:
+        error = type(e).__name__
+    stats.record(record, (time.perf_counter() - scheduled_at) * 1000, error)
+
+
+def run_open_loop(send, records: List[Dict[str, Any]], arrivals: List[float], max_workers: int) -> StepStats:
+    """
+    Send `records[i]` at `arrivals[i]` seconds from now, regardless of how
+    many requests are still in flight (open loop).
+    """
+    stats = StepStats()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for record, offset in zip(records, arrivals):
+            scheduled_at = start + offset
+            delay = scheduled_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(_timed_send, send, record, scheduled_at, stats)
+    return stats
+
+
+def run_closed_loop(send, records: List[Dict[str, Any]], concurrency: int, duration_s: float) -> StepStats:
+    """`concurrency` workers send back to back for `duration_s` seconds."""
+    stats = StepStats()
+    deadline = time.perf_counter() + duration_s
+    counter = iter(range(10 ** 12))
+    counter_lock = threading.Lock()
+
+    def _worker():
+        while time.perf_counter() < deadline:
+            with counter_lock:
+                i = next(counter)
+            _timed_send(send, records[i % len(records)], time.perf_counter(), stats)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for _ in range(concurrency):
+            executor.submit(_worker)
+    return stats
+
+
+def replay(send, records: List[Dict[str, Any]], mode: str, qps_steps: List[float], concurrency_steps: List[int],
+           duration_s: float, speedup: float = 1.0, max_workers: int = 64) -> List[Dict[str, Any]]:
+    """
+    Run every step of the chosen mode and return one report per step.
+    """
+    steps = []
+    if mode == "recorded":
+        origin = records[0].get("ts", 0)
+        arrivals = [(r.get("ts", origin) - origin) / speedup for r in records]
+        start = time.perf_counter()
+        stats = run_open_loop(send, records, arrivals, max_workers)
+        steps.append(stats.report(time.perf_counter() - start, mode=mode, speedup=speedup))
+
+    elif mode == "qps":
+        for qps in qps_steps:
+            count = max(1, int(qps * duration_s))
+            arrivals, t = [], 0.0
+            for _ in range(count):
+                t += random.expovariate(qps)
+                arrivals.append(t)
+            sample = [records[i % len(records)] for i in range(count)]
+            start = time.perf_counter()
+            stats = run_open_loop(send, sample, arrivals, max_workers)
+            steps.append(stats.report(time.perf_counter() - start, mode=mode, target_qps=qps))
+
+    elif mode == "ramp":
+        for concurrency in concurrency_steps:
+            start = time.perf_counter()
+            stats = run_closed_loop(send, records, concurrency, duration_s)
+            steps.append(stats.report(time.perf_counter() - start, mode=mode, concurrency=concurrency))
+
+    else:
+        raise ValueError(f"Unsupported replay mode: {mode}. Supported modes are 'recorded', 'qps' and 'ramp'.")
+    return steps
+
+
+def print_steps(steps: List[Dict[str, Any]]) -> None:
+    print(f"{'step':<18}{'sent':>7}{'rps':>9}{'err%':>7}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for step in steps:
+        label = step.get("target_qps") or step.get("concurrency") or step.get("speedup")
+        label = f"{step['mode']}={label}"
+        latency = step["latency"]
+        print(f"{label:<18}{step['sent']:>7}{step['throughput_rps']:>9.2f}{step['error_rate'] * 100:>7.1f}"
+              f"{latency['p50_ms']:>9.0f}{latency['p95_ms']:>9.0f}{latency['p99_ms']:>9.0f}")
+        for key, stats in step["per_class"].items():
+            print(f"  {key:<16}{stats['count']:>7}{'':>9}{'':>7}{stats['p50_ms']:>9.0f}"
+                  f"{stats['p95_ms']:>9.0f}{stats['p99_ms']:>9.0f}  errors={stats['errors']}")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Replay captured traffic against the filterer")
+    parser.add_argument("capture", help="Capture file (JSON lines)")
+    parser.add_argument("--mode", choices=["recorded", "qps", "ramp"], default="recorded")
+    parser.add_argument("--qps", default="1,2,4", help="Comma separated QPS steps (qps mode)")
+    parser.add_argument("--concurrency", default="1,4,8", help="Comma separated concurrency steps (ramp mode)")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds per step (qps / ramp modes)")
+    parser.add_argument("--speedup", type=float, default=1.0, help="Time compression of the recorded mode")
+    parser.add_argument("--max-workers", type=int, default=64)
+    parser.add_argument("--url", default=None, help="Server endpoint; the in-process offline handler otherwise")
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0)
+    parser.add_argument("--output", default=None, help="Write the step reports as JSON")
+    args = parser.parse_args(argv)
+
+    records = load_replay(args.capture)
+    qps_steps = [float(v) for v in args.qps.split(",")]
+    concurrency_steps = [int(v) for v in args.concurrency.split(",")]
+
+    def _run(send):
+        return replay(send, records, args.mode, qps_steps, concurrency_steps, args.duration,
+                      speedup=args.speedup, max_workers=args.max_workers)
+
+    if args.url:
+        steps = _run(http_target(args.url))
+    else:
+        from src.benchmarks.harness import OfflineEnvironment
+
+        trace_exporter.mode = "off"
+        with OfflineEnvironment(llm_latency_ms=args.llm_latency_ms) as env:
+            steps = _run(handler_target(env.handler.data_filterer_handler))
+
+    print_steps(steps)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(steps, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""
+Long-running ASGI server mode of the filterer.
+
+Serves the same pipeline as the `data_filterer_handler` lambda, with the same
+request (`FilterEvent`) and response schema, from a single process: the
+resources (LLM clients, Pinecone, S3, graphs) and the in-process caches are
+built once and shared by every request. The pipeline is blocking, so requests
+run on a bounded thread pool; requests above `MAX_CONCURRENCY` wait in a
+queue of `MAX_QUEUE` and are rejected with 503 beyond it, so the load
+balancer can retry them elsewhere.
+
+Endpoints:
+    POST /filter: Runs the pipeline for a `FilterEvent`.
+    POST /filter/stream: Same pipeline, streamed as NDJSON: filters, provisional
+                  vector-ordered results, refined rankings, final response.
+    POST /reasons: Reasons of the visible results (`ReasonEvent`), for the score-only rerank mode.
+    GET /health:  Liveness, answers as soon as the process is up.
+    GET /ready:   Readiness, 503 until the resources are warm, with the cities
+                  whose snapshots and responses this worker holds.
+
+Every /filter response carries the routing key of its city (`X-Route-Key`,
+e.g. `es/vlc`). A load balancer hashing on that key (or on the city of the
+request, see `city_partitions.route`) sends each city to the same warm workers.
+
+Config (`SERVER` key): MAX_CONCURRENCY (default 8), MAX_QUEUE (default 32).
+
+Usage (from the repository root, a single worker so the resources are shared):
+    uvicorn src.server.asgi_app:app --host 0.0.0.0 --port 8080 --workers 1
+"""
+import os
+import asyncio
+import logging
+import importlib
+import threading
+import contextvars
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+from src.app.schemas.data_models import FilterEvent, ReasonEvent
+from src.app.utils.common.deadline import DeadlineExceeded
+from src.app.utils.common.resilience import CircuitOpenError
+from src.app.utils.common import json_codec
+
+
+HANDLER_MODULE = "src.aws.filterer_flow_handler"
+
+logger = logging.getLogger(__name__)
+
+
+class PipelineRunner:
+    """Loads the handler module once and runs requests on a bounded thread pool."""
+
+    def __init__(self) -> None:
+        self.pipeline = None
+        self.load_error = None
+        self.max_concurrency = 8
+        self.max_queue = 32
+        self.in_flight = 0
+        self._slots = None
+        self._executor = None
+
+    @property
+    def ready(self) -> bool:
+        return self.pipeline is not None
+
+    def load(self) -> None:
+        """Import the handler module, which builds every shared resource."""
+        try:
+            pipeline = importlib.import_module(HANDLER_MODULE)
+        except Exception as e:
+            logger.exception("Could not load the filterer pipeline")
+            self.load_error = str(e)
+            return
+        server_config = pipeline.config.get("SERVER") or {}
+        self.max_concurrency = int(server_config.get("MAX_CONCURRENCY", self.max_concurrency))
+        self.max_queue = int(server_config.get("MAX_QUEUE", self.max_queue))
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="pipeline")
+        self.pipeline = pipeline
+
+    async def run(self, event: dict, handler: str = "data_filterer_handler") -> dict:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+        if self.in_flight >= self.max_concurrency + self.max_queue:
+            raise HTTPException(status_code=503, detail="Server overloaded")
+
+        self.in_flight += 1
+        try:
+            async with self._slots:
+                # Each request gets a fresh context, so traces and deadlines do not leak between requests
+                context = contextvars.Context()
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(
+                    self._executor, context.run, getattr(self.pipeline, handler), event, None
+                )
+        finally:
+            self.in_flight -= 1
+
+    async def stream(self, event: dict):
+        """
+        Runs the streaming pipeline on the pool, yielding its messages as they
+        are produced. When the client goes away, the pipeline stops at its next
+        message and the slot is held until it has.
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+        if self.in_flight >= self.max_concurrency + self.max_queue:
+            raise HTTPException(status_code=503, detail="Server overloaded")
+
+        self.in_flight += 1
+        try:
+            async with self._slots:
+                loop = asyncio.get_running_loop()
+                queue: asyncio.Queue = asyncio.Queue()
+                done = object()
+                cancelled = threading.Event()
+
+                def _produce():
+                    messages = self.pipeline.data_filterer_stream(event)
+                    try:
+                        for message in messages:
+                            if cancelled.is_set():
+                                break
+                            loop.call_soon_threadsafe(queue.put_nowait, message)
+                    except Exception as e:
+                        loop.call_soon_threadsafe(queue.put_nowait, e)
+                    finally:
+                        # Runs the finally blocks of the pipeline (spans, traffic recorder) on this thread
+                        messages.close()
+                        loop.call_soon_threadsafe(queue.put_nowait, done)
+
+                producer = loop.run_in_executor(self._executor, contextvars.Context().run, _produce)
+                try:
+                    while True:
+                        message = await queue.get()
+                        if message is done:
+                            break
+                        if isinstance(message, Exception):
+                            raise message
+                        yield message
+                finally:
+                    # Also on a disconnect (cancelled at `queue.get`): the slot is free once the pipeline is
+                    cancelled.set()
+                    await asyncio.shield(producer)
+        finally:
+            self.in_flight -= 1
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+
+runner = PipelineRunner()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm up in the background, so /health answers while the resources load
+    loading = asyncio.create_task(asyncio.to_thread(runner.load))
+    yield
+    await loading
+    runner.shutdown()
+
+
+app = FastAPI(title="GMA filterer", lifespan=lifespan)
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+
+@app.get("/ready")
+async def ready():
+    if not runner.ready:
+        return JSONResponse(status_code=503, content={"status": "loading", "error": runner.load_error})
+    return {"status": "ready", "in_flight": runner.in_flight, "max_concurrency": runner.max_concurrency,
+            "cities": runner.pipeline.resident_cities()}
+
+
+@app.post("/filter")
+async def filter_places(event: FilterEvent):
+    if not runner.ready:
+        raise HTTPException(status_code=503, detail="Pipeline not loaded yet")
+    try:
+        # Serialized by the pipeline (cached responses are sent as stored), not by FastAPI's encoder
+        body = await runner.run(event.model_dump(), handler="data_filterer_handler_bytes")
+        route_key = runner.pipeline.city_partitions.routing_key(event.country_code, event.city_code)
+        return Response(content=body, media_type="application/json", headers={"X-Route-Key": route_key})
+    except HTTPException:
+        raise
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        logger.exception("Filter request failed")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+
+@app.post("/filter/stream")
+async def filter_places_stream(event: FilterEvent):
+    if not runner.ready:
+        raise HTTPException(status_code=503, detail="Pipeline not loaded yet")
+    if runner.in_flight >= runner.max_concurrency + runner.max_queue:
+        # Shed before the 200 status line is sent
+        raise HTTPException(status_code=503, detail="Server overloaded")
+
+    async def _ndjson():
+        try:
+            async for message in runner.stream(event.model_dump()):
+                yield json_codec.dumps(message) + b"\n"
+        except HTTPException as e:
+            yield json_codec.dumps({"type": "error", "status": e.status_code, "detail": e.detail}) + b"\n"
+        except Exception as e:
+            # The status line is already sent, errors travel as the last message
+            logger.exception("Streamed filter request failed")
+            status = 504 if isinstance(e, DeadlineExceeded) else 503 if isinstance(e, CircuitOpenError) else 500
+            yield json_codec.dumps({"type": "error", "status": status, "detail": str(e)}) + b"\n"
+
+    return StreamingResponse(_ndjson(), media_type="application/x-ndjson")
+
+
+@app.post("/reasons")
+async def reasons(event: ReasonEvent):
+    if not runner.ready:
+        raise HTTPException(status_code=503, detail="Pipeline not loaded yet")
+    try:
+        response = await runner.run(event.model_dump(), handler="data_reasons_handler")
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Reasons request failed")
+        raise HTTPException(status_code=500, detail=str(e))
+    if response.get("statusCode", 200) >= 400:
+        raise HTTPException(status_code=response["statusCode"], detail=response.get("body"))
+    return response
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host=os.getenv("HOST", "0.0.0.0"), port=int(os.getenv("PORT", "8080")), workers=1)
@@ -1,5 +1,5 @@
 import os
-from src.app.utils.aws.secrets_manager_client import SecretsManagerClient
+from src.app.utils.common.secrets_provider import get_secrets_provider
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 def read_docker_secret(secret_name: str) -> str | None:
@@ -10,11 +10,13 @@ def read_docker_secret(secret_name: str) -> str | None:
     except FileNotFoundError:
         return None
     
-secrets_manager_client = SecretsManagerClient(region_name="eu-central-1")
+## Shared with the ResourceInitializer, so the secret is only fetched once (built from the
+## environment here, rebuilt by the ResourceInitializer if its config sets other SECRETS_* keys)
+secrets_provider = get_secrets_provider()
 
 class Settings(BaseSettings):
     # OPIK_API_KEY: str | None = None
-    COMET_API_KEY: str | None = secrets_manager_client.get_secret("gma-dev-opik-api-sec")["api_key"]
+    COMET_API_KEY: str | None = secrets_provider.get_secret("gma-dev-opik-api-sec")["api_key"]
     COMET_PROJECT: str = os.getenv("COMET_PROJECT", "guideme")
     
 
@@ -0,0 +1,42 @@
+import pytest
+
+from src.app.services.city_partitions import CityPartitions, city_name, parse_city, route
+
+
+WORKERS = [f"worker-{i}" for i in range(8)]
+
+
+def test_route_is_stable_whatever_the_order_of_the_workers():
+    assert route("es/vlc", WORKERS, 3) == route("es/vlc", list(reversed(WORKERS)), 3)
+    assert len(route("es/vlc", WORKERS, 3)) == 3
+
+
+def test_removing_a_worker_only_moves_the_keys_it_owned():
+    keys = [f"es/city{i}" for i in range(200)]
+    before = {key: route(key, WORKERS)[0] for key in keys}
+    removed = WORKERS[3]
+    after = {key: route(key, [w for w in WORKERS if w != removed])[0] for key in keys}
+
+    moved = {key for key in keys if before[key] != after[key]}
+    assert moved == {key for key in keys if before[key] == removed}
+    # The next replica of a key takes over its place
+    assert all(after[key] == route(key, WORKERS, 2)[1] for key in moved)
+
+
+def test_route_spreads_the_keys():
+    owners = [route(f"es/city{i}", WORKERS)[0] for i in range(400)]
+    assert set(owners) == set(WORKERS)
+
+
+def test_requests_without_a_city_get_the_default_one():
+    partitions = CityPartitions.from_config({"DEFAULT": "es/mad"})
+    assert partitions.resolve(None, None) == ("es", "mad")
+    assert partitions.resolve(None, "VLC ") == ("es", "vlc")
+    assert partitions.routing_key("PT", "lis") == "pt/lis"
+    assert partitions.preload == [("es", "mad")]
+
+
+def test_parse_city_is_the_inverse_of_city_name():
+    assert parse_city(city_name(("es", "vlc"))) == ("es", "vlc")
+    with pytest.raises(ValueError):
+        parse_city("vlc")
@@ -0,0 +1,107 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from src.app.utils.common.concurrency_limiter import ConcurrencyLimiter, get_limiter
+from src.app.utils.common.deadline import DeadlineExceeded
+
+
+class Gauge:
+    """Peak number of concurrent holders."""
+
+    def __init__(self) -> None:
+        self.current = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        with self._lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+
+    def __exit__(self, *exc):
+        with self._lock:
+            self.current -= 1
+
+
+def test_the_limit_holds_across_threads_and_event_loops():
+    limiter, gauge = ConcurrencyLimiter("test", 3), Gauge()
+
+    async def task():
+        async with limiter.slot_async(5):
+            with gauge:
+                await asyncio.sleep(0.01)
+
+    async def many_tasks():
+        await asyncio.gather(*(task() for _ in range(10)))
+
+    def blocking():
+        for _ in range(5):
+            with limiter.slot(5), gauge:
+                time.sleep(0.005)
+
+    threads = [threading.Thread(target=asyncio.run, args=(many_tasks(),)) for _ in range(3)]
+    threads += [threading.Thread(target=blocking) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    assert gauge.peak == 3
+    assert limiter.metrics()["in_use"] == 0
+    assert limiter.metrics()["waiting"] == 0
+
+
+def test_acquire_times_out_and_leaves_no_waiter():
+    limiter = ConcurrencyLimiter("test", 1)
+    limiter.acquire()
+    with pytest.raises(DeadlineExceeded):
+        limiter.acquire(0.02)
+
+    async def acquire_async():
+        await limiter.acquire_async(0.02)
+
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(acquire_async())
+    assert limiter.metrics()["waiting"] == 0
+    limiter.release()
+    assert limiter.metrics()["in_use"] == 0
+
+
+def test_a_cancelled_waiter_does_not_leak_its_slot():
+    limiter = ConcurrencyLimiter("test", 1)
+
+    async def scenario():
+        await limiter.acquire_async()
+        waiter = asyncio.ensure_future(limiter.acquire_async())
+        await asyncio.sleep(0)
+        limiter.release()  # Handed to the waiter, which is cancelled before it runs
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        await asyncio.sleep(0)
+
+    asyncio.run(scenario())
+    assert limiter.metrics()["in_use"] == 0
+
+
+def test_slots_are_handed_over_in_arrival_order():
+    limiter, order = ConcurrencyLimiter("test", 1), []
+
+    async def task(index):
+        async with limiter.slot_async(5):
+            order.append(index)
+            await asyncio.sleep(0.001)
+
+    async def scenario():
+        await asyncio.gather(*(task(i) for i in range(5)))
+
+    asyncio.run(scenario())
+    assert order == list(range(5))
+
+
+def test_get_limiter_is_process_wide():
+    assert get_limiter("test-registry", 2) is get_limiter("test-registry", 2)
+    assert get_limiter("test-registry", 5).limit == 2
@@ -0,0 +1,89 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.app.utils.common.deadline import (
+    Deadline, DeadlineExceeded, current_deadline, mark_degraded, use_deadline,
+)
+
+
+class LambdaContext:
+    def __init__(self, remaining_ms: float) -> None:
+        self.remaining_ms = remaining_ms
+
+    def get_remaining_time_in_millis(self) -> float:
+        return self.remaining_ms
+
+
+def test_the_budget_is_the_smallest_of_config_request_and_lambda():
+    config = {"BUDGET_MS": 8000, "SAFETY_MARGIN_MS": 500}
+    assert Deadline.for_request(config).budget_ms == 8000
+    assert Deadline.for_request(config, requested_ms=3000).budget_ms == 3000
+    assert Deadline.for_request(config, context=LambdaContext(5000)).budget_ms == 4500
+    assert Deadline.for_request(None).budget_ms is None
+
+
+def test_the_timeout_is_capped_by_the_stage_and_fails_without_budget():
+    deadline = Deadline(budget_ms=60_000, stage_timeouts_s={"pinecone": 2})
+    assert deadline.timeout("pinecone") == 2
+    assert 59 < deadline.timeout("rerank") <= 60
+    assert Deadline().timeout("rerank") is None
+
+    with pytest.raises(DeadlineExceeded):
+        Deadline(budget_ms=0).timeout("pinecone")
+
+
+def test_stages_degrade_below_their_threshold():
+    deadline = Deadline(budget_ms=3000, degrade_rules={"translate": 6000})
+    assert deadline.should_degrade("translate")
+    assert not deadline.should_degrade("pinecone")
+    assert not deadline.should_degrade("unknown")
+    assert not Deadline().should_degrade("translate")
+
+
+def test_mark_degraded_records_on_the_current_deadline_only():
+    mark_degraded("outside")  # no current deadline: a no-op
+    assert current_deadline().degraded == []
+
+    with use_deadline(Deadline(budget_ms=1000)) as deadline:
+        mark_degraded("rerank_skipped")
+        mark_degraded("rerank_skipped")
+    assert deadline.degraded == ["rerank_skipped"]
+    assert current_deadline() is not deadline
+
+
+def test_a_scope_shares_the_budget_but_not_the_flags():
+    deadline = Deadline(budget_ms=5000, degrade_rules={"rerank": 100})
+    with use_deadline(deadline):
+        mark_degraded("shared")
+        scoped = deadline.scope()
+        with use_deadline(scoped):
+            mark_degraded("item_only")
+        assert current_deadline() is deadline
+
+    assert scoped.expires_at == deadline.expires_at
+    assert scoped.degrade_rules == deadline.degrade_rules
+    assert deadline.degraded == ["shared"]
+    assert scoped.degraded == ["item_only"]
+
+
+def test_flags_marked_in_a_copied_context_reach_the_request():
+    deadline = Deadline(budget_ms=5000)
+    with use_deadline(deadline), ThreadPoolExecutor(max_workers=2) as executor:
+        futures = [
+            executor.submit(contextvars.copy_context().run, mark_degraded, flag)
+            for flag in ("s3_partial", "rerank_failed")
+        ]
+        for future in futures:
+            future.result()
+        # A thread started without the context does not see the deadline
+        executor.submit(mark_degraded, "lost").result()
+
+    assert sorted(deadline.degraded) == ["rerank_failed", "s3_partial"]
+
+
+def test_budget_buckets_group_close_budgets():
+    assert Deadline().budget_bucket() is None
+    assert Deadline(budget_ms=2999).budget_bucket() == 2
+    assert Deadline(budget_ms=2999).budget_bucket(500) == 5
@@ -0,0 +1,94 @@
+import logging
+
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from src.app.services.filterer import Filterer
+from src.benchmarks.fakes import FakePineconeIndex, business_id, fake_vector
+
+
+class CountingIndex(FakePineconeIndex):
+    """Fake index of `size` businesses, recording the queries it gets."""
+
+    def __init__(self, size: int) -> None:
+        super().__init__("businesses", latency_ms=0)
+        self.records = [
+            {"id": business_id(i), "values": fake_vector(business_id(i)), "metadata": {"name": f"Place {i}", "rating": i % 5}}
+            for i in range(size)
+        ]
+        self.queries = []
+
+    def query(self, **kwargs):
+        self.queries.append(kwargs)
+        return super().query(**kwargs)
+
+
+def filterer(index, id_chunk_size: int) -> Filterer:
+    client = Filterer.__new__(Filterer)
+    client.index = index
+    client.index_name = "businesses"
+    client.namespace = "es-vlc"
+    client.logger = logging.getLogger("test")
+    client.id_chunk_size = id_chunk_size
+    return client
+
+
+def test_query_by_ids_merges_the_chunks_into_the_global_top_k():
+    index = CountingIndex(60)
+    vector = fake_vector("paella")
+    ids = [business_id(i) for i in range(60)]
+
+    result = filterer(index, id_chunk_size=7).query_by_ids(vector, ids, top_k=15)
+    expected = index.query(vector=vector, top_k=15, include_metadata=False)["matches"]
+
+    assert [match["id"] for match in result["matches"]] == [match["id"] for match in expected]
+    assert len(index.queries) == 1 + 9  # 9 chunks of at most 7 ids, plus the reference query
+    assert all(len(query["filter"]["business_id"]["$in"]) <= 7 for query in index.queries[:-1])
+
+
+def test_query_by_ids_returns_every_id_once_by_default():
+    index = CountingIndex(20)
+    ids = [business_id(i) for i in range(20)] + [business_id(3)]
+    result = filterer(index, id_chunk_size=6).query_by_ids(fake_vector("sushi"), ids)
+
+    scores = [match["score"] for match in result["matches"]]
+    assert sorted(match["id"] for match in result["matches"]) == sorted(set(ids))
+    assert scores == sorted(scores, reverse=True)
+    assert all("metadata" not in match for match in result["matches"])
+
+
+def test_query_by_ids_metadata():
+    index = CountingIndex(10)
+    client = filterer(index, id_chunk_size=4)
+    ids = [business_id(i) for i in range(10)]
+
+    only_rating = client.query_by_ids(fake_vector("tapas"), ids, metadata_fields=["rating"])
+    assert all(set(match["metadata"]) == {"rating"} for match in only_rating["matches"])
+
+    everything = client.query_by_ids(fake_vector("tapas"), ids, include_metadata=True)
+    assert all(set(match["metadata"]) == {"name", "rating"} for match in everything["matches"])
+
+
+def test_query_index_above_the_chunk_size_keeps_all_the_metadata():
+    index = CountingIndex(10)
+    client = filterer(index, id_chunk_size=4)
+    client.embedding_model = type("Embeddings", (), {"embed_query": staticmethod(fake_vector)})()
+
+    result = client.query_index("paella", {"business_id": {"$in": [business_id(i) for i in range(10)]}})
+    assert len(result["matches"]) == 10
+    assert all(set(match["metadata"]) == {"name", "rating"} for match in result["matches"])
+
+
+def test_query_index_returns_the_same_shape_below_and_above_the_chunk_size():
+    index = CountingIndex(10)
+    client = filterer(index, id_chunk_size=4)
+    client.embedding_model = type("Embeddings", (), {"embed_query": staticmethod(fake_vector)})()
+    ids = {"business_id": {"$in": [business_id(i) for i in range(10)]}}
+
+    chunked = client.query_index("paella", ids)
+    client.id_chunk_size = 500
+    single = client.query_index("paella", ids)
+
+    assert type(chunked) is type(single) is dict
+    assert chunked == single
@@ -0,0 +1,83 @@
+import threading
+import time
+
+from src.app.utils.common.hedging import HedgePolicy, Hedger
+
+
+class SlowFirstCall:
+    """The first call blocks until released, the next ones answer at once."""
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.release = threading.Event()
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            self.calls += 1
+            first = self.calls == 1
+        if first:
+            self.release.wait(5)
+            return "primary"
+        return "hedge"
+
+
+def policy(**overrides) -> HedgePolicy:
+    defaults = {"enabled": True, "min_delay_ms": 0, "max_delay_ms": 2000, "initial_delay_ms": 20,
+                "min_samples": 5, "max_extra_load": 1.0}
+    return HedgePolicy(**{**defaults, **overrides})
+
+
+def test_the_delay_is_the_percentile_of_the_recent_latencies():
+    hedger = Hedger("test", policy(percentile=90, min_delay_ms=5, max_delay_ms=80))
+    assert hedger.hedge_delay_ms() == 20  # too few samples: the initial delay
+
+    hedger.latencies.extend(range(1, 101))
+    assert hedger.hedge_delay_ms() == 80  # p90 is 91, capped by max_delay_ms
+    hedger.policy.percentile = 50
+    assert hedger.hedge_delay_ms() == 51
+
+    hedger.latencies.clear()
+    hedger.latencies.extend([1] * 10)
+    assert hedger.hedge_delay_ms() == 5  # raised to min_delay_ms
+
+
+def test_a_slow_call_is_hedged_and_the_hedge_wins():
+    hedger = Hedger("test", policy())
+    fn = SlowFirstCall()
+    try:
+        assert hedger.call(fn) == "hedge"
+    finally:
+        fn.release.set()
+    assert fn.calls == 2
+    assert hedger.metrics()["hedges_sent"] == hedger.metrics()["hedge_wins"] == 1
+
+
+def test_a_fast_call_is_not_hedged():
+    hedger = Hedger("test", policy(initial_delay_ms=1000))
+    assert hedger.call(lambda: "ok") == "ok"
+    assert hedger.metrics()["hedges_sent"] == 0
+    assert len(hedger.latencies) == 1
+
+
+def test_the_extra_load_cap_suppresses_hedges():
+    hedger = Hedger("test", policy(initial_delay_ms=1, min_samples=100, max_extra_load=0.5))
+
+    def slow():
+        time.sleep(0.02)
+        return "ok"
+
+    for _ in range(6):
+        assert hedger.call(slow) == "ok"
+    metrics = hedger.metrics()
+    # One hedge per two calls at most
+    assert metrics["hedges_sent"] == 3
+    assert metrics["hedges_suppressed"] == 3
+    assert metrics["hedge_rate"] == 0.5
+
+
+def test_a_disabled_hedger_calls_once_inline():
+    hedger = Hedger("test", HedgePolicy())
+    caller = threading.get_ident()
+    assert hedger.call(threading.get_ident) == caller
+    assert hedger.metrics()["calls"] == 1
@@ -0,0 +1,54 @@
+import json
+from datetime import date
+
+import pytest
+
+from src.app.utils.common import json_codec
+from src.benchmarks.json_codec import build_payloads
+
+
+BACKENDS = ["json", pytest.param("orjson", marks=pytest.mark.skipif(json_codec.orjson is None, reason="orjson not installed"))]
+
+
+@pytest.fixture(params=BACKENDS)
+def backend(request):
+    previous = json_codec.backend()
+    assert json_codec.configure_codec(request.param) == request.param
+    yield request.param
+    json_codec.configure_codec(previous)
+
+
+@pytest.mark.parametrize("name", list(build_payloads(candidates=20, summary_words=30)))
+def test_round_trip_of_the_pipeline_payloads(backend, name):
+    payload = build_payloads(candidates=20, summary_words=30)[name]
+    data = json_codec.dumps(payload)
+    assert isinstance(data, bytes)
+    assert json_codec.loads(data) == payload
+    assert json_codec.loads(memoryview(data)) == payload
+    assert json_codec.loads(data.decode("utf-8")) == payload
+
+
+def test_both_backends_write_the_same_bytes():
+    if json_codec.orjson is None:
+        pytest.skip("orjson not installed")
+    payload = {**build_payloads(candidates=20, summary_words=30)["final_response"], "name": "Café Ñandú"}
+    previous = json_codec.backend()
+    try:
+        json_codec.configure_codec("json")
+        stdlib = json_codec.dumps(payload, sort_keys=True)
+        json_codec.configure_codec("orjson")
+        assert json_codec.dumps(payload, sort_keys=True) == stdlib
+    finally:
+        json_codec.configure_codec(previous)
+
+
+def test_compact_output_and_fallbacks(backend):
+    assert json_codec.dumps({"a": [1, 2], "b": None}) == b'{"a":[1,2],"b":null}'
+    assert json_codec.dumps({"name": "Café"}).decode("utf-8") == '{"name":"Café"}'
+    assert json.loads(json_codec.dumps({"day": date(2024, 1, 2)})) == {"day": "2024-01-02"}
+    assert json_codec.dumps_str({"b": 1, "a": 2}, sort_keys=True) == '{"a":2,"b":1}'
+
+
+def test_unknown_codec():
+    with pytest.raises(ValueError):
+        json_codec.configure_codec("ujson")
@@ -0,0 +1,69 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+pytest.importorskip("requests")
+pytest.importorskip("langchain_core")
+
+from src.app.services.sentence_transformers_embeddings import MicroBatcher
+from src.benchmarks.fakes import fake_vector
+
+
+class FakeServer:
+    """`embed_documents` of the embedding server, recording its batches."""
+
+    def __init__(self, latency_ms: float = 20.0, answer=None) -> None:
+        self.latency_ms = latency_ms
+        self.answer = answer
+        self.batches = []
+        self._lock = threading.Lock()
+
+    def __call__(self, queries):
+        with self._lock:
+            self.batches.append(list(queries))
+        time.sleep(self.latency_ms / 1000)
+        if self.answer is not None:
+            return self.answer(queries)
+        return [fake_vector(query) for query in queries]
+
+
+def embed_all(batcher, queries):
+    with ThreadPoolExecutor(max_workers=len(queries)) as executor:
+        return list(executor.map(batcher.embed, queries))
+
+
+def test_concurrent_queries_share_a_request_and_get_their_own_vector():
+    server = FakeServer()
+    batcher = MicroBatcher(server, window_ms=50, max_batch_size=32)
+    queries = [f"query {i}" for i in range(8)] + ["query 0"]
+
+    vectors = embed_all(batcher, queries)
+
+    assert vectors == [fake_vector(query) for query in queries]
+    assert len(server.batches) < len(queries)
+    # Duplicated queries are embedded once
+    assert all(len(batch) == len(set(batch)) for batch in server.batches)
+
+
+def test_a_batch_is_sent_once_full():
+    server = FakeServer(latency_ms=0)
+    batcher = MicroBatcher(server, window_ms=10_000, max_batch_size=4)
+    started = time.perf_counter()
+    embed_all(batcher, [f"query {i}" for i in range(4)])
+
+    assert time.perf_counter() - started < 5
+    assert [len(batch) for batch in server.batches] == [4]
+    assert batcher.metrics()["batch_sizes"] == {4: 1}
+
+
+def test_errors_reach_every_caller_and_the_worker_survives():
+    failing = FakeServer(answer=lambda queries: [])  # fewer vectors than queries
+    batcher = MicroBatcher(failing, window_ms=20)
+
+    with pytest.raises(ValueError):
+        embed_all(batcher, ["a", "b", "c"])
+
+    failing.answer = None
+    assert batcher.embed("d") == fake_vector("d")
@@ -0,0 +1,159 @@
+import gzip
+import io
+import json
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("pydantic")
+
+from src.app.schemas.data_models import FilterEvent
+from src.app.services.precomputed_results import PrecomputedResults, PrecomputedResultsStore, precompute_city
+from src.app.services.request_key import request_key
+from src.app.utils.common.deadline import current_deadline, mark_degraded
+
+
+INPUTS = {"summaries": "s1", "embeddings": "e1", "index": "i1"}
+
+
+def event(query: str) -> dict:
+    return {"filter_data": {"natural_query": query}, "city_code": "vlc", "country_code": "es"}
+
+
+def records(*queries) -> list:
+    return [{"event": event(query)} for query in queries]
+
+
+class Pipeline:
+    """`run_filter_pipeline` stand-in, degrading the queries of `degrade`."""
+
+    def __init__(self, degrade=()) -> None:
+        self.degrade = set(degrade)
+        self.runs = []
+
+    def __call__(self, event_data: FilterEvent) -> dict:
+        query = event_data.filter_data.natural_query
+        self.runs.append(query)
+        if query in self.degrade:
+            mark_degraded("rerank_skipped")
+        return {"statusCode": 200, "recommended_result": [{"id": query}], "rest_result": [],
+                "degraded": list(current_deadline().degraded)}
+
+
+def test_degraded_responses_are_not_published():
+    pipeline = Pipeline(degrade={"cheap sushi"})
+    result = precompute_city(records("paella", "paella", "cheap sushi"), "es", "vlc", 10, pipeline, INPUTS)
+
+    assert result["report"]["computed"] == 1
+    assert result["report"]["skipped"] == 1
+    assert [entry["query"] for entry in result["data"]["entries"].values()] == ["paella"]
+
+
+def test_each_request_gets_its_own_deadline():
+    pipeline = Pipeline(degrade={"cheap sushi"})
+    result = precompute_city(records("cheap sushi", "paella"), "es", "vlc", 10, pipeline, INPUTS)
+    # The flag of the first request does not leak into the second one
+    assert (result["report"]["computed"], result["report"]["skipped"]) == (1, 1)
+    assert current_deadline().degraded == []
+
+
+def test_valid_entries_are_reused_and_stale_ones_recomputed():
+    first = precompute_city(records("paella", "tapas"), "es", "vlc", 10, Pipeline(), INPUTS)
+    previous = PrecomputedResults(first["data"])
+
+    pipeline = Pipeline()
+    again = precompute_city(records("paella", "tapas", "sushi"), "es", "vlc", 10, pipeline, INPUTS, previous=previous)
+    assert again["report"]["reused"] == 2
+    assert pipeline.runs == ["sushi"]
+
+    pipeline = Pipeline()
+    changed = precompute_city(records("paella"), "es", "vlc", 10, pipeline, {**INPUTS, "summaries": "s2"}, previous=previous)
+    assert changed["report"]["computed"] == 1 and pipeline.runs == ["paella"]
+
+    pipeline = Pipeline()
+    precompute_city(records("paella"), "es", "vlc", 10, pipeline, INPUTS, previous=previous, max_age_h=0)
+    assert pipeline.runs == ["paella"]
+
+
+class FakeS3:
+    """`get_object` of the published sets, optionally slowed down by `gate`."""
+
+    def __init__(self, sets: dict) -> None:
+        self.objects = {}
+        for (country, city), data in sets.items():
+            base = f"prc/precomputed/{country}/{city}"
+            self.objects[f"{base}/latest.json"] = json.dumps({"version": data["version"]}).encode("utf-8")
+            self.objects[f"{base}/{data['version']}/results.json.gz"] = gzip.compress(json.dumps(data).encode("utf-8"))
+        self.gate = threading.Event()
+        self.gate.set()
+        self.gets = []
+
+    def get_object(self, Bucket, Key):
+        self.gets.append(Key)
+        self.gate.wait(5)
+        if Key not in self.objects:
+            raise KeyError(Key)
+        return {"Body": io.BytesIO(self.objects[Key])}
+
+
+def published(query: str, inputs: dict) -> dict:
+    return precompute_city(records(query), "es", "vlc", 10, Pipeline(), inputs)["data"]
+
+
+def store_with(s3: FakeS3) -> PrecomputedResultsStore:
+    store = PrecomputedResultsStore(bucket="bucket")
+    store._s3 = s3
+    return store
+
+
+def test_lookup_checks_the_input_versions():
+    store = store_with(FakeS3({("es", "vlc"): published("paella", INPUTS)}))
+    store.get("es", "vlc")
+    paella = FilterEvent.model_validate(event("paella"))
+
+    assert store.lookup(paella, ("es", "vlc"), lambda: INPUTS)["recommended_result"] == [{"id": "paella"}]
+    assert store.lookup(paella, ("es", "vlc"), lambda: {**INPUTS, "embeddings": "e2"}) is None
+    # Snapshots not loaded yet: no match
+    assert store.lookup(paella, ("es", "vlc"), lambda: None) is None
+    assert store.lookup(FilterEvent.model_validate(event("sushi")), ("es", "vlc"), lambda: INPUTS) is None
+    assert store.metrics() == {**store.metrics(), "hits": 1, "misses": 3, "stale": 2}
+
+
+def test_lookup_never_waits_on_the_first_download():
+    s3 = FakeS3({("es", "vlc"): published("paella", INPUTS)})
+    s3.gate.clear()
+    store = store_with(s3)
+    paella = FilterEvent.model_validate(event("paella"))
+
+    started = time.perf_counter()
+    assert store.lookup(paella, ("es", "vlc"), lambda: INPUTS) is None
+    assert time.perf_counter() - started < 1
+
+    s3.gate.set()
+    for _ in range(100):
+        if store.lookup(paella, ("es", "vlc"), lambda: INPUTS) is not None:
+            break
+        time.sleep(0.01)
+    assert store.metrics()["hits"] == 1
+
+
+def test_a_slow_city_does_not_block_the_others():
+    s3 = FakeS3({("es", "vlc"): published("paella", INPUTS)})
+    store = store_with(s3)
+    store.get("es", "vlc")
+    s3.gate.clear()
+    store.pointer_ttl_s = 0  # every lookup is due for a check
+    paella = FilterEvent.model_validate(event("paella"))
+
+    started = time.perf_counter()
+    # The refresh of es/mad (and of es/vlc) is stuck, es/vlc keeps answering from its loaded set
+    store.lookup(paella, ("es", "mad"), lambda: INPUTS)
+    assert store.lookup(paella, ("es", "vlc"), lambda: INPUTS) is not None
+    assert time.perf_counter() - started < 1
+    s3.gate.set()
+
+
+def test_request_keys_of_the_set():
+    data = published("paella", INPUTS)
+    assert list(data["entries"]) == [request_key(FilterEvent.model_validate(event("paella")), 3)]
@@ -0,0 +1,57 @@
+import pytest
+
+pytest.importorskip("pydantic")
+
+from src.app.services.reason_generator import ReasonGenerator
+from src.app.utils.common.resilience import LLM, CircuitOpenError, configure_resilience, get_breaker
+
+
+class ReasonChain:
+    """Reason of each business id, `failing` ids raise a non-retryable error."""
+
+    def __init__(self, failing=()) -> None:
+        self.failing = set(failing)
+        self.calls = 0
+
+    def invoke(self, inputs, config=None):
+        self.calls += 1
+        if any(f"Business ID: {failing}\n" in inputs["business"] for failing in self.failing):
+            raise ValueError("Unparsable reason")
+        return {"reason": f"Good for {inputs['input']}"}
+
+
+def businesses(*ids):
+    return [{"business_id": business_id, "business_summary": f"Summary of {business_id}"} for business_id in ids]
+
+
+@pytest.fixture(autouse=True)
+def fresh_breakers():
+    configure_resilience({"LLM": {"FAILURE_THRESHOLD": 1, "BASE_DELAY_S": 0, "MAX_DELAY_S": 0}})
+    yield
+    configure_resilience(None)
+
+
+def test_a_failed_reason_is_none_and_the_others_are_kept():
+    generator = ReasonGenerator(ReasonChain(failing=["biz1"]))
+    reasons = generator.reasons("paella", businesses("biz0", "biz1"))
+    assert reasons == {"biz0": "Good for paella", "biz1": None}
+
+
+def test_an_open_breaker_fails_the_reasons():
+    get_breaker(LLM).record_failure()
+    chain = ReasonChain()
+    with pytest.raises(CircuitOpenError):
+        ReasonGenerator(chain).reasons("paella", businesses("biz0", "biz1"))
+    assert chain.calls == 0
+
+
+def test_cached_reasons_are_returned_when_the_others_fail():
+    chain = ReasonChain()
+    generator = ReasonGenerator(chain)
+    generator.reasons("paella", businesses("biz0"))
+
+    chain.failing = {"biz1"}
+    get_breaker(LLM).record_failure()
+    reasons = generator.reasons("Paella ", businesses("biz0", "biz1"))
+    assert reasons == {"biz0": "Good for paella", "biz1": None}
+    assert chain.calls == 1
@@ -0,0 +1,56 @@
+import pytest
+
+pytest.importorskip("pydantic")
+
+from src.app.schemas.data_models import FilterEvent
+from src.app.services.request_key import normalize_query, request_key
+
+
+def event(**overrides) -> FilterEvent:
+    data = {
+        "filter_data": {
+            "natural_query": "Best paella near the beach",
+            "filters": {"price": [1, 2]},
+            "global_fields": ["name", "rating"],
+            "location": {"lat": 39.469907, "lng": -0.376288},
+            "radius": 500,
+        },
+        "filter_type": "Around",
+        "city_code": "vlc",
+    }
+    data["filter_data"].update(overrides.pop("filter_data", {}))
+    data.update(overrides)
+    return FilterEvent.model_validate(data)
+
+
+def test_normalize_query():
+    assert normalize_query("  Best   PAELLA near the beach?! ") == "best paella near the beach"
+    assert normalize_query(None) == ""
+
+
+def test_equivalent_requests_share_a_key():
+    key = request_key(event())
+    assert request_key(event(filter_data={"natural_query": "best paella  near the BEACH?"})) == key
+    assert request_key(event(filter_data={"global_fields": ["rating", "name"]})) == key
+    assert request_key(event(filter_type="around", city_code="VLC")) == key
+    # Same ~10m cell with 4 decimals
+    assert request_key(event(filter_data={"location": {"lat": 39.46991, "lng": -0.37629}})) == key
+
+
+def test_different_requests_get_different_keys():
+    key = request_key(event())
+    assert request_key(event(filter_data={"natural_query": "best sushi near the beach"})) != key
+    assert request_key(event(filter_data={"filters": {"price": [3]}})) != key
+    assert request_key(event(filter_data={"radius": 1000})) != key
+    assert request_key(event(city_code="mad")) != key
+    assert request_key(event(filter_data={"location": {"lat": 39.4709, "lng": -0.376288}})) != key
+
+
+def test_location_decimals_set_the_cell_size():
+    near = event(filter_data={"location": {"lat": 39.4701, "lng": -0.3763}})
+    assert request_key(near, 2) == request_key(event(), 2)
+    assert request_key(near, 4) != request_key(event(), 4)
+
+
+def test_the_deadline_is_not_part_of_the_key():
+    assert request_key(event(deadline_ms=800)) == request_key(event())
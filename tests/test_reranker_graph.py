@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("langchain_core")
+pytest.importorskip("langgraph")
+
+from langchain_core.runnables import RunnableLambda
+
+from src.app.services.reranker_chain import RerankingGraph
+from src.app.utils.common.resilience import LLM, CircuitBreaker, configure_resilience, get_breaker, resilient_acall
+
+
+class ScriptedGraph(RerankingGraph):
+    """Scores each business by its position; `failures` scripts the errors of the chunks, by first business."""
+
+    def __init__(self, failures=None, **kwargs):
+        super().__init__(scoring_prompt=None, llm=None, opik_tracer=None, **kwargs)
+        self.failures = failures or {}
+        self.calls = {}
+
+    def chunk_chain(self, chunk):
+        def _score(inputs):
+            first = chunk[0].split()[0]
+            self.calls[first] = self.calls.get(first, 0) + 1
+            errors = self.failures.get(first) or []
+            if self.calls[first] <= len(errors):
+                raise errors[self.calls[first] - 1]
+            return {"scores": {text.split()[0]: 100 - int(text.split()[0][3:]) for text in chunk}}
+
+        async def _ascore(inputs):
+            return _score(inputs)
+
+        return RunnableLambda(_score, afunc=_ascore)
+
+    def run(self, business):
+        return asyncio.run(self.graph.ainvoke({"input": "paella", "business": business}))
+
+
+def businesses(count, words=10):
+    return [f"biz{i} " + "word " * words for i in range(count)]
+
+
+@pytest.fixture(autouse=True)
+def no_retry_delay():
+    configure_resilience({"LLM": {"BASE_DELAY_S": 0, "MAX_DELAY_S": 0}})
+    yield
+    configure_resilience(None)
+
+
+def test_split_closes_a_chunk_at_the_size_or_the_token_budget():
+    graph = ScriptedGraph(chunk_tokens=10_000, max_chunk_size=3)
+    assert [len(chunk) for chunk in graph.split(businesses(7))] == [3, 3, 1]
+
+    graph = ScriptedGraph(chunk_tokens=30, max_chunk_size=8)
+    oversized = ["biz99 " + "word " * 200]
+    chunks = graph.split(businesses(2) + oversized + businesses(1))
+    assert oversized in chunks
+    assert sum(len(chunk) for chunk in chunks) == 4
+
+
+def test_merge_sorts_every_chunk_by_score():
+    result = ScriptedGraph(max_chunk_size=2).run(businesses(5))
+    assert [item["business_id"] for item in result["sorted_businesses"]] == [f"biz{i}" for i in range(5)]
+    assert result["errors"] == {}
+
+
+def test_only_the_failed_chunks_are_scored_again():
+    graph = ScriptedGraph(max_chunk_size=2, max_attempts=2, failures={"biz2": [TimeoutError("slow")]})
+    result = graph.run(businesses(6))
+
+    assert len(result["sorted_businesses"]) == 6
+    assert graph.calls["biz2"] == 2
+    assert graph.calls["biz0"] == graph.calls["biz4"] == 1
+
+
+def test_a_chunk_failing_every_attempt_is_left_out():
+    graph = ScriptedGraph(max_chunk_size=2, max_attempts=2,
+                          failures={"biz2": [TimeoutError("slow"), TimeoutError("slow")]})
+    result = graph.run(businesses(6))
+
+    assert {item["business_id"] for item in result["sorted_businesses"]} == {"biz0", "biz1", "biz4", "biz5"}
+    assert list(graph.failed_chunks(result)) == [1]
+
+
+def test_errors_that_are_not_transient_are_not_retried():
+    graph = ScriptedGraph(max_chunk_size=2, max_attempts=3, failures={"biz0": [KeyError("schema")]})
+    result = graph.run(businesses(4))
+
+    assert graph.calls["biz0"] == 1
+    assert list(graph.failed_chunks(result)) == [0]
+
+
+def test_every_chunk_failing_raises_the_chunk_error():
+    graph = ScriptedGraph(max_chunk_size=2, max_attempts=1, failures={"biz0": [TimeoutError("slow")]})
+    with pytest.raises(TimeoutError) as raised:
+        graph.run(businesses(2))
+    assert isinstance(raised.value.__cause__, RuntimeError)
+    assert "Every rerank chunk failed" in str(raised.value.__cause__)
+
+
+def test_reranks_failing_every_chunk_open_the_llm_breaker():
+    configure_resilience({"LLM": {"FAILURE_THRESHOLD": 3, "BASE_DELAY_S": 0, "MAX_DELAY_S": 0}})
+    graph = ScriptedGraph(max_chunk_size=2, max_attempts=1, failures={"biz0": [TimeoutError("slow")] * 3})
+
+    async def rerank():
+        return await graph.graph.ainvoke({"input": "paella", "business": businesses(2)})
+
+    for _ in range(3):
+        with pytest.raises(TimeoutError):
+            asyncio.run(resilient_acall(LLM, rerank, max_attempts=1))
+    assert get_breaker(LLM).state == CircuitBreaker.OPEN
+
+
+def test_stream_scores_retries_failed_chunks():
+    graph = ScriptedGraph(max_chunk_size=2, max_attempts=2, failures={"biz0": [ValueError("unparsable")]})
+    streamed = dict(graph.stream_scores(businesses(4), "paella"))
+    assert set(streamed) == {0, 1}
+    assert not any(isinstance(scores, Exception) for scores in streamed.values())
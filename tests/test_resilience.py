@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+
+from src.app.utils.common.resilience import (
+    CircuitBreaker, CircuitOpenError, RetryPolicy, acall_with_retry, call_with_retry, is_retryable,
+)
+
+
+class Flaky:
+    def __init__(self, errors) -> None:
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+
+NO_DELAY = RetryPolicy(max_attempts=3, base_delay_s=0, max_delay_s=0)
+
+
+def test_is_retryable():
+    assert is_retryable(TimeoutError())
+    assert is_retryable(type("RateLimitError", (Exception,), {})())
+    assert not is_retryable(ValueError())
+    assert not is_retryable(CircuitOpenError())
+
+
+def test_transient_errors_are_retried():
+    fn = Flaky([TimeoutError(), ConnectionError()])
+    assert call_with_retry(fn, policy=NO_DELAY) == "ok"
+    assert fn.calls == 3
+
+
+def test_other_errors_fail_at_once_without_tripping_the_breaker():
+    breaker = CircuitBreaker("test", failure_threshold=1)
+    fn = Flaky([ValueError("bad request")])
+    with pytest.raises(ValueError):
+        call_with_retry(fn, policy=NO_DELAY, breaker=breaker)
+    assert fn.calls == 1
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_the_breaker_opens_and_fails_fast():
+    breaker = CircuitBreaker("test", failure_threshold=2, recovery_timeout_s=60)
+    with pytest.raises(TimeoutError):
+        call_with_retry(Flaky([TimeoutError()] * 3), policy=NO_DELAY, breaker=breaker)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    fn = Flaky([])
+    with pytest.raises(CircuitOpenError):
+        call_with_retry(fn, policy=NO_DELAY, breaker=breaker)
+    assert fn.calls == 0
+
+
+def test_async_retries_share_the_same_rules():
+    fn = Flaky([TimeoutError()])
+
+    async def call():
+        return fn()
+
+    breaker = CircuitBreaker("test")
+    assert asyncio.run(acall_with_retry(call, policy=NO_DELAY, breaker=breaker)) == "ok"
+    assert fn.calls == 2
+    assert breaker.failures == 0
@@ -0,0 +1,78 @@
+import time
+
+from src.app.services.response_cache import ResponseCache
+
+
+def response(tag: str) -> dict:
+    # Same size whatever the tag, so the budgets below are counted in entries
+    return {"statusCode": 200, "recommended_result": [{"id": tag.ljust(8), "text": "x" * 200}], "rest_result": [],
+            "degraded": []}
+
+
+def entry_bytes(**kwargs) -> int:
+    cache = ResponseCache(compression_level=0, **kwargs)
+    cache.put("probe", "es/vlc", response("a"))
+    return cache.size_bytes
+
+
+def test_evicts_the_least_recently_used_entry():
+    size = entry_bytes()
+    cache = ResponseCache(max_bytes=3 * size, compression_level=0)
+    for key in "abc":
+        cache.put(key, "es/vlc", response(key))
+    assert cache.get("a") is not None  # "b" is now the least recently used
+    cache.put("d", "es/vlc", response("d"))
+
+    assert cache.get("b") is None
+    assert [cache.get(key) is not None for key in "acd"] == [True, True, True]
+    assert cache.metrics()["evictions"] == 1
+
+
+def test_degraded_and_expired_responses_are_not_served():
+    cache = ResponseCache(ttl_s=0.05)
+    assert not cache.put("degraded", "es/vlc", {**response("a"), "degraded": ["rerank_skipped"]})
+    assert cache.put("fresh", "es/vlc", response("a"))
+    assert cache.get("fresh") == response("a")
+    time.sleep(0.06)
+    assert cache.get("fresh") is None
+    assert cache.metrics()["entries"] == 0
+
+
+def test_a_newer_daterange_invalidates_the_city():
+    cache = ResponseCache()
+    cache.put("vlc", "es/vlc", response("vlc"))
+    cache.put("mad", "es/mad", response("mad"))
+    cache.observe_daterange("es/vlc", "20240101_20240601")
+    cache.observe_daterange("es/vlc", "20240101_20240601")
+    assert cache.get("vlc") is not None
+
+    cache.observe_daterange("es/vlc", "20240101_20240701")
+    assert cache.get("vlc") is None
+    assert cache.get("mad") is not None
+
+
+def test_a_city_over_its_quota_only_evicts_its_own_entries():
+    size = entry_bytes()
+    cache = ResponseCache(max_bytes=10 * size, compression_level=0, city_max_bytes={"es/mad": 2 * size})
+    cache.put("vlc", "es/vlc", response("vlc"))
+    for key in ("mad1", "mad2", "mad3"):
+        cache.put(key, "es/mad", response(key))
+
+    assert cache.get("vlc") is not None
+    assert cache.get("mad1") is None
+    assert cache.metrics()["cities"]["es/mad"]["entries"] == 2
+
+
+def test_a_full_cache_evicts_the_city_most_over_its_quota_first():
+    size = entry_bytes()
+    cache = ResponseCache(max_bytes=4 * size, compression_level=0,
+                          city_max_bytes={"es/vlc": 4 * size, "es/mad": 2 * size})
+    cache.put("mad1", "es/mad", response("mad1"))
+    cache.put("mad2", "es/mad", response("mad2"))
+    cache.put("vlc1", "es/vlc", response("vlc1"))
+    cache.put("vlc2", "es/vlc", response("vlc2"))
+    # Full: es/mad uses all of its quota, es/vlc 3/4 of its own after this one
+    cache.put("vlc3", "es/vlc", response("vlc3"))
+
+    assert cache.get("mad1") is None
+    assert all(cache.get(key) is not None for key in ("mad2", "vlc1", "vlc2", "vlc3"))
@@ -0,0 +1,62 @@
+import json
+
+import pytest
+
+from src.app.utils.common import secrets_provider
+from src.app.utils.common.secrets_provider import (
+    EnvSecretsBackend, LocalFileSecretsBackend, SecretsProvider, get_secrets_provider,
+)
+
+
+class CountingBackend(EnvSecretsBackend):
+    def __init__(self) -> None:
+        super().__init__()
+        self.fetches = 0
+
+    def fetch(self, secret_name):
+        self.fetches += 1
+        return {"api_key": f"key of {secret_name}"}
+
+
+@pytest.fixture(autouse=True)
+def fresh_default_provider(monkeypatch):
+    monkeypatch.setattr(secrets_provider, "_default_provider", None)
+    monkeypatch.setattr(secrets_provider, "_default_settings", None)
+    for name in ("SECRETS_BACKEND", "SECRETS_DIR", "SECRETS_TTL_SECONDS"):
+        monkeypatch.delenv(name, raising=False)
+
+
+def test_secrets_are_fetched_once_per_ttl():
+    backend = CountingBackend()
+    provider = SecretsProvider(backend, ttl_seconds=60)
+    assert provider.get_secret("a") == provider.get_secret("a") == {"api_key": "key of a"}
+    assert backend.fetches == 1
+
+    provider.invalidate("a")
+    provider.get_secret("a")
+    assert backend.fetches == 2
+
+
+def test_file_backend_reads_json_and_plain_secrets(tmp_path):
+    (tmp_path / "json-secret.json").write_text(json.dumps({"api_key": "abc", "user": "me"}))
+    (tmp_path / "plain-secret").write_text("xyz\n")
+    backend = LocalFileSecretsBackend(str(tmp_path))
+    assert backend.fetch("json-secret") == {"api_key": "abc", "user": "me"}
+    assert backend.fetch("plain-secret") == {"api_key": "xyz"}
+    with pytest.raises(KeyError):
+        backend.fetch("missing")
+
+
+def test_the_provider_built_at_import_is_rebuilt_with_the_config(monkeypatch, tmp_path):
+    monkeypatch.setenv("SECRETS_BACKEND", "env")
+    from_env = get_secrets_provider()
+    assert isinstance(from_env.backend, EnvSecretsBackend)
+    # A config without secrets keys resolves to the same settings
+    assert get_secrets_provider({"AWS_REGION": None}) is from_env
+
+    configured = get_secrets_provider({"SECRETS_BACKEND": "file", "SECRETS_DIR": str(tmp_path), "SECRETS_TTL_SECONDS": 5})
+    assert isinstance(configured.backend, LocalFileSecretsBackend)
+    assert configured.backend.directory == str(tmp_path)
+    assert configured.ttl_seconds == 5
+    # Later callers without config share the configured provider
+    assert get_secrets_provider() is configured
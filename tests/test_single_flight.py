@@ -0,0 +1,85 @@
+import time
+import threading
+
+import pytest
+
+from src.app.utils.common.deadline import Deadline, DeadlineExceeded, use_deadline
+from src.app.utils.common.single_flight import SingleFlight
+
+
+def test_concurrent_calls_with_the_same_key_run_once():
+    flight = SingleFlight("test")
+    started, release = threading.Event(), threading.Event()
+    calls, results = [], []
+
+    def slow(value):
+        calls.append(value)
+        started.set()
+        release.wait(5)
+        return {"value": value}
+
+    leader = threading.Thread(target=lambda: results.append(flight.do("k", slow, 1)))
+    leader.start()
+    started.wait(5)
+    waiters = [threading.Thread(target=lambda: results.append(flight.do("k", slow, 2))) for _ in range(3)]
+    for thread in waiters:
+        thread.start()
+    while flight.metrics()["coalesced"] < 3:
+        time.sleep(0.001)
+    release.set()
+    for thread in [leader, *waiters]:
+        thread.join(5)
+
+    assert calls == [1]
+    assert sorted(shared for _, shared in results) == [False, True, True, True]
+    assert all(result == {"value": 1} for result, _ in results)
+
+
+def test_the_error_of_the_leader_reaches_the_waiters():
+    flight = SingleFlight("test")
+    started, release = threading.Event(), threading.Event()
+    errors = []
+
+    def failing():
+        started.set()
+        release.wait(5)
+        raise RuntimeError("boom")
+
+    def call():
+        try:
+            flight.do("k", failing)
+        except RuntimeError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call)]
+    threads[0].start()
+    started.wait(5)
+    threads.append(threading.Thread(target=call))
+    threads[1].start()
+    while flight.metrics()["coalesced"] < 1:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(errors) == 2 and errors[0] is errors[1]
+    assert flight.metrics()["in_flight"] == 0
+
+
+def test_a_waiter_gives_up_at_its_deadline():
+    flight = SingleFlight("test")
+    started, release = threading.Event(), threading.Event()
+    leader = threading.Thread(target=flight.do, args=("k", lambda: (started.set(), release.wait(5))))
+    leader.start()
+    started.wait(5)
+    with use_deadline(Deadline(50)):
+        with pytest.raises(DeadlineExceeded):
+            flight.do("k", lambda: None)
+    release.set()
+    leader.join(5)
+
+
+def test_budget_bucket():
+    assert Deadline().budget_bucket() is None
+    assert Deadline(2500).budget_bucket(1000) == 2
+    assert Deadline(2500).budget_bucket(500) in (4, 5)
@@ -0,0 +1,134 @@
+import io
+import json
+import zlib
+
+import pytest
+
+from src.app.services import summary_shards
+from src.app.services.summary_shards import LocalSummaryShard, RangeSummaryShard
+
+
+def build_shard(gaps):
+    """Shard of one record per `gaps` entry, each one after that many filler bytes."""
+    blob, records = b"", {}
+    for i, gap in enumerate(gaps):
+        blob += b"\0" * gap
+        record = zlib.compress(json.dumps({"business_id": f"biz{i}", "summary": f"Summary {i}"}).encode("utf-8"))
+        records[f"biz{i}"] = [len(blob), len(record), "20240101_20240601"]
+        blob += record
+    return blob, {"version": "v1", "records": records}
+
+
+class RangeS3:
+    """`get_object` of one object, recording the byte ranges asked for."""
+
+    def __init__(self, blob: bytes) -> None:
+        self.blob = blob
+        self.ranges = []
+
+    def get_object(self, Bucket, Key, Range):
+        start, end = (int(value) for value in Range[len("bytes="):].split("-"))
+        self.ranges.append((start, end))
+        return {"Body": io.BytesIO(self.blob[start:end + 1])}
+
+
+@pytest.fixture
+def small_gap(monkeypatch):
+    monkeypatch.setattr(summary_shards, "RANGE_GAP_BYTES", 100)
+
+
+def test_close_records_share_a_range_request(small_gap):
+    blob, index = build_shard([0, 10, 0, 500, 20])
+    s3 = RangeS3(blob)
+    shard = RangeSummaryShard(index, s3, "bucket", "summaries.bin")
+
+    summaries = shard.get_many([(f"biz{i}", None) for i in (4, 0, 2, 1, 3)])
+
+    assert {business_id: summary["summary"] for business_id, summary in summaries.items()} == {
+        f"biz{i}": f"Summary {i}" for i in range(5)
+    }
+    # biz0-biz2 in one request, biz3-biz4 (after the 500 bytes gap) in another
+    assert len(s3.ranges) == 2
+    assert s3.ranges[0][0] == index["records"]["biz0"][0]
+    assert s3.ranges[1][0] == index["records"]["biz3"][0]
+
+
+def test_far_records_get_their_own_request(small_gap):
+    blob, index = build_shard([0, 200, 200])
+    s3 = RangeS3(blob)
+    RangeSummaryShard(index, s3, "bucket", "summaries.bin").get_many([("biz0", None), ("biz2", None)])
+    assert len(s3.ranges) == 2
+
+
+def test_missing_and_outdated_records_are_left_out(small_gap):
+    blob, index = build_shard([0, 0])
+    s3 = RangeS3(blob)
+    shard = RangeSummaryShard(index, s3, "bucket", "summaries.bin")
+
+    summaries = shard.get_many([("biz0", "20240101_20240601"), ("biz1", "20240101_20240701"), ("unknown", None)])
+
+    assert list(summaries) == ["biz0"]
+    assert shard.get_many([("unknown", None)]) == {}
+
+
+def test_local_shard_reads_the_same_records(tmp_path):
+    blob, index = build_shard([0, 30, 0])
+    (tmp_path / summary_shards.SHARD).write_bytes(blob)
+    (tmp_path / summary_shards.INDEX).write_text(json.dumps(index))
+
+    local = LocalSummaryShard(str(tmp_path)).get_many([("biz2", None), ("biz0", None)])
+    remote = RangeSummaryShard(index, RangeS3(blob), "bucket", "summaries.bin").get_many([("biz2", None), ("biz0", None)])
+    assert local == remote
+
+
+def test_the_read_of_a_shard_is_abstract():
+    with pytest.raises(TypeError):
+        summary_shards.SummaryShard({"version": "v1", "records": {}})
+
+
+class ShardS3:
+    """Published shards of each city, `versions` holds the latest version of a city."""
+
+    def __init__(self, blob: bytes, index) -> None:
+        self.blob, self.index = blob, index
+        self.versions = {}
+
+    def get_object(self, Bucket, Key):
+        city = tuple(Key.split("/")[-3:-1])
+        return {"Body": io.BytesIO(json.dumps({"version": self.versions[city]}).encode("utf-8"))}
+
+    def download_file(self, Bucket, Key, Filename):
+        version = Key.split("/")[-2]
+        with open(Filename, "wb") as file:
+            file.write(self.blob if Key.endswith(summary_shards.SHARD) else json.dumps({**self.index, "version": version}).encode("utf-8"))
+
+
+def shard_store(tmp_path, max_cities=0):
+    blob, index = build_shard([0, 0])
+    store = summary_shards.SummaryShardStore("bucket", local_dir=str(tmp_path), pointer_ttl_s=0, max_cities=max_cities)
+    store._s3 = ShardS3(blob, index)
+    return store
+
+
+def test_a_replaced_shard_is_deleted_from_disk(tmp_path):
+    store = shard_store(tmp_path)
+    store._s3.versions[("es", "vlc")] = "v1"
+    old = store.get("es", "vlc")
+    store._s3.versions[("es", "vlc")] = "v2"
+    new = store.get("es", "vlc")
+
+    assert new.version == "v2"
+    assert sorted(path.name for path in (tmp_path / "es" / "vlc").iterdir()) == ["v2"]
+    # A reader still holding the replaced shard keeps reading its mapped copy
+    assert old.get_many([("biz0", None)])["biz0"]["summary"] == "Summary 0"
+
+
+def test_an_unloaded_shard_is_deleted_from_disk(tmp_path):
+    store = shard_store(tmp_path, max_cities=1)
+    store._s3.versions.update({("es", "vlc"): "v1", ("es", "mad"): "v1"})
+    store.get("es", "vlc")
+    store.get("es", "mad")
+
+    assert store.cities() == [("es", "mad")]
+    assert not (tmp_path / "es" / "vlc" / "v1").exists()
+    assert (tmp_path / "es" / "mad" / "v1").exists()